@@ -0,0 +1,48 @@
+"""
+Cursor pagination for the public API.
+Pages are keyset ranges on (sort value, id) built with files.pagination, so an
+integration walking 200k rows reads each page with one index range scan and
+the server never holds more than a page. Responses are
+{"results": [...], "has_more": bool, "next_cursor": str | null}.
+"""
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from files.file_rows import cursor_row
+from files.pagination import InvalidCursor, apply_keyset, encode_cursor
+
+def _config():
+    return getattr(settings, 'PUBLIC_API', {})
+
+class KeysetPagination(BasePagination):
+    """?limit=, ?sort_by= (view.sort_fields, with - for descending) and ?cursor="""
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', _config().get('PAGE_SIZE', 100)))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer'})
+        return max(1, min(limit, _config().get('MAX_PAGE_SIZE', 1000)))
+
+    def get_sort(self, request, view):
+        sort_by = request.query_params.get('sort_by', view.default_sort)
+        return sort_by if sort_by.lstrip('-') in view.sort_fields else view.default_sort
+
+    def paginate_queryset(self, queryset, request, view=None):
+        limit, sort_by = self.get_limit(request), self.get_sort(request, view)
+        try:
+            queryset = apply_keyset(queryset, sort_by, request.query_params.get('cursor'))
+        except InvalidCursor as e:
+            raise ValidationError({'cursor': str(e)})
+
+        rows = list(queryset[:limit + 1])  # One extra to check if there are more
+        self.next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            self.next_cursor = encode_cursor(cursor_row(last) if isinstance(last, dict) else last, sort_by)
+        return rows[:limit]
+
+    def get_paginated_response(self, data):
+        return Response({'results': data, 'has_more': self.next_cursor is not None, 'next_cursor': self.next_cursor})
@@ -1,3 +1,98 @@
+import json
+import base64
+import uuid
+from datetime import timedelta
 from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from files.models import File, Folder
 
-# Create your tests here.
+User = get_user_model()
+
+class PublicApiListingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='api@example.com', username='api', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.folder = Folder.objects.create(name='Docs', owner=self.user)
+        mime_types = ('image/png', 'application/pdf', 'text/plain')
+        for i in range(7):
+            File.objects.create(
+                name=f'file-{i}', owner=self.user, size_bytes=i, mime_type=mime_types[i % 3],
+                folder=self.folder if i % 2 else None, storage_key=f'uploads/api-{i}'
+            )
+
+    def _walk(self, url):
+        names, cursor = [], None
+        while True:
+            data = self.client.get(url + (f'&cursor={cursor}' if cursor else '')).data
+            names += [row['name'] for row in data['results']]
+            if not data['has_more']:
+                self.assertIsNone(data['next_cursor'])
+                return names
+            cursor = data['next_cursor']
+
+    def test_files_are_paginated_with_cursors(self):
+        self.assertEqual(self._walk('/api/v1/files/?sort_by=name&limit=3'), [f'file-{i}' for i in range(7)])
+        self.assertEqual(self._walk('/api/v1/files/?sort_by=-size_bytes&limit=2'), [f'file-{i}' for i in reversed(range(7))])
+        response = self.client.get('/api/v1/files/?cursor=bogus')
+        self.assertEqual(response.status_code, 400)
+        payload = json.dumps({'s': 'size_bytes', 'v': 'abc', 'i': str(uuid.uuid4())}).encode()
+        forged = base64.urlsafe_b64encode(payload).decode().rstrip('=')
+        response = self.client.get(f'/api/v1/files/?sort_by=size_bytes&cursor={forged}')
+        self.assertEqual(response.status_code, 400)
+
+    def test_filters_and_sparse_fields(self):
+        self.assertEqual(self._walk(f'/api/v1/files/?sort_by=name&folder={self.folder.id}'), ['file-1', 'file-3', 'file-5'])
+        self.assertEqual(self._walk('/api/v1/files/?sort_by=name&folder=root&type=image'), ['file-0', 'file-6'])
+        self.assertEqual(self._walk('/api/v1/files/?sort_by=name&type=document'), ['file-1', 'file-4'])
+
+        File.objects.filter(name='file-2').update(modified_at=timezone.now() + timedelta(hours=1))
+        since = (timezone.now() + timedelta(minutes=30)).isoformat().replace('+00:00', 'Z')
+        self.assertEqual(self._walk(f'/api/v1/files/?sort_by=name&modified_since={since}'), ['file-2'])
+
+        row = self.client.get('/api/v1/files/?fields=name,size_bytes&limit=1').data['results'][0]
+        self.assertEqual(set(row), {'id', 'name', 'size_bytes'})
+        for params in ('fields=bogus', 'type=bogus', 'folder=bogus', 'modified_since=yesterday', 'limit=x'):
+            self.assertEqual(self.client.get(f'/api/v1/files/?{params}').status_code, 400, params)
+
+    def test_page_cost_does_not_grow_with_the_library(self):
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(len(self.client.get('/api/v1/files/?limit=5').data['results']), 5)
+            return len(captured)
+        few = queries()
+        File.objects.bulk_create([
+            File(name=f'more-{i}', owner=self.user, size_bytes=1, mime_type='text/plain', storage_key=f'uploads/more-{i}')
+            for i in range(50)
+        ])
+        self.assertEqual(queries(), few)
+
+    def test_folders_are_paginated_and_filtered(self):
+        for name in ('b', 'a', 'c'):
+            Folder.objects.create(name=name, owner=self.user, parent=self.folder)
+        self.assertEqual(self._walk(f'/api/v1/folders/?parent={self.folder.id}&limit=2'), ['a', 'b', 'c'])
+        self.assertEqual(self._walk('/api/v1/folders/?parent=root'), ['Docs'])
+        row = self.client.get('/api/v1/folders/?fields=name').data['results'][0]
+        self.assertEqual(set(row), {'id', 'name'})
+
+    def test_ndjson_export_streams_every_matching_file(self):
+        File.objects.create(name='other', owner=User.objects.create_user(
+            email='other@example.com', username='other', password='testpass123'
+        ), size_bytes=1, mime_type='text/plain', storage_key='uploads/other')
+        response = self.client.get('/api/v1/files/export/?fields=name,folder')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(sorted(row['name'] for row in rows), [f'file-{i}' for i in range(7)])
+        self.assertEqual(set(rows[0]), {'id', 'name', 'folder'})
+        self.assertEqual([row['id'] for row in rows], sorted(row['id'] for row in rows))
+
+        response = self.client.get(f'/api/v1/files/export/?type=image&folder={uuid.uuid4()}')
+        self.assertEqual(b''.join(response.streaming_content), b'')
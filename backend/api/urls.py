@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path('v1/user/', views.api_user_info, name='api-user-info'),
     path('v1/files/', views.ApiFileListView.as_view(), name='api-files'),
+    path('v1/files/export/', views.api_file_export, name='api-file-export'),
     path('v1/files/<uuid:pk>/', views.ApiFileDetailView.as_view(), name='api-file-detail'),
     path('v1/folders/', views.ApiFolderListView.as_view(), name='api-folders'),
     path('v1/folders/<uuid:pk>/', views.ApiFolderDetailView.as_view(), name='api-folder-detail'),
@@ -1,18 +1,111 @@
+import uuid
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from files.models import File, Folder
 from files.serializers import FileSerializer, FolderSerializer
+from files.listing import file_listing_queryset, parse_file_fields
+from files.file_rows import build_file_rows, fast_path_enabled, file_rows_queryset
+from files.pagination import FILE_SORT_FIELDS
+from files.renderers import dumps
+from files.search import DOCUMENT_MIME_TYPES
 from integrations.middleware import check_api_scope
+from .pagination import KeysetPagination
+
+FOLDER_SORT_FIELDS = ('name', 'created_at', 'updated_at')
+
+def _parent_filter(params, name):
+    """Q-style kwargs for ?<name>=<folder id> or ?<name>=root"""
+    value = params.get(name)
+    if not value:
+        return {}
+    if value == 'root':
+        return {f'{name}__isnull': True}
+    try:
+        return {f'{name}_id': uuid.UUID(value)}
+    except ValueError:
+        raise ValidationError({name: 'Must be a folder id or "root"'})
+
+def _modified_since(params):
+    value = params.get('modified_since')
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValidationError({'modified_since': 'Must be an ISO 8601 datetime'})
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+def filter_files(queryset, params):
+    """Apply ?folder=, ?type= (image, video, document, other) and ?modified_since="""
+    queryset = queryset.filter(**_parent_filter(params, 'folder'))
+    file_type = params.get('type')
+    if file_type in ('image', 'video'):
+        queryset = queryset.filter(mime_type__startswith=f'{file_type}/')
+    elif file_type == 'document':
+        queryset = queryset.filter(mime_type__in=DOCUMENT_MIME_TYPES)
+    elif file_type == 'other':
+        queryset = queryset.exclude(mime_type__startswith='image/').exclude(
+            mime_type__startswith='video/'
+        ).exclude(mime_type__in=DOCUMENT_MIME_TYPES)
+    elif file_type:
+        raise ValidationError({'type': 'Must be one of image, video, document, other'})
+    modified_since = _modified_since(params)
+    if modified_since:
+        queryset = queryset.filter(modified_at__gte=modified_since)
+    return queryset
+
+def _file_fields(params):
+    try:
+        return parse_file_fields(params)
+    except ValueError as e:
+        raise ValidationError({'fields': str(e)})
+
+def _folder_fields(params):
+    requested = [name.strip() for name in params.get('fields', '').split(',') if name.strip()]
+    if not requested:
+        return None
+    unknown = [name for name in requested if name not in FolderSerializer.Meta.fields]
+    if unknown:
+        raise ValidationError({'fields': f"Unknown fields: {', '.join(unknown)}"})
+    return tuple(dict.fromkeys(['id', *requested]))
 
 class ApiFileListView(generics.ListCreateAPIView):
     """Public API endpoint for files"""
     serializer_class = FileSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    sort_fields = FILE_SORT_FIELDS
+    default_sort = '-modified_at'
+    
+    def get_fields(self):
+        """Sparse fieldset requested with ?fields= or ?view=compact (GET only)"""
+        if self.request.method != 'GET':
+            return None
+        return _file_fields(self.request.query_params)
+    
+    def get_files(self):
+        return filter_files(File.objects.filter(owner=self.request.user), self.request.query_params)
     
     def get_queryset(self):
-        return File.objects.filter(owner=self.request.user)
+        return file_listing_queryset(self.get_files(), self.get_fields(), columns=FILE_SORT_FIELDS)
+    
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_fields())
+        return super().get_serializer(*args, **kwargs)
+    
+    def list(self, request, *args, **kwargs):
+        if not fast_path_enabled():
+            return super().list(request, *args, **kwargs)
+        # Rows straight from .values(), see files.file_rows
+        fields = self.get_fields()
+        rows = self.paginate_queryset(file_rows_queryset(self.get_files(), fields, columns=FILE_SORT_FIELDS))
+        return self.get_paginated_response(list(build_file_rows(rows, fields)))
     
     @check_api_scope('files.read')
     def get(self, request, *args, **kwargs):
@@ -50,9 +143,26 @@ class ApiFolderListView(generics.ListCreateAPIView):
     """Public API endpoint for folders"""
     serializer_class = FolderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    sort_fields = FOLDER_SORT_FIELDS
+    default_sort = 'name'
     
     def get_queryset(self):
-        return Folder.objects.filter(owner=self.request.user)
+        """Filtered with ?parent= (folder id or root) and ?modified_since="""
+        folders = Folder.objects.filter(owner=self.request.user)
+        if self.request.method != 'GET':
+            return folders
+        params = self.request.query_params
+        folders = folders.filter(**_parent_filter(params, 'parent'))
+        modified_since = _modified_since(params)
+        if modified_since:
+            folders = folders.filter(updated_at__gte=modified_since)
+        return folders
+    
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET':
+            kwargs.setdefault('fields', _folder_fields(self.request.query_params))
+        return super().get_serializer(*args, **kwargs)
     
     @check_api_scope('files.read')
     def get(self, request, *args, **kwargs):
@@ -96,4 +206,24 @@ def api_user_info(request):
         'email': request.user.email,
         'first_name': request.user.first_name,
         'last_name': request.user.last_name,
-    })
\ No newline at end of file
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@check_api_scope('files.read')
+def api_file_export(request):
+    """
+    Every file matching the list filters as NDJSON (one object per line).
+    Rows are read with a server-side iterator and encoded as they go, so
+    memory stays constant however many files the user has.
+    """
+    fields = _file_fields(request.query_params)
+    files = filter_files(File.objects.filter(owner=request.user), request.query_params)
+    rows = file_rows_queryset(files, fields).order_by('id').iterator(
+        chunk_size=getattr(settings, 'PUBLIC_API', {}).get('EXPORT_CHUNK_SIZE', 2000)
+    )
+    response = StreamingHttpResponse(
+        (dumps(row) + b'\n' for row in build_file_rows(rows, fields)), content_type='application/x-ndjson'
+    )
+    response['Content-Disposition'] = 'attachment; filename="files.ndjson"'
+    return response
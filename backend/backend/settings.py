@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 from decouple import config
+from corsheaders.defaults import default_headers as default_cors_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -28,6 +29,8 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
 ]
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_cors_headers, 'if-none-match')  # Conditional listing requests
+CORS_EXPOSE_HEADERS = ['ETag']
 
 
 # Application definition
@@ -145,7 +148,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'files.renderers.FastJSONRenderer',  # orjson when installed, stdlib json otherwise
     ],
 }
 
@@ -187,3 +190,124 @@ if CLOUDINARY_STORAGE['CLOUD_NAME']:
     USE_CLOUDINARY = True
 else:
     USE_CLOUDINARY = False
+
+# S3-compatible Object Storage Configuration (AWS S3, MinIO, ...)
+S3_STORAGE = {
+    'BUCKET_NAME': config('S3_BUCKET_NAME', default=''),
+    'ENDPOINT_URL': config('S3_ENDPOINT_URL', default=''),  # e.g. http://localhost:9000 for MinIO
+    'REGION_NAME': config('S3_REGION_NAME', default='us-east-1'),
+    'ACCESS_KEY_ID': config('S3_ACCESS_KEY_ID', default=''),
+    'SECRET_ACCESS_KEY': config('S3_SECRET_ACCESS_KEY', default=''),
+    'PRESIGNED_URL_EXPIRY': config('S3_PRESIGNED_URL_EXPIRY', default=3600, cast=int),
+}
+USE_S3 = bool(S3_STORAGE['BUCKET_NAME'])
+
+# Pack-file Storage for Small Files
+PACK_STORAGE = {
+    'ROOT': MEDIA_ROOT / 'packs',
+    'THRESHOLD': config('PACK_FILE_THRESHOLD', default=64 * 1024, cast=int),  # Files up to 64KB are packed
+    'SEGMENT_MAX_BYTES': config('PACK_SEGMENT_MAX_BYTES', default=64 * 1024 * 1024, cast=int),
+    'COMPACTION_RATIO': config('PACK_COMPACTION_RATIO', default=0.5, cast=float),  # Rewrite when half dead
+}
+USE_PACK_STORAGE = config('USE_PACK_STORAGE', default=True, cast=bool)
+
+# Deduplicating Chunk Store (content-defined chunking)
+# Opt-in: uploads are chunked in the request and chunks live under MEDIA_ROOT,
+# which must then be a persistent volume. Large files default to PostgreSQL LOBs.
+CHUNK_STORAGE = {
+    'ROOT': MEDIA_ROOT / 'chunks',
+    'MIN_CHUNK_SIZE': 16 * 1024,
+    'AVG_CHUNK_SIZE': 64 * 1024,
+    'MAX_CHUNK_SIZE': 256 * 1024,
+}
+USE_CHUNK_STORE = config('USE_CHUNK_STORE', default=False, cast=bool)
+
+# Version Retention (applied by the prune_versions command; per-user overrides in VersionRetentionPolicy)
+VERSION_RETENTION = {
+    'MAX_VERSIONS': config('VERSION_RETENTION_MAX_VERSIONS', default=10, cast=int),
+    'MAX_AGE_DAYS': config('VERSION_RETENTION_MAX_AGE_DAYS', default=365, cast=int),
+    'KEEP_DAILY_DAYS': config('VERSION_RETENTION_KEEP_DAILY_DAYS', default=7, cast=int),
+    'KEEP_WEEKLY_WEEKS': config('VERSION_RETENTION_KEEP_WEEKLY_WEEKS', default=8, cast=int),
+}
+
+# Listing Total Counts
+LISTING_COUNTS = {
+    'CACHE_TIMEOUT': config('LISTING_COUNT_CACHE_TIMEOUT', default=300, cast=int),  # Seconds a filtered count is reused
+    'ESTIMATE_THRESHOLD': config('LISTING_COUNT_ESTIMATE_THRESHOLD', default=10000, cast=int),  # Planner estimates above this are served as-is
+}
+
+# Bulk Folder Deletion
+BULK_DELETE = {
+    'BATCH_SIZE': config('BULK_DELETE_BATCH_SIZE', default=500, cast=int),  # File rows deleted per transaction
+    'ASYNC_THRESHOLD': config('BULK_DELETE_ASYNC_THRESHOLD', default=1000, cast=int),  # Larger subtrees run as a background job
+    'RESUME_AFTER_MINUTES': config('BULK_DELETE_RESUME_AFTER_MINUTES', default=10, cast=int),  # Jobs idle this long are resumed
+}
+
+# Cache (cache generations, listing counts, response cache and metrics live here).
+# locmem is per process; use 'file' or 'redis' so all workers share one cache.
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')  # locmem, file or redis
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        # Cache name (locmem), directory (file) or redis:// URL (redis)
+        'LOCATION': config('CACHE_LOCATION', default='filora'),
+        'TIMEOUT': config('CACHE_DEFAULT_TIMEOUT', default=300, cast=int),
+    }
+}
+
+# Response Cache for read endpoints (invalidated through per-user cache generations;
+# only with a shared CACHE_BACKEND, since a per-process cache misses other workers' bumps)
+RESPONSE_CACHE = {
+    'ENABLED': config('RESPONSE_CACHE_ENABLED', default=CACHE_BACKEND != 'locmem', cast=bool),
+    'TIMEOUT': config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int),  # Keep below S3_PRESIGNED_URL_EXPIRY
+}
+
+# Change Journal for delta sync (GET /api/changes/?since=<cursor>)
+CHANGE_JOURNAL = {
+    'PAGE_SIZE': config('CHANGE_JOURNAL_PAGE_SIZE', default=500, cast=int),  # Entries read per page before compaction
+    'RETENTION_DAYS': config('CHANGE_JOURNAL_RETENTION_DAYS', default=30, cast=int),  # Older cursors must resync
+}
+
+# Batch File Operations (POST /api/files/batch/)
+BATCH_OPERATIONS = {
+    'MAX_OPERATIONS': config('BATCH_MAX_OPERATIONS', default=500, cast=int),  # Operations accepted per request
+}
+
+# File Listings: rows built from .values() instead of FileSerializer, large pages streamed
+FILE_LISTING = {
+    'FAST_PATH': config('FILE_LISTING_FAST_PATH', default=True, cast=bool),
+    'STREAM_THRESHOLD': config('FILE_LISTING_STREAM_THRESHOLD', default=500, cast=int),  # Page size (limit) streamed as chunked JSON
+    'MAX_PAGE_SIZE': config('FILE_LISTING_MAX_PAGE_SIZE', default=1000, cast=int),  # Larger ?limit= values are clamped
+}
+
+# Access Control: cached effective permissions (invalidated per owner on share, invite and move changes; only with a shared CACHE_BACKEND)
+ACCESS_CACHE = {
+    'TIMEOUT': config('ACCESS_CACHE_TIMEOUT', default=600, cast=int),
+}
+
+# Public API v1: keyset-paginated listings and NDJSON export (GET /api/v1/files/export/)
+PUBLIC_API = {
+    'PAGE_SIZE': config('PUBLIC_API_PAGE_SIZE', default=100, cast=int),
+    'MAX_PAGE_SIZE': config('PUBLIC_API_MAX_PAGE_SIZE', default=1000, cast=int),
+    'EXPORT_CHUNK_SIZE': config('PUBLIC_API_EXPORT_CHUNK_SIZE', default=2000, cast=int),  # Rows fetched per database round trip
+}
+
+# Audit Log: activity entries are queued in-process and bulk-written off the request path
+AUDIT_LOG = {
+    'BUFFERED': config('AUDIT_LOG_BUFFERED', default=True, cast=bool),  # False writes each entry on commit
+    'MAX_BUFFER': config('AUDIT_LOG_MAX_BUFFER', default=500, cast=int),  # Queued entries that trigger a flush
+    'FLUSH_INTERVAL': config('AUDIT_LOG_FLUSH_INTERVAL', default=2.0, cast=float),  # Seconds between flushes
+    'SPOOL_PATH': config('AUDIT_LOG_SPOOL_PATH', default=str(BASE_DIR / 'audit_spool.jsonl')),  # Unwritten entries, replayed later
+}
+
+# Activity Retention: months past the window are archived to gzipped NDJSON and deleted (archive_activity command)
+ACTIVITY_RETENTION = {
+    'RETENTION_DAYS': config('ACTIVITY_RETENTION_DAYS', default=365, cast=int),
+    'ARCHIVE_DIR': config('ACTIVITY_ARCHIVE_DIR', default=''),  # Required: a durable volume, archiving refuses to run without it
+    'BATCH_SIZE': config('ACTIVITY_ARCHIVE_BATCH_SIZE', default=5000, cast=int),  # Rows exported and deleted per chunk
+}
@@ -0,0 +1,148 @@
+"""
+Reading, retention and archival of the activity log.
+Activity rows carry their UTC month (YYYYMM) as a bucket column, the portable
+equivalent of monthly partitions: listings restrict the month range to the
+requested time range before the timestamp range, and retention works a whole
+month at a time. Months past RETENTION_DAYS are exported to gzipped NDJSON
+(one file per table and month) and deleted in id-ordered chunks; each chunk is
+appended to the archive as its own gzip member before it is deleted, so an
+interrupted run may repeat a chunk in the archive but never loses one. The
+legacy FileActivity table is archived the same way by its created_at month.
+Archived rows exist nowhere else, so ARCHIVE_DIR has no default: it must be
+set explicitly to durable storage (not the ephemeral app directory).
+"""
+
+import gzip
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from .models import Activity, FileActivity
+from .pagination import apply_keyset, decode_cursor, encode_cursor
+from .renderers import dumps
+import logging
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_SORT = '-timestamp'
+
+def _config():
+    return getattr(settings, 'ACTIVITY_RETENTION', {})
+
+def month_bounds(month):
+    """[start, end) of a YYYYMM month in UTC"""
+    year, number = divmod(month, 100)
+    start = datetime(year, number, 1, tzinfo=dt_timezone.utc)
+    end = datetime(year + number // 12, number % 12 + 1, 1, tzinfo=dt_timezone.utc)
+    return start, end
+
+def activity_in_range(queryset, since=None, until=None):
+    """Entries logged in [since, until), restricted to the months that range covers"""
+    if since:
+        queryset = queryset.filter(month__gte=Activity.month_of(since), timestamp__gte=since)
+    if until:
+        queryset = queryset.filter(month__lte=Activity.month_of(until), timestamp__lt=until)
+    return queryset
+
+def activity_page(queryset, cursor=None, since=None, until=None, limit=50):
+    """
+    (entries, next cursor) of a newest-first keyset page. The cursor bounds the
+    month range too, so deep pages skip the months already read. Raises
+    pagination.InvalidCursor.
+    """
+    if cursor:
+        last_timestamp, _ = decode_cursor(cursor, ACTIVITY_SORT)
+        queryset = queryset.filter(month__lte=Activity.month_of(last_timestamp))
+    queryset = apply_keyset(activity_in_range(queryset, since, until), ACTIVITY_SORT, cursor)
+    entries = list(queryset.select_related('user')[:limit + 1])  # One extra to check if there are more
+    next_cursor = encode_cursor(entries[limit - 1], ACTIVITY_SORT) if len(entries) > limit else None
+    return entries[:limit], next_cursor
+
+class _Table:
+    """How one activity table is bucketed by month"""
+
+    def __init__(self, name, model, time_field):
+        self.name, self.model, self.time_field = name, model, time_field
+
+    def months_before(self, cutoff):
+        if self.model is Activity:
+            return list(Activity.objects.filter(month__lt=cutoff).order_by('month').values_list('month', flat=True).distinct())
+        start, _ = month_bounds(cutoff)
+        dates = self.model.objects.filter(**{f'{self.time_field}__lt': start}).datetimes(
+            self.time_field, 'month', tzinfo=dt_timezone.utc
+        )
+        return [d.year * 100 + d.month for d in dates]
+
+    def rows(self, month):
+        if self.model is Activity:
+            return Activity.objects.filter(month=month)
+        start, end = month_bounds(month)
+        return self.model.objects.filter(**{f'{self.time_field}__gte': start, f'{self.time_field}__lt': end})
+
+TABLES = (
+    _Table('activity', Activity, 'timestamp'),
+    _Table('file_activity', FileActivity, 'created_at'),
+)
+
+class ActivityArchiver:
+    """Manager class for archiving and deleting activity past the retention window"""
+
+    def cutoff_month(self, now=None):
+        """First month that is kept; everything before it is expired"""
+        now = now or timezone.now()
+        return Activity.month_of(now - timedelta(days=_config().get('RETENTION_DAYS', 365)))
+
+    def expired(self, now=None):
+        """[(table name, month, rows)] awaiting archival"""
+        cutoff = self.cutoff_month(now)
+        return [
+            (table.name, month, table.rows(month).count())
+            for table in TABLES for month in table.months_before(cutoff)
+        ]
+
+    def archive_dir(self):
+        archive_dir = _config().get('ARCHIVE_DIR')
+        if not archive_dir:
+            raise ImproperlyConfigured('ACTIVITY_RETENTION ARCHIVE_DIR must name a durable directory before activity is archived')
+        return archive_dir
+
+    def archive_path(self, table_name, month):
+        year, number = divmod(month, 100)
+        return os.path.join(self.archive_dir(), table_name, f'{year}-{number:02d}.ndjson.gz')
+
+    def archive_month(self, table, month, batch_size=None):
+        """Move one month of a table to its archive file; returns the rows moved"""
+        batch_size = batch_size or _config().get('BATCH_SIZE', 5000)
+        path = self.archive_path(table.name, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fields = [f.attname for f in table.model._meta.concrete_fields]
+        rows = table.rows(month).order_by('id')
+        moved, last_id = 0, None
+        while True:
+            chunk = list((rows.filter(id__gt=last_id) if last_id else rows).values(*fields)[:batch_size])
+            if not chunk:
+                return moved
+            # A gzip member per chunk; readers see the members as one stream
+            with open(path, 'ab') as f:
+                f.write(gzip.compress(b''.join(dumps(row) + b'\n' for row in chunk)))
+                f.flush()
+                os.fsync(f.fileno())
+            last_id = chunk[-1]['id']
+            table.model.objects.filter(id__in=[row['id'] for row in chunk]).delete()
+            moved += len(chunk)
+
+    def run(self, now=None, batch_size=None):
+        """Archive every expired month; returns [(table name, month, rows moved)]"""
+        self.archive_dir()  # Refuse before deleting anything
+        cutoff = self.cutoff_month(now)
+        results = []
+        for table in TABLES:
+            for month in table.months_before(cutoff):
+                moved = self.archive_month(table, month, batch_size)
+                logger.info(f"Archived {moved} {table.name} entries of {month} to {self.archive_path(table.name, month)}")
+                results.append((table.name, month, moved))
+        return results
+
+# Global instance
+activity_archiver = ActivityArchiver()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import File, Folder, Share, Invite, FileVersion, FileActivity, Activity
+from .models import File, Folder, Share, Invite, FileVersion, FileActivity, Activity, VersionRetentionPolicy
 
 @admin.register(Folder)
 class FolderAdmin(admin.ModelAdmin):
@@ -47,6 +47,12 @@ class FileVersionAdmin(admin.ModelAdmin):
     search_fields = ('file__name', 'created_by__email')
     raw_id_fields = ('file', 'created_by')
 
+@admin.register(VersionRetentionPolicy)
+class VersionRetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ('user', 'max_versions', 'max_age_days', 'keep_daily_days', 'keep_weekly_weeks', 'updated_at')
+    search_fields = ('user__email',)
+    raw_id_fields = ('user',)
+
 @admin.register(Activity)
 class ActivityAdmin(admin.ModelAdmin):
     list_display = ('user', 'object_type', 'action', 'timestamp')
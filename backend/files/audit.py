@@ -0,0 +1,184 @@
+"""
+Buffered audit logging.
+Activity is the one audit table: every file, folder and share event goes
+through audit_sink.log(), which queues the entry once the surrounding
+transaction commits (rolled-back work leaves no trail). A background thread
+writes the queue with one bulk_create when it reaches MAX_BUFFER events or
+FLUSH_INTERVAL seconds have passed, so requests issue no audit INSERTs.
+Events still queued at exit are flushed by an atexit hook; events that cannot
+be written are appended to a JSON-lines spool file and replayed by the next
+flush (or `manage.py flush_audit_log`). A flush claims the spool file by
+renaming it and deletes the claim only after its events are written, so a
+failed or interrupted replay leaves the claim to be read again; entries keep
+their ids, so replaying one twice is harmless.
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import uuid
+from functools import partial
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .cache_utils import bump_generation
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _config():
+    return getattr(settings, 'AUDIT_LOG', {})
+
+class AuditSink:
+    """Manager class for queuing activity entries and writing them in bulk"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spool_lock = threading.Lock()
+        self.events = []
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def log(self, user_id, object_type, object_id, action, metadata=None, meta=None):
+        """Record an activity entry; `meta` is request.META for the client address"""
+        event = {
+            'id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'object_type': object_type,
+            'object_id': str(object_id),
+            'action': action,
+            'metadata': metadata or {},
+            'ip_address': meta.get('REMOTE_ADDR') if meta else None,
+            'user_agent': meta.get('HTTP_USER_AGENT', '') if meta else '',
+            'timestamp': timezone.now().isoformat(),
+        }
+        transaction.on_commit(partial(self._enqueue, event))
+
+    def _enqueue(self, event):
+        if not _config().get('BUFFERED', True):
+            self._write([event])
+            return
+        with self.lock:
+            self.events.append(event)
+            full = len(self.events) >= _config().get('MAX_BUFFER', 500)
+        self._ensure_flusher()
+        if full:
+            self.wakeup.set()
+
+    def _ensure_flusher(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name='audit-flusher', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(_config().get('FLUSH_INTERVAL', 2.0))
+            self.wakeup.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                logger.error(f"Audit flusher failed: {e}")
+
+    def pending(self):
+        with self.lock:
+            return len(self.events)
+
+    def flush(self):
+        """Write queued and spooled events; returns the number written"""
+        with self.lock:
+            events, self.events = self.events, []
+        spooled, claims = self._read_spool()
+        # Spooled events stay in their claims until written; only new events are spooled on failure
+        if not self._write(spooled + events, unwritten=events):
+            return 0
+        for claim in claims:
+            try:
+                os.remove(claim)
+            except FileNotFoundError:
+                pass  # Also replayed and removed by a concurrent flush
+        return len(spooled) + len(events)
+
+    def _write(self, events, unwritten=None):
+        """Bulk-write events; on failure spool `unwritten` (default: all of them) and return False"""
+        if not events:
+            return True
+        from .models import Activity
+        try:
+            # Entries of users deleted in the meantime would fail the whole batch
+            user_ids = set(get_user_model().objects.filter(
+                id__in={e['user_id'] for e in events}
+            ).values_list('id', flat=True))
+            with transaction.atomic():
+                activities = [
+                    Activity(
+                        id=e['id'], user_id=e['user_id'], object_type=e['object_type'], object_id=e['object_id'],
+                        action=e['action'], metadata=e['metadata'], ip_address=e['ip_address'],
+                        user_agent=e['user_agent'], timestamp=parse_datetime(e['timestamp'])
+                    )
+                    for e in events if e['user_id'] in user_ids
+                ]
+                for activity in activities:
+                    activity.month = Activity.month_of(activity.timestamp)
+                # Replayed spool entries keep their ids
+                Activity.objects.bulk_create(activities, batch_size=500, ignore_conflicts=True)
+        except Exception as e:
+            unwritten = events if unwritten is None else unwritten
+            logger.error(f"Failed to write {len(events)} audit events, spooling {len(unwritten)} new ones: {e}")
+            self._spool(unwritten)
+            return False
+        for user_id in user_ids:
+            bump_generation(user_id)  # Recent activity is part of cached dashboard responses
+        return True
+
+    def _spool_path(self):
+        return _config().get('SPOOL_PATH')
+
+    def _spool(self, events):
+        if not events:
+            return
+        path = self._spool_path()
+        try:
+            with self.spool_lock, open(path, 'a') as f:
+                f.writelines(json.dumps(e) + '\n' for e in events)
+        except (OSError, TypeError) as e:
+            logger.error(f"Lost {len(events)} audit events, spool {path} is not writable: {e}")
+
+    def _read_spool(self):
+        """
+        Claim the spool file (so writers append to a fresh one) and read it along
+        with claims left by failed flushes; returns (events, claim paths)
+        """
+        path = self._spool_path()
+        if not path:
+            return [], []
+        try:
+            os.replace(path, f'{path}.claimed.{uuid.uuid4().hex}')  # Never over an unwritten claim
+        except FileNotFoundError:
+            pass
+        events, claims = [], []
+        for claim in sorted(glob.glob(f'{glob.escape(path)}.claimed.*')):
+            try:
+                with open(claim) as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                continue  # Written and removed by a concurrent flush
+            claims.append(claim)
+            for line in lines:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Skipping corrupt audit spool line in {claim}")
+        return events, claims
+
+# Global instance
+audit_sink = AuditSink()
+
+@atexit.register
+def _flush_at_exit():
+    if audit_sink.pending():
+        audit_sink.flush()
@@ -0,0 +1,277 @@
+"""
+Batch file operations: move, rename, delete and share many files per request.
+Ownership of every referenced file and folder is checked with one query each,
+valid operations are applied together in one transaction with bulk writes,
+and activity and webhooks are coalesced into one entry per kind of operation.
+Invalid operations are reported in the per-item results and skipped.
+"""
+
+import uuid
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import File, Folder, Invite, Share
+from .cache_utils import bump_generation
+from .folder_counters import folder_counters
+from .search import search_index
+from .change_versions import change_versions
+from .change_journal import change_journal, file_payload, share_payload
+from .bulk_delete import delete_file_rows
+from .permissions import access_resolver
+from .audit import audit_sink
+import logging
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+OPERATIONS = ('move', 'rename', 'delete', 'share')
+PERMISSIONS = tuple(choice for choice, _ in Share.PERMISSION_CHOICES)
+
+def _config():
+    return getattr(settings, 'BATCH_OPERATIONS', {})
+
+def _uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+class BatchOperationEngine:
+    """Validates and applies a list of file operations for one user"""
+
+    @property
+    def max_operations(self):
+        return _config().get('MAX_OPERATIONS', 500)
+
+    def _parse(self, index, operation):
+        """Check one operation's shape; returns (parsed operation, error)"""
+        if not isinstance(operation, dict):
+            return None, 'Operation must be an object'
+        kind = operation.get('op')
+        if kind not in OPERATIONS:
+            return None, f"op must be one of: {', '.join(OPERATIONS)}"
+        file_id = _uuid(operation.get('file_id'))
+        if file_id is None:
+            return None, 'Invalid file_id'
+        parsed = {'index': index, 'op': kind, 'file_id': file_id}
+
+        if kind == 'move':
+            folder_id = operation.get('folder_id')
+            parsed['folder_id'] = _uuid(folder_id) if folder_id else None
+            if folder_id and parsed['folder_id'] is None:
+                return None, 'Invalid folder_id'
+        elif kind == 'rename':
+            name = str(operation.get('name') or '').strip()
+            if not name or len(name) > 255:
+                return None, 'name must be 1-255 characters'
+            parsed['name'] = name
+        elif kind == 'share':
+            parsed['type'] = operation.get('type', 'public')
+            parsed['permission'] = operation.get('permission', 'viewer')
+            parsed['target_email'] = operation.get('target_email')
+            parsed['password'] = operation.get('password', '')
+            expires_at = operation.get('expires_at')
+            parsed['expires_at'] = parse_datetime(expires_at) if isinstance(expires_at, str) else None
+            if parsed['type'] not in ('public', 'user'):
+                return None, "type must be 'public' or 'user'"
+            if parsed['permission'] not in PERMISSIONS:
+                return None, f"permission must be one of: {', '.join(PERMISSIONS)}"
+            if parsed['type'] == 'user' and not parsed['target_email']:
+                return None, 'target_email is required for user shares'
+            if expires_at and parsed['expires_at'] is None:
+                return None, 'Invalid expires_at'
+        return parsed, None
+
+    def run(self, user, operations, meta=None):
+        """Apply the operations; returns {'batch_id', 'results', 'succeeded', 'failed'}"""
+        meta = meta or {}
+        batch_id = uuid.uuid4()
+        results = [None] * len(operations)
+
+        def fail(index, error):
+            results[index] = {'index': index, 'status': 'error', 'error': error}
+
+        parsed = []
+        for index, operation in enumerate(operations):
+            op, error = self._parse(index, operation)
+            if error:
+                fail(index, error)
+            else:
+                parsed.append(op)
+
+        # One query per kind of referenced object
+        files = {f.id: f for f in File.objects.filter(owner=user, id__in={op['file_id'] for op in parsed})}
+        folder_ids = set(Folder.objects.filter(
+            owner=user, id__in={op['folder_id'] for op in parsed if op.get('folder_id')}
+        ).values_list('id', flat=True))
+        emails = {op['target_email'] for op in parsed if op['op'] == 'share' and op['type'] == 'user'}
+        targets = {u.email: u for u in User.objects.filter(email__in=emails)} if emails else {}
+
+        deleted = {op['file_id'] for op in parsed if op['op'] == 'delete' and op['file_id'] in files}
+        before = {file_id: (f.counter_state(), f.folder_id, f.name) for file_id, f in files.items()}
+        changed, deletions, share_ops = {}, {}, []
+        for op in parsed:
+            file_obj = files.get(op['file_id'])
+            if file_obj is None:
+                fail(op['index'], 'File not found')
+                continue
+            if op['op'] != 'delete' and file_obj.id in deleted:
+                fail(op['index'], 'File is deleted by this batch')
+                continue
+            if op['op'] == 'move':
+                if op['folder_id'] and op['folder_id'] not in folder_ids:
+                    fail(op['index'], 'Folder not found')
+                    continue
+                file_obj.folder_id = op['folder_id']
+                changed[file_obj.id] = file_obj
+            elif op['op'] == 'rename':
+                file_obj.name = op['name']
+                changed[file_obj.id] = file_obj
+            elif op['op'] == 'delete':
+                deletions[file_obj.id] = file_obj
+            else:
+                share_ops.append(op)
+            results[op['index']] = {'index': op['index'], 'status': 'ok', 'op': op['op'], 'file_id': str(file_obj.id)}
+
+        now = timezone.now()
+        with transaction.atomic():
+            for file_obj in changed.values():
+                file_obj.modified_at = now
+            File.objects.bulk_update(list(changed.values()), ['name', 'folder', 'modified_at'], batch_size=500)
+            new_shares, target_ids = self._apply_shares(user, files, targets, share_ops, results)
+            if deletions:
+                delete_file_rows(user.id, [
+                    (f.id, f.storage_key, f.size_bytes, f.status, f.mime_type, f.created_at) for f in deletions.values()
+                ])
+
+            transitions = [(before[f.id][0], f.counter_state()) for f in changed.values()]
+            transitions += [(before[f.id][0], None) for f in deletions.values()]
+            folder_counters.files_changed(transitions)
+            change_journal.record_many([
+                (user.id, 'file', f.id, 'updated', file_payload(f)) for f in changed.values()
+            ])
+            search_index.files_changed(list(changed.values()))
+
+            moved = [f for f in changed.values() if f.folder_id != before[f.id][1]]
+            renamed = [f for f in changed.values() if f.name != before[f.id][2]]
+            activities = self._log_activity(user, meta, batch_id, {
+                'moved': moved, 'renamed': renamed, 'deleted': list(deletions.values()),
+                'shared': [files[op['file_id']] for op in share_ops if results[op['index']]['status'] == 'ok'],
+            })
+
+            affected = {before[file_id][1] for file_id in list(changed) + list(deletions)}
+            affected.update(f.folder_id for f in changed.values())
+            affected.update(files[op['file_id']].folder_id for op in share_ops)
+            if changed or deletions or share_ops:
+                change_versions.folders_changed(user.id, affected)
+
+        for user_id in {user.id} | target_ids:
+            bump_generation(user_id)
+        if share_ops or any(f.folder_id != before[f.id][1] for f in changed.values()):
+            access_resolver.owner_changed(user.id)
+        self._trigger_webhooks(user, batch_id, activities, new_shares)
+
+        failed = sum(1 for result in results if result['status'] == 'error')
+        logger.info(f"Batch {batch_id} for user {user.id}: {len(results) - failed} applied, {failed} rejected")
+        return {'batch_id': str(batch_id), 'results': results, 'succeeded': len(results) - failed, 'failed': failed}
+
+    def _apply_shares(self, user, files, targets, share_ops, results):
+        """Create, update or restore shares and invites in bulk; returns (new shares, target user ids)"""
+        if not share_ops:
+            return [], set()
+        existing = {}
+        for share in Share.objects.filter(file_id__in={op['file_id'] for op in share_ops}, actor=user):
+            if share.share_type == 'user':
+                existing[(share.file_id, share.target_user_id)] = share
+            elif share.is_active:
+                existing[(share.file_id, 'public')] = share
+
+        created, updated, invites = {}, {}, []
+        for op in share_ops:
+            result = results[op['index']]
+            if op['type'] == 'user' and op['target_email'] not in targets:
+                invite = Invite(
+                    file=files[op['file_id']], actor=user, target_email=op['target_email'],
+                    permission=op['permission'], expires_at=op['expires_at']
+                )
+                invites.append(invite)
+                result.update(type='invite', invite_id=str(invite.id))
+                continue
+
+            target = targets.get(op['target_email']) if op['type'] == 'user' else None
+            key = (op['file_id'], target.id if target else 'public')
+            share = existing.get(key) or created.get(key)
+            if share is None:
+                # Tokens are unique, so user shares get one too; only public ones are served by token
+                share = Share(
+                    file=files[op['file_id']], actor=user, target_user=target, share_type=op['type'],
+                    token=uuid.uuid4().hex
+                )
+                created[key] = share
+            else:
+                updated[share.id] = share
+            share.permission = op['permission']
+            share.expires_at = op['expires_at']
+            share.is_active = True  # Sharing again restores a revoked share
+            if op['password'] and op['type'] == 'public':
+                share.password = make_password(op['password'])
+            result.update(type='share', share_id=str(share.id), share_type=share.share_type)
+            if share.share_type == 'public':
+                result['token'] = share.token
+
+        now = timezone.now()
+        for share in updated.values():
+            share.updated_at = now
+        Share.objects.bulk_create(list(created.values()), batch_size=500)
+        Share.objects.bulk_update(list(updated.values()), ['permission', 'expires_at', 'password', 'is_active', 'updated_at'], batch_size=500)
+        Invite.objects.bulk_create(invites, batch_size=500)
+        change_journal.record_many([
+            (user_id, 'share', share.id, operation, share_payload(share))
+            for operation, shares in (('created', created.values()), ('updated', updated.values()))
+            for share in shares
+            for user_id in {share.actor_id, share.target_user_id} - {None}
+        ])
+        shares = list(created.values()) + list(updated.values())
+        return list(created.values()), {share.target_user_id for share in shares if share.target_user_id}
+
+    def _log_activity(self, user, meta, batch_id, by_action):
+        """One activity entry per kind of operation, logged against the batch and listing the files it touched"""
+        activities = {
+            action: {
+                'batch_id': str(batch_id),
+                'count': len(file_objs),
+                'files': [{'id': str(f.id), 'name': f.name} for f in file_objs]
+            }
+            for action, file_objs in by_action.items() if file_objs
+        }
+        for action, metadata in activities.items():
+            audit_sink.log(user.id, 'batch', batch_id, action, metadata, meta=meta)
+        return activities
+
+    def _trigger_webhooks(self, user, batch_id, activities, new_shares):
+        """One event per kind of change instead of one per file"""
+        try:
+            from integrations.tasks import trigger_webhook_event
+        except ImportError:
+            return
+        updated = activities.get('moved', {}).get('files', []) + activities.get('renamed', {}).get('files', [])
+        if updated:
+            trigger_webhook_event(user, 'file.updated', {'batch_id': str(batch_id), 'count': len(updated), 'files': updated})
+        if 'deleted' in activities:
+            trigger_webhook_event(user, 'file.deleted', activities['deleted'])
+        if new_shares:
+            trigger_webhook_event(user, 'share.created', {
+                'batch_id': str(batch_id),
+                'count': len(new_shares),
+                'shares': [
+                    {'share_id': str(s.id), 'share_type': s.share_type, 'permission': s.permission, 'item_id': str(s.file_id)}
+                    for s in new_shares
+                ]
+            })
+
+# Global instance
+batch_operations = BatchOperationEngine()
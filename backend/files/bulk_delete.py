@@ -0,0 +1,235 @@
+"""
+Set-based recursive folder deletion.
+The subtree is resolved with one materialized-path prefix query, file rows are
+deleted in batches with queryset deletes (no per-file hooks), their stored
+content is queued as StorageReclaimTask rows for the storage reclaimer, and one
+aggregated activity and webhook event describe the whole deletion.
+A folder has at most one active job. Jobs heartbeat through updated_at; a job
+that stopped making progress (its process died) is resumed by
+`manage.py resume_folder_deletions`, and since each batch only deletes what is
+left, resuming simply carries on.
+"""
+
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from .models import File, FileVersion, Folder, FolderDeletionJob, Share, StorageReclaimTask
+from .cache_utils import bump_generation
+from .audit import audit_sink
+from .folder_counters import folder_counters
+from .search import search_index
+from .user_stats import user_stats, file_state
+from .change_versions import change_versions
+from .change_journal import change_journal
+from .storage_utils import is_storage_key_referenced, release_storage_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_RECLAIM_ATTEMPTS = 5
+
+def _config():
+    return getattr(settings, 'BULK_DELETE', {})
+
+def delete_file_rows(owner_id, rows):
+    """
+    Delete one user's files given as [(id, storage_key, size_bytes, status,
+    mime_type, created_at), ...] with queryset deletes, queueing their content
+    for the reclaimer. Call inside a transaction; folder counters, change
+    versions and the cache generation are left to the caller.
+    """
+    file_ids = [row[0] for row in rows]
+    content = {key: size for _, key, size, *_ in rows}
+    content.update(FileVersion.objects.filter(file_id__in=file_ids).values_list('storage_key', 'size_bytes'))
+    StorageReclaimTask.objects.bulk_create([
+        StorageReclaimTask(storage_key=key, size_bytes=size)
+        for key, size in content.items() if key and not key.startswith('temp/')
+    ], batch_size=1000)
+
+    change_journal.shares_removed(Share.objects.filter(file_id__in=file_ids))
+    change_journal.record_many([(owner_id, 'file', file_id, 'deleted', None) for file_id in file_ids])
+    # Versions, shares, invites and per-file activity go with the rows by cascade
+    File.objects.filter(id__in=file_ids).delete()
+    search_index.remove(file_ids)
+    user_stats.files_removed(owner_id, [
+        file_state(status, size, mime_type, created_at) for _, _, size, status, mime_type, created_at in rows
+    ])
+
+class FolderDeleteEngine:
+    """Deletes a folder subtree in batches, tracked by a FolderDeletionJob"""
+
+    def __init__(self, batch_size=None):
+        self._batch_size = batch_size
+
+    @property
+    def batch_size(self):
+        return self._batch_size or _config().get('BATCH_SIZE', 500)
+
+    def _subtree_files(self, folder):
+        return File.objects.filter(folder__in=Folder.objects.filter(Folder.subtree_q(folder.path)))
+
+    def create_job(self, folder, user):
+        """Size up the subtree and record a pending job; returns (job, created), reusing the folder's active job"""
+        active = FolderDeletionJob.objects.filter(folder_id=folder.id, status__in=FolderDeletionJob.ACTIVE_STATUSES)
+        job = active.first()
+        if job is not None:
+            return job, False
+
+        folders_total = Folder.objects.filter(Folder.subtree_q(folder.path)).count()
+        totals = self._subtree_files(folder).aggregate(files=Count('id'), size=Sum('size_bytes'))
+        try:
+            with transaction.atomic():
+                return FolderDeletionJob.objects.create(
+                    owner=user,
+                    folder_id=folder.id,
+                    folder_name=folder.name,
+                    folders_total=folders_total,
+                    files_total=totals['files']
+                ), True
+        except IntegrityError:
+            # A concurrent request created the folder's job first
+            return active.get(), False
+
+    def should_run_async(self, job):
+        return job.files_total > _config().get('ASYNC_THRESHOLD', 1000)
+
+    def run_async(self, job):
+        """Run the job on a background thread"""
+        thread = threading.Thread(target=self._run_in_thread, args=(job.id,), daemon=True)
+        thread.start()
+        return thread
+
+    def _run_in_thread(self, job_id):
+        try:
+            self.run(FolderDeletionJob.objects.get(id=job_id))
+            StorageReclaimer().run()
+        finally:
+            connection.close()
+
+    def run(self, job, meta=None):
+        """Delete everything under the job's folder; returns the finished job"""
+        meta = meta or {}
+        FolderDeletionJob.objects.filter(id=job.id).update(status='running', updated_at=timezone.now())
+        folder = Folder.objects.filter(id=job.folder_id).first()
+        try:
+            if folder is not None:
+                self._delete_files(job, folder)
+                folder.delete()
+            self._record_deletion(job, meta)
+        except Exception as e:
+            logger.error(f"Bulk deletion of folder {job.folder_id} failed: {e}")
+            FolderDeletionJob.objects.filter(id=job.id).update(status='failed', error=str(e)[:1000], updated_at=timezone.now())
+            # Batches that did commit bypassed the per-file counter hooks
+            folder_counters.reconcile(user=job.owner)
+            user_stats.reconcile(user=job.owner)
+            if folder is not None:
+                change_versions.subtree_changed(folder)
+            bump_generation(job.owner_id)
+            raise
+
+        FolderDeletionJob.objects.filter(id=job.id).update(status='completed', completed_at=timezone.now(), updated_at=timezone.now())
+        bump_generation(job.owner_id)
+        job.refresh_from_db()
+        return job
+
+    def resume_stale(self, stale_after=None):
+        """
+        Run pending or running jobs without progress for RESUME_AFTER_MINUTES,
+        left behind by a process that stopped; returns the jobs run
+        """
+        minutes = stale_after if stale_after is not None else _config().get('RESUME_AFTER_MINUTES', 10)
+        cutoff = timezone.now() - timedelta(minutes=minutes)
+        stale = FolderDeletionJob.objects.filter(status__in=FolderDeletionJob.ACTIVE_STATUSES, updated_at__lt=cutoff)
+        resumed = []
+        for job in stale.order_by('created_at'):
+            # Claim the job; of several workers only one sees its heartbeat unchanged
+            if not FolderDeletionJob.objects.filter(id=job.id, updated_at=job.updated_at).update(updated_at=timezone.now()):
+                continue
+            logger.info(f"Resuming bulk deletion of folder {job.folder_id} ({job.files_deleted}/{job.files_total} files done)")
+            try:
+                resumed.append(self.run(job))
+            except Exception:
+                continue  # Recorded on the job by run()
+        return resumed
+
+    def _delete_files(self, job, folder):
+        files = self._subtree_files(folder).order_by('id')
+        while True:
+            batch = list(files.values_list('id', 'storage_key', 'size_bytes', 'status', 'mime_type', 'created_at')[:self.batch_size])
+            if not batch:
+                return
+
+            with transaction.atomic():
+                delete_file_rows(job.owner_id, batch)
+
+            FolderDeletionJob.objects.filter(id=job.id).update(
+                files_deleted=F('files_deleted') + len(batch),
+                bytes_deleted=F('bytes_deleted') + sum(row[2] for row in batch),
+                updated_at=timezone.now()
+            )
+
+    def _record_deletion(self, job, meta):
+        job.refresh_from_db()
+        details = {
+            'folder_id': str(job.folder_id),
+            'folder_name': job.folder_name,
+            'folders_deleted': job.folders_total,
+            'files_deleted': job.files_deleted,
+            'bytes_deleted': job.bytes_deleted,
+        }
+        audit_sink.log(job.owner_id, 'folder', job.folder_id, 'deleted', details, meta=meta)
+        try:
+            from integrations.tasks import trigger_webhook_event
+            trigger_webhook_event(job.owner, 'folder.deleted', details)
+        except ImportError:
+            pass
+
+class StorageReclaimer:
+    """Releases queued stored content through its storage backend"""
+
+    def __init__(self, batch_size=200):
+        self.batch_size = batch_size
+
+    def run(self):
+        """Drain the queue; returns (tasks released, bytes released)"""
+        released = freed = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                # Each batch is claimed until it commits; concurrent reclaimers (job threads,
+                # reclaim_storage --loop, resume_folder_deletions) skip it rather than release it again
+                tasks = list(
+                    StorageReclaimTask.objects.select_for_update(skip_locked=True)
+                    .filter(attempts__lt=MAX_RECLAIM_ATTEMPTS, id__gt=last_id)
+                    .order_by('id')[:self.batch_size]
+                )
+                if not tasks:
+                    break
+                last_id = tasks[-1].id
+
+                done = []
+                for task in tasks:
+                    try:
+                        with transaction.atomic():
+                            # Content may be shared with rows outside the deleted subtree (e.g. copies)
+                            if not is_storage_key_referenced(task.storage_key):
+                                release_storage_key(task.storage_key)
+                                released += 1
+                                freed += task.size_bytes
+                        done.append(task.id)
+                    except Exception as e:
+                        logger.warning(f"Failed to reclaim {task.storage_key}: {e}")
+                        StorageReclaimTask.objects.filter(id=task.id).update(
+                            attempts=F('attempts') + 1, last_error=str(e)[:1000]
+                        )
+                StorageReclaimTask.objects.filter(id__in=done).delete()
+
+        if released:
+            logger.info(f"Storage reclaimer released {released} objects ({freed} bytes)")
+        return released, freed
+
+# Global instance
+folder_delete_engine = FolderDeleteEngine()
@@ -0,0 +1,59 @@
+"""
+Per-user cache generations.
+Cached values derived from a user's files embed the user's generation in their
+key; bumping the generation on any file mutation invalidates them all at once
+without tracking individual keys.
+"""
+
+import time
+from django.conf import settings
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+GENERATION_PREFIX = 'gen:user:'
+ACL_GENERATION_PREFIX = 'gen:acl:'  # Moves only when who may access a user's items can change
+
+# Backends whose entries are private to one process: a bump in one worker never reaches the others
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+def cache_is_shared():
+    """Whether the default cache is shared by every worker and process (file or redis)"""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+def _seed():
+    return int(time.time() * 1000)
+
+def get_generation(user_id, prefix=GENERATION_PREFIX):
+    """Current cache generation for a user's file data"""
+    key = f'{prefix}{user_id}'
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so an evicted generation never comes back to an old value
+        cache.add(key, _seed(), None)
+        generation = cache.get(key) or _seed()
+    return generation
+
+def get_generations(user_ids):
+    """Current generations for several users with a single cache round trip"""
+    keys = {f'{GENERATION_PREFIX}{user_id}': user_id for user_id in user_ids}
+    found = cache.get_many(list(keys))
+    return {user_id: found.get(key) or get_generation(user_id) for key, user_id in keys.items()}
+
+def bump_generation(user_id, prefix=GENERATION_PREFIX):
+    """Invalidate every cached value keyed on the user's generation"""
+    key = f'{prefix}{user_id}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), None)
+    except Exception as e:
+        logger.warning(f"Failed to bump cache generation for user {user_id}: {e}")
+
+def generation_key(user_id, *parts):
+    """Cache key scoped to the user's current generation"""
+    return ':'.join(['user', str(user_id), f'g{get_generation(user_id)}', *map(str, parts)])
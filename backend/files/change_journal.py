@@ -0,0 +1,180 @@
+"""
+Append-only per-user change journal for delta sync.
+File, folder and share mutations append an entry (sequence, object, operation,
+minimal payload) inside the same transaction as the write. Clients read the
+journal from their last cursor, one compacted page at a time, so a sync costs
+what changed rather than what the account holds. Entries past the retention
+window are truncated; a cursor older than the truncation point gets a
+"resync required" answer.
+Sequences are per user and handed out from a counter row that stays locked
+until the writing transaction commits, so a user's entries become visible in
+sequence order and a cursor can never pass an entry that has yet to commit.
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _config():
+    return getattr(settings, 'CHANGE_JOURNAL', {})
+
+def file_payload(file_obj):
+    return {
+        'name': file_obj.name,
+        'folder_id': str(file_obj.folder_id) if file_obj.folder_id else None,
+        'size_bytes': file_obj.size_bytes,
+        'mime_type': file_obj.mime_type,
+        'status': file_obj.status,
+        'version': file_obj.version,
+    }
+
+def folder_payload(folder):
+    return {'name': folder.name, 'parent_id': str(folder.parent_id) if folder.parent_id else None}
+
+def share_payload(share):
+    return {
+        'file_id': str(share.file_id) if share.file_id else None,
+        'folder_id': str(share.folder_id) if share.folder_id else None,
+        'share_type': share.share_type,
+        'permission': share.permission,
+        'is_active': share.is_active,
+    }
+
+class ChangeJournal:
+    """Manager class for writing, reading and truncating the change journal"""
+
+    def record(self, user_id, object_type, object_id, operation, payload=None):
+        """Append one entry; call inside the mutation's transaction"""
+        self.record_many([(user_id, object_type, object_id, operation, payload)])
+
+    def record_many(self, entries):
+        """Append [(user_id, object_type, object_id, operation, payload), ...]"""
+        from .models import ChangeJournalCounter, ChangeJournalEntry
+        by_user = {}
+        for user_id, object_type, object_id, operation, payload in entries:
+            by_user.setdefault(user_id, []).append(ChangeJournalEntry(
+                user_id=user_id, object_type=object_type, object_id=object_id,
+                operation=operation, payload=payload or {}
+            ))
+        if not by_user:
+            return
+        with transaction.atomic():
+            # Users in a fixed order, so two writers touching the same users cannot deadlock
+            for user_id in sorted(by_user):
+                ChangeJournalCounter.objects.get_or_create(user_id=user_id)
+                counter = ChangeJournalCounter.objects.select_for_update().get(user_id=user_id)
+                for entry in by_user[user_id]:
+                    counter.last_seq += 1
+                    entry.seq = counter.last_seq
+                counter.save(update_fields=['last_seq'])
+            ChangeJournalEntry.objects.bulk_create(
+                [entry for user_entries in by_user.values() for entry in user_entries], batch_size=1000
+            )
+
+    def file_saved(self, file_obj, created):
+        self.record(file_obj.owner_id, 'file', file_obj.id, 'created' if created else 'updated', file_payload(file_obj))
+
+    def folder_saved(self, folder, created):
+        self.record(folder.owner_id, 'folder', folder.id, 'created' if created else 'updated', folder_payload(folder))
+
+    def folder_tree_deleted(self, folder):
+        """A folder delete cascades: journal every folder and file still in the subtree"""
+        from .models import File, Folder, Share
+        subtree = Folder.objects.filter(Folder.subtree_q(folder.path)) if folder.path else Folder.objects.filter(id=folder.id)
+        folder_ids = list(subtree.values_list('id', flat=True))
+        file_ids = File.objects.filter(folder_id__in=folder_ids).values_list('id', flat=True)
+        self.shares_removed(Share.objects.filter(Q(folder_id__in=folder_ids) | Q(file__folder_id__in=folder_ids)))
+        self.record_many(
+            [(folder.owner_id, 'file', file_id, 'deleted', None) for file_id in file_ids]
+            + [(folder.owner_id, 'folder', folder_id, 'deleted', None) for folder_id in folder_ids]
+        )
+
+    def shares_removed(self, shares):
+        """Journal shares about to go with their file or folder by cascade"""
+        self.record_many([
+            (user_id, 'share', share_id, 'deleted', None)
+            for share_id, actor_id, target_user_id in shares.values_list('id', 'actor_id', 'target_user_id')
+            for user_id in {actor_id, target_user_id} - {None}
+        ])
+
+    def share_changed(self, share, operation):
+        """Shares appear in the journals of both the sharing and the receiving user"""
+        payload = share_payload(share)
+        users = {share.actor_id, share.target_user_id} - {None}
+        self.record_many([(user_id, 'share', share.id, operation, payload) for user_id in users])
+
+    def latest_seq(self, user):
+        from .models import ChangeJournalCounter
+        return ChangeJournalCounter.objects.filter(user=user).values_list('last_seq', flat=True).first() or 0
+
+    def changes_since(self, user, since, limit=None):
+        """
+        One compacted page of the user's changes after `since`. Within a page
+        only the latest state of each object is returned, and objects created
+        and deleted inside the page are dropped.
+        """
+        from .models import ChangeJournalEntry, ChangeJournalTruncation
+        floor = ChangeJournalTruncation.objects.filter(user=user).values_list('through_seq', flat=True).first() or 0
+        if since is None or since < floor:
+            # Resume from here after a full resync; never behind the floor, even if everything was truncated
+            return {'changes': [], 'cursor': max(self.latest_seq(user), floor), 'has_more': False, 'resync_required': True}
+
+        limit = limit or _config().get('PAGE_SIZE', 500)
+        entries = list(ChangeJournalEntry.objects.filter(user=user, seq__gt=since).order_by('seq')[:limit + 1])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        compacted = {}
+        for entry in entries:
+            key = (entry.object_type, entry.object_id)
+            previous = compacted.get(key)
+            operation = entry.operation
+            if previous is not None and previous['operation'] == 'created':
+                operation = None if operation == 'deleted' else 'created'
+            compacted[key] = {
+                'seq': entry.seq,
+                'object_type': entry.object_type,
+                'object_id': str(entry.object_id),
+                'operation': operation,
+                'payload': entry.payload,
+                'timestamp': entry.created_at,
+            }
+        changes = sorted((c for c in compacted.values() if c['operation']), key=lambda c: c['seq'])
+        return {
+            'changes': changes,
+            'cursor': entries[-1].seq if entries else since,
+            'has_more': has_more,
+            'resync_required': False,
+        }
+
+    def truncate(self, older_than_days=None, batch_size=5000):
+        """Delete entries past retention, recording per-user floors; returns entries deleted"""
+        from .models import ChangeJournalEntry, ChangeJournalTruncation
+        days = older_than_days if older_than_days is not None else _config().get('RETENTION_DAYS', 30)
+        cutoff = timezone.now() - timedelta(days=days)
+        expired = ChangeJournalEntry.objects.filter(created_at__lt=cutoff)
+
+        # Floors first, so a reader never sees a gap without the resync signal
+        with transaction.atomic():
+            for user_id, through_seq in expired.order_by().values('user_id').annotate(
+                through=Max('seq')
+            ).values_list('user_id', 'through'):
+                ChangeJournalTruncation.objects.update_or_create(user_id=user_id, defaults={'through_seq': through_seq})
+
+        deleted = 0
+        while True:
+            ids = list(expired.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += ChangeJournalEntry.objects.filter(id__in=ids).delete()[0]
+
+        logger.info(f"Change journal truncation deleted {deleted} entries older than {days} days")
+        return deleted
+
+# Global instance
+change_journal = ChangeJournal()
@@ -0,0 +1,95 @@
+"""
+Monotonic change versions behind listing ETags.
+Every folder carries a change_version that moves whenever anything its listing
+shows changes: its files, its subfolders (including their subtree counters) or
+its own name and breadcrumbs. Child changes therefore bump the whole ancestor
+chain, read from the materialized path. The user's root listings and the
+all-files listing use UserStats.change_version, bumped on every change.
+"""
+
+import hashlib
+from functools import wraps
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from rest_framework import status
+from rest_framework.response import Response
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ChangeVersionManager:
+    """Manager class for bumping folder and user change versions"""
+
+    def folders_changed(self, user_id, folder_ids):
+        """Bump the given folders, all their ancestors and the user's root version"""
+        from .models import Folder
+        from .user_stats import user_stats
+        folder_ids = {folder_id for folder_id in folder_ids if folder_id}
+        chain = set()
+        if folder_ids:
+            for (path,) in Folder.objects.filter(id__in=folder_ids).values_list('path'):
+                chain.update(Folder(path=path).ancestor_ids(include_self=True))
+        with transaction.atomic():
+            if chain:
+                Folder.objects.filter(id__in=chain).update(change_version=F('change_version') + 1)
+            user_stats.bump_change_version(user_id)
+
+    def subtree_changed(self, folder):
+        """A rename or move: every breadcrumb below the folder changed too"""
+        from .models import Folder
+        with transaction.atomic():
+            Folder.objects.filter(Folder.subtree_q(folder.path)).update(change_version=F('change_version') + 1)
+            self.folders_changed(folder.owner_id, [folder.parent_id])
+
+    def etag(self, kind, user_id, version, *parts):
+        """Weak ETag for a listing at a given change version"""
+        return 'W/"' + '-'.join(str(part) for part in (kind, user_id, version, *parts)) + '"'
+
+    def folder_version(self, user, folder_id):
+        """Change version of one of the user's folders, or None when it is not theirs"""
+        from .models import Folder
+        try:
+            return Folder.objects.filter(id=folder_id, owner=user).values_list('change_version', flat=True).first()
+        except (ValueError, ValidationError):
+            return None
+
+    def user_version(self, user):
+        from .models import UserStats
+        return UserStats.objects.filter(user=user).values_list('change_version', flat=True).first() or 0
+
+# Global instance
+change_versions = ChangeVersionManager()
+
+def _matches(if_none_match, etag):
+    # Weak comparison: the W/ prefix is ignored on both sides
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in [tag.removeprefix('W/') for tag in tags]
+
+def etag_response(kind, version_for):
+    """
+    Tag GET responses of a function view with a weak ETag built from
+    `version_for(request, *args, **kwargs)` (None disables it) and answer a
+    matching If-None-Match with 304 before the view runs. The version is read
+    first, so a tag never runs ahead of the body it labels.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            version = version_for(request, *args, **kwargs)
+            if version is None:
+                return view(request, *args, **kwargs)
+
+            params = hashlib.sha256(repr(sorted(request.query_params.lists())).encode()).hexdigest()[:12]
+            etag = change_versions.etag(kind, request.user.id, version, params)
+            if _matches(request.headers.get('If-None-Match', ''), etag):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,244 @@
+"""
+Content-addressed chunk store with content-defined chunking.
+Files are split with a FastCDC-style gear hash, each unique chunk is stored once
+with a reference count, and files/versions become manifests of chunk digests.
+"""
+
+import os
+import hashlib
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+import logging
+
+logger = logging.getLogger(__name__)
+
+MASK_64 = (1 << 64) - 1
+
+def _build_gear_table():
+    """Deterministic table of 256 pseudo-random 64-bit values"""
+    return [
+        int.from_bytes(hashlib.sha256(f'filora-gear-{i}'.encode()).digest()[:8], 'big')
+        for i in range(256)
+    ]
+
+GEAR = _build_gear_table()
+
+class ContentDefinedChunker:
+    """FastCDC-style chunker with normalized chunking around the average size"""
+
+    def __init__(self, min_size=16 * 1024, avg_size=64 * 1024, max_size=256 * 1024):
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        bits = avg_size.bit_length() - 1
+        # Harder cut condition before the average size, easier one after it
+        self.mask_small = self._mask(bits + 2)
+        self.mask_large = self._mask(bits - 2)
+
+    @staticmethod
+    def _mask(bits):
+        # Spread the mask bits over the high end of the hash, as FastCDC does
+        return ((1 << bits) - 1) << (64 - bits)
+
+    def _cut_point(self, data, start):
+        """Return the end offset of the chunk starting at `start`"""
+        remaining = len(data) - start
+        if remaining <= self.min_size:
+            return len(data)
+
+        normal = start + min(self.avg_size, remaining)
+        end = start + min(self.max_size, remaining)
+        mask_small, mask_large, gear = self.mask_small, self.mask_large, GEAR
+        h = 0
+
+        i = start + self.min_size
+        while i < normal:
+            h = ((h << 1) + gear[data[i]]) & MASK_64
+            if not h & mask_small:
+                return i + 1
+            i += 1
+        while i < end:
+            h = ((h << 1) + gear[data[i]]) & MASK_64
+            if not h & mask_large:
+                return i + 1
+            i += 1
+        return end
+
+    def split(self, data):
+        """Yield successive content-defined chunks of `data`"""
+        view = memoryview(data)
+        start = 0
+        while start < len(data):
+            end = self._cut_point(data, start)
+            yield view[start:end]
+            start = end
+
+class ChunkStoreManager:
+    """Manager class for storing, reading and releasing chunk manifests"""
+
+    @property
+    def config(self):
+        return getattr(settings, 'CHUNK_STORAGE', {})
+
+    @property
+    def root(self):
+        return str(self.config.get('ROOT') or os.path.join(settings.MEDIA_ROOT, 'chunks'))
+
+    @property
+    def chunker(self):
+        return ContentDefinedChunker(
+            min_size=self.config.get('MIN_CHUNK_SIZE', 16 * 1024),
+            avg_size=self.config.get('AVG_CHUNK_SIZE', 64 * 1024),
+            max_size=self.config.get('MAX_CHUNK_SIZE', 256 * 1024),
+        )
+
+    def is_chunk_store_available(self):
+        """Check if the chunk store is enabled"""
+        return getattr(settings, 'USE_CHUNK_STORE', False)
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def _write_chunk(self, digest, data):
+        """Write a chunk file atomically unless it already exists"""
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return True
+
+    def store(self, data):
+        """Chunk `data`, store unseen chunks and return a new ChunkManifest"""
+        from .models import ContentChunk, ChunkManifest, ManifestChunk
+
+        entries = []
+        offset = 0
+        new_chunks = {}
+        for chunk in self.chunker.split(data):
+            digest = hashlib.sha256(chunk).hexdigest()
+            entries.append((digest, offset, offset + len(chunk)))
+            new_chunks.setdefault(digest, chunk)
+            offset += len(chunk)
+
+        try:
+            with transaction.atomic():
+                # Existing chunk files are only trusted once their rows are locked:
+                # garbage collection removes files while it holds the same locks
+                self._lock_chunks(new_chunks)
+                written = sum(self._write_chunk(digest, chunk) for digest, chunk in new_chunks.items())
+                self._adjust_ref_counts(Counter(digest for digest, _, _ in entries), 1)
+
+                manifest = ChunkManifest.objects.create(
+                    size_bytes=offset,
+                    chunk_count=len(entries),
+                    checksum=hashlib.sha256(data).hexdigest()
+                )
+                ManifestChunk.objects.bulk_create([
+                    ManifestChunk(manifest=manifest, position=i, chunk_id=digest, offset=start, end_offset=end)
+                    for i, (digest, start, end) in enumerate(entries)
+                ], batch_size=1000)
+
+            logger.info(
+                f"Stored manifest {manifest.id}: {len(entries)} chunks, "
+                f"{written} new, {offset} bytes"
+            )
+            return manifest
+        except Exception as e:
+            logger.error(f"Failed to store content in chunk store: {e}")
+            raise
+
+    def _lock_chunks(self, chunks):
+        """Create missing ContentChunk rows for {digest: data} and lock all of them"""
+        from .models import ContentChunk
+        digests = sorted(chunks)
+        locked = set()
+        while len(locked) < len(digests):
+            ContentChunk.objects.bulk_create(
+                [ContentChunk(digest=d, size_bytes=len(chunks[d])) for d in digests if d not in locked],
+                ignore_conflicts=True
+            )
+            # A row collected while we waited for its lock is gone; the next pass inserts it again
+            locked = set(
+                ContentChunk.objects.select_for_update().filter(digest__in=digests)
+                .order_by('digest').values_list('digest', flat=True)
+            )
+
+    def _adjust_ref_counts(self, counts, sign):
+        """Apply per-digest reference count changes, one UPDATE per distinct count"""
+        from .models import ContentChunk
+        by_count = {}
+        for digest, count in counts.items():
+            by_count.setdefault(count, []).append(digest)
+        for count, digests in by_count.items():
+            ContentChunk.objects.filter(digest__in=digests).update(ref_count=F('ref_count') + sign * count)
+
+    def read(self, manifest_id, start=0, end=None, chunk_size=8192):
+        """Generator over the inclusive byte range [start, end] of a manifest"""
+        from .models import ManifestChunk
+
+        entries = ManifestChunk.objects.filter(manifest_id=manifest_id, end_offset__gt=start)
+        if end is not None:
+            entries = entries.filter(offset__lte=end)
+
+        # The cumulative-offset index turns a range into the few chunks covering it
+        for chunk_id, offset, end_offset in entries.order_by('position').values_list('chunk_id', 'offset', 'end_offset'):
+            lo = max(start - offset, 0)
+            hi = end_offset - offset if end is None else min(end + 1, end_offset) - offset
+            with open(self._chunk_path(chunk_id), 'rb') as f:
+                f.seek(lo)
+                remaining = hi - lo
+                while remaining > 0:
+                    data = f.read(min(chunk_size, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+
+    def release(self, manifest_id):
+        """Drop a manifest and its chunk references; unreferenced chunks are left for gc"""
+        from .models import ChunkManifest, ManifestChunk
+        with transaction.atomic():
+            # Of concurrent releases of one manifest only the first finds it
+            if ChunkManifest.objects.select_for_update().filter(id=manifest_id).first() is None:
+                return
+            counts = Counter(
+                ManifestChunk.objects.filter(manifest_id=manifest_id).values_list('chunk_id', flat=True)
+            )
+            self._adjust_ref_counts(counts, -1)
+            ChunkManifest.objects.filter(id=manifest_id).delete()
+
+    def collect_garbage(self, batch_size=1000):
+        """Delete chunks no manifest references any more; returns bytes reclaimed"""
+        from .models import ContentChunk
+        reclaimed = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    ContentChunk.objects.select_for_update().filter(ref_count__lte=0)
+                    .order_by('digest').values_list('digest', 'size_bytes')[:batch_size]
+                )
+                if not batch:
+                    break
+                # Files go while their rows are locked, so store() never reuses one about to disappear;
+                # if the delete then fails, rows without files are rewritten by the next store()
+                for digest, size in batch:
+                    try:
+                        os.remove(self._chunk_path(digest))
+                        reclaimed += size
+                    except FileNotFoundError:
+                        pass
+                ContentChunk.objects.filter(digest__in=[d for d, _ in batch], ref_count__lte=0).delete()
+
+        logger.info(f"Chunk store garbage collection reclaimed {reclaimed} bytes")
+        return reclaimed
+
+# Global instance
+chunk_store = ChunkStoreManager()
@@ -0,0 +1,76 @@
+"""
+Total-count strategies for listing endpoints.
+Counts come, cheapest first, from the materialized folder counters, from the
+query planner's row estimate for large unfiltered sets (PostgreSQL only), or
+from an exact COUNT, cached under the owner's cache generation when the cache
+is shared by every worker.
+"""
+
+import json
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from .cache_utils import cache_is_shared, generation_key
+from .models import Folder
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ListingCount:
+    """A total count and whether it is approximate"""
+
+    def __init__(self, value, approximate=False, source='exact'):
+        self.value = value
+        self.approximate = approximate
+        self.source = source
+
+def _config():
+    return getattr(settings, 'LISTING_COUNTS', {})
+
+def estimate_count(queryset):
+    """Planner row estimate for a queryset, or None when unavailable"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    except Exception as e:
+        logger.debug(f"Count estimate failed: {e}")
+        return None
+
+def cached_count(queryset, user_id, cache_parts):
+    """Exact count, reused until the user's files change or the timeout passes"""
+    if not cache_is_shared():
+        return queryset.count()  # Other workers' generation bumps never reach a per-process cache
+    digest = hashlib.sha256(repr(cache_parts).encode()).hexdigest()[:32]
+    key = generation_key(user_id, 'count', digest)
+    value = cache.get(key)
+    if value is None:
+        value = queryset.count()
+        cache.set(key, value, _config().get('CACHE_TIMEOUT', 300))
+    return value
+
+def count_files(queryset, user, folder_id=None, filtered=False, cache_parts=()):
+    """
+    Total for a listing of the user's ready files. `folder_id` is the listed
+    folder (None for all/root listings); `filtered` means type or search filters
+    narrow the set beyond what the folder counters track.
+    """
+    if folder_id and not filtered:
+        files_count = Folder.objects.filter(id=folder_id, owner=user).values_list('files_count', flat=True).first()
+        if files_count is not None:
+            return ListingCount(files_count, source='counter')
+
+    if not filtered:
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate >= _config().get('ESTIMATE_THRESHOLD', 10000):
+            return ListingCount(estimate, approximate=True, source='estimate')
+
+    return ListingCount(cached_count(queryset, user.id, cache_parts), source='cache')
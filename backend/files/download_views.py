@@ -3,14 +3,16 @@ Views for downloading files stored in PostgreSQL Large Objects and other storage
 """
 
 from django.http import HttpResponse, Http404, StreamingHttpResponse
-from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.core.files.storage import default_storage
-from .models import File
+from .permissions import get_file_or_404
 from .lob_utils import lob_manager
+from .s3_utils import s3_manager
+from .pack_utils import pack_manager
+from .chunk_store import chunk_store
 import logging
 import mimetypes
 
@@ -19,19 +21,23 @@ logger = logging.getLogger(__name__)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def download_file(request, file_id):
-    """Download a file from any storage type (Cloudinary, PostgreSQL LOB, or local)"""
+    """Download a file from any storage type (S3, Cloudinary, PostgreSQL LOB, or local)"""
+    # Owner, collaborators through file or folder shares, and public files
+    file_obj = get_file_or_404(request.user, file_id, 'viewer')
     try:
-        file_obj = get_object_or_404(File, id=file_id)
-        
-        # Check permissions (you can expand this logic)
-        if file_obj.owner != request.user and not file_obj.is_public:
-            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
-        
         # Increment download count
+        file_obj._updated_by = request.user
+        file_obj._activity = {'action': 'downloaded', 'meta': request.META}
         file_obj.increment_download_count()
         
         # Handle different storage types
-        if file_obj.storage_type == 'postgres_lob' and file_obj.postgres_lob_oid:
+        if file_obj.storage_type == 's3' and file_obj.s3_object_key:
+            return _redirect_to_s3(file_obj)
+        elif file_obj.storage_type == 'pack' and file_obj.pack_entry_id:
+            return _download_from_pack(file_obj)
+        elif file_obj.storage_type == 'chunked' and file_obj.chunk_manifest_id:
+            return _download_from_chunk_store(file_obj)
+        elif file_obj.storage_type == 'postgres_lob' and file_obj.postgres_lob_oid:
             return _download_from_postgres_lob(file_obj)
         elif file_obj.storage_type == 'cloudinary' and file_obj.cloudinary_secure_url:
             return _redirect_to_cloudinary(file_obj)
@@ -97,6 +103,63 @@ def _redirect_to_cloudinary(file_obj):
         logger.error(f"Cloudinary redirect failed for {file_obj.name}: {e}")
         raise
 
+def _redirect_to_s3(file_obj, inline=False):
+    """Redirect to a presigned S3 URL so bytes are served by the object store"""
+    from django.shortcuts import redirect
+    
+    try:
+        url = s3_manager.generate_presigned_url(
+            file_obj.s3_object_key,
+            filename=file_obj.name,
+            content_type=file_obj.mime_type,
+            inline=inline
+        )
+        logger.info(f"Redirecting to S3 for {file_obj.name}")
+        return redirect(url)
+        
+    except Exception as e:
+        logger.error(f"S3 redirect failed for {file_obj.name}: {e}")
+        raise
+
+def _download_from_pack(file_obj):
+    """Serve a small file from its pack segment with one positioned read"""
+    try:
+        response = HttpResponse(
+            pack_manager.read(file_obj.pack_entry_id),
+            content_type=file_obj.mime_type or 'application/octet-stream'
+        )
+        
+        # Set headers for download
+        response['Content-Disposition'] = f'attachment; filename="{file_obj.name}"'
+        response['Cache-Control'] = 'public, max-age=3600'
+        response['ETag'] = f'"{file_obj.checksum}"'
+        
+        return response
+        
+    except Exception as e:
+        logger.error(f"Pack download failed for {file_obj.name}: {e}")
+        raise
+
+def _download_from_chunk_store(file_obj):
+    """Stream download by reassembling the file's chunk manifest"""
+    try:
+        response = StreamingHttpResponse(
+            chunk_store.read(file_obj.chunk_manifest_id),
+            content_type=file_obj.mime_type or 'application/octet-stream'
+        )
+        
+        # Set headers for download
+        response['Content-Disposition'] = f'attachment; filename="{file_obj.name}"'
+        response['Content-Length'] = str(file_obj.size_bytes)
+        response['Cache-Control'] = 'public, max-age=3600'
+        response['ETag'] = f'"{file_obj.checksum}"'
+        
+        return response
+        
+    except Exception as e:
+        logger.error(f"Chunk store download failed for {file_obj.name}: {e}")
+        raise
+
 def _download_from_local_storage(file_obj):
     """Stream download from local file storage"""
     try:
@@ -143,19 +206,21 @@ def _download_from_local_storage(file_obj):
 @permission_classes([IsAuthenticated])
 def stream_file(request, file_id):
     """Stream a file for viewing (video/audio) instead of downloading"""
+    file_obj = get_file_or_404(request.user, file_id, 'viewer')
     try:
-        file_obj = get_object_or_404(File, id=file_id)
-        
-        # Check permissions
-        if file_obj.owner != request.user and not file_obj.is_public:
-            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
-        
         # Only allow streaming for video/audio files
         if not (file_obj.is_video or file_obj.is_audio):
             return Response({'error': 'File type not streamable'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Handle different storage types for streaming
-        if file_obj.storage_type == 'postgres_lob' and file_obj.postgres_lob_oid:
+        if file_obj.storage_type == 's3' and file_obj.s3_object_key:
+            # S3 answers Range requests against the presigned URL directly
+            return _redirect_to_s3(file_obj, inline=True)
+        elif file_obj.storage_type == 'pack' and file_obj.pack_entry_id:
+            return _stream_from_pack(file_obj, request)
+        elif file_obj.storage_type == 'chunked' and file_obj.chunk_manifest_id:
+            return _stream_from_chunk_store(file_obj, request)
+        elif file_obj.storage_type == 'postgres_lob' and file_obj.postgres_lob_oid:
             return _stream_from_postgres_lob(file_obj, request)
         elif file_obj.storage_type == 'cloudinary' and file_obj.cloudinary_secure_url:
             return _redirect_to_cloudinary(file_obj)
@@ -168,6 +233,30 @@ def stream_file(request, file_id):
         logger.error(f"Streaming failed for file {file_id}: {e}")
         return Response({'error': 'Streaming failed'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _parse_range(range_header, file_size):
+    """
+    (start, end) of a 'bytes=start-end', 'bytes=start-' or 'bytes=-suffix'
+    range, clamped to the file; None when it cannot be satisfied
+    """
+    try:
+        first, last = range_header.replace('bytes=', '').split(',')[0].strip().split('-')
+        if first:
+            start = int(first)
+            end = min(int(last), file_size - 1) if last else file_size - 1
+        else:
+            # Suffix range: the last N bytes
+            start, end = max(0, file_size - int(last)), file_size - 1
+    except ValueError:
+        return None
+    if start > end or start >= file_size:
+        return None
+    return start, end
+
+def _range_not_satisfiable(file_size):
+    response = HttpResponse(status=416)
+    response['Content-Range'] = f'bytes */{file_size}'
+    return response
+
 def _stream_from_postgres_lob(file_obj, request):
     """Stream video/audio from PostgreSQL LOB with range support"""
     try:
@@ -178,13 +267,10 @@ def _stream_from_postgres_lob(file_obj, request):
         range_header = request.META.get('HTTP_RANGE')
         if range_header:
             # Parse range header (e.g., "bytes=0-1023")
-            range_match = range_header.replace('bytes=', '').split('-')
-            start = int(range_match[0]) if range_match[0] else 0
-            end = int(range_match[1]) if range_match[1] else file_size - 1
-            
-            # Ensure valid range
-            start = max(0, start)
-            end = min(file_size - 1, end)
+            byte_range = _parse_range(range_header, file_size)
+            if byte_range is None:
+                return _range_not_satisfiable(file_size)
+            start, end = byte_range
             content_length = end - start + 1
             
             def generate_range_chunks():
@@ -261,12 +347,10 @@ def _stream_from_local_storage(file_obj, request):
         range_header = request.META.get('HTTP_RANGE')
         if range_header:
             # Parse range header
-            range_match = range_header.replace('bytes=', '').split('-')
-            start = int(range_match[0]) if range_match[0] else 0
-            end = int(range_match[1]) if range_match[1] else file_size - 1
-            
-            start = max(0, start)
-            end = min(file_size - 1, end)
+            byte_range = _parse_range(range_header, file_size)
+            if byte_range is None:
+                return _range_not_satisfiable(file_size)
+            start, end = byte_range
             content_length = end - start + 1
             
             def generate_range_chunks():
@@ -319,4 +403,75 @@ def _stream_from_local_storage(file_obj, request):
         
     except Exception as e:
         logger.error(f"Local file streaming failed for {file_obj.name}: {e}")
-        raise
\ No newline at end of file
+        raise
+
+def _stream_from_pack(file_obj, request):
+    """Stream audio/video from a pack segment with range support"""
+    try:
+        file_size = file_obj.size_bytes
+        
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header:
+            byte_range = _parse_range(range_header, file_size)
+            if byte_range is None:
+                return _range_not_satisfiable(file_size)
+            start, end = byte_range
+            
+            response = HttpResponse(
+                pack_manager.read(file_obj.pack_entry_id, start, end - start + 1),
+                content_type=file_obj.mime_type,
+                status=206
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        else:
+            response = HttpResponse(
+                pack_manager.read(file_obj.pack_entry_id),
+                content_type=file_obj.mime_type
+            )
+        
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'public, max-age=3600'
+        response['ETag'] = f'"{file_obj.checksum}"'
+        
+        return response
+        
+    except Exception as e:
+        logger.error(f"Pack streaming failed for {file_obj.name}: {e}")
+        raise
+
+def _stream_from_chunk_store(file_obj, request):
+    """Stream audio/video from the chunk store; ranges only touch the chunks they cover"""
+    try:
+        content_type = file_obj.mime_type
+        file_size = file_obj.size_bytes
+        
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header:
+            byte_range = _parse_range(range_header, file_size)
+            if byte_range is None:
+                return _range_not_satisfiable(file_size)
+            start, end = byte_range
+            
+            response = StreamingHttpResponse(
+                chunk_store.read(file_obj.chunk_manifest_id, start, end),
+                content_type=content_type,
+                status=206
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            response = StreamingHttpResponse(
+                chunk_store.read(file_obj.chunk_manifest_id),
+                content_type=content_type
+            )
+            response['Content-Length'] = str(file_size)
+        
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'public, max-age=3600'
+        response['ETag'] = f'"{file_obj.checksum}"'
+        
+        return response
+        
+    except Exception as e:
+        logger.error(f"Chunk store streaming failed for {file_obj.name}: {e}")
+        raise
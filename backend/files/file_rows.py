@@ -0,0 +1,147 @@
+"""
+ORM-bypass rows for file listings.
+Builds the same dicts FileSerializer produces straight from .values() rows:
+no model instances and no per-field serializer dispatch. Derived fields (URLs,
+extension, type flags) are computed from the selected columns, and only the
+columns the requested fields read are selected (see listing.FILE_FIELD_COLUMNS).
+"""
+
+import os
+from types import SimpleNamespace
+from django.conf import settings
+from django.utils import timezone
+from .models import File
+from .listing import FILE_FIELD_COLUMNS, file_listing_queryset
+from .search import DOCUMENT_MIME_TYPES
+
+ALL_FILE_FIELDS = tuple(FILE_FIELD_COLUMNS)
+THUMBNAIL_SIZES = ('small', 'medium', 'large')
+
+_SKIP = object()  # FileSerializer leaves the key out (folder_name of root files)
+
+def _config():
+    return getattr(settings, 'FILE_LISTING', {})
+
+def fast_path_enabled():
+    return _config().get('FAST_PATH', True)
+
+def page_limit(limit):
+    """A ?limit= clamped to 1..MAX_PAGE_SIZE"""
+    return max(1, min(limit, _config().get('MAX_PAGE_SIZE', 1000)))
+
+def should_stream(limit):
+    """Pages of at least STREAM_THRESHOLD rows are sent as chunked JSON"""
+    return limit >= _config().get('STREAM_THRESHOLD', 500)
+
+def _datetime(value):
+    """DateTimeField representation: current timezone, ISO 8601, Z for UTC"""
+    if not value:
+        return None
+    value = timezone.localtime(value).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+def _is_image(r):
+    return r['mime_type'].startswith('image/')
+
+def _is_video(r):
+    return r['mime_type'].startswith('video/')
+
+def _is_audio(r):
+    return r['mime_type'].startswith('audio/')
+
+def _can_preview(r):
+    return _is_image(r) or _is_video(r) or _is_audio(r) or r['mime_type'] == 'application/pdf'
+
+def _file_url(r):
+    if r['status'] != 'ready':
+        return None
+    if r['cloudinary_secure_url']:
+        return r['cloudinary_secure_url']
+    if r['cloudinary_url']:
+        return r['cloudinary_url']
+    if r['postgres_lob_oid'] or r['storage_type'] in ('s3', 'pack', 'chunked'):
+        return f"/api/files/{r['id']}/download/"
+    if r['file']:
+        return File._meta.get_field('file').storage.url(r['file'])
+    return None
+
+def _thumbnail_urls(r):
+    keys = r['thumbnail_keys'] or {}
+    return {size: f'/media/thumbnails/{keys[size]}' for size in THUMBNAIL_SIZES if size in keys}
+
+def _preview_url(r):
+    if not _can_preview(r):
+        return None
+    if r['storage_type'] == 's3':
+        from .s3_utils import s3_manager
+        key = r['storage_key'][len('s3/'):] if r['storage_key'].startswith('s3/') else None
+        return s3_manager.generate_presigned_url(key, filename=r['name'], content_type=r['mime_type'], inline=True)
+    return f"/media/{r['file']}"
+
+def _column(column, convert=None):
+    if convert is None:
+        return lambda r: r[column]
+    return lambda r: None if r[column] is None else convert(r[column])
+
+def _folder_name(r):
+    return _SKIP if r['folder'] is None else r['folder__name']
+
+FIELD_BUILDERS = {
+    'id': _column('id', str),
+    'name': _column('name'),
+    'description': _column('description'),
+    'file_url': _file_url,
+    'thumbnail_urls': _thumbnail_urls,
+    'preview_url': _preview_url,
+    'folder': _column('folder', str),
+    'folder_name': _folder_name,
+    'size_bytes': _column('size_bytes'),
+    'mime_type': _column('mime_type'),
+    'status': _column('status'),
+    'version': _column('version'),
+    'is_public': _column('is_public'),
+    'download_count': _column('download_count'),
+    'last_accessed': _column('last_accessed', _datetime),
+    'created_at': _column('created_at', _datetime),
+    'modified_at': _column('modified_at', _datetime),
+    'file_extension': lambda r: os.path.splitext(r['name'])[1].lower(),
+    'is_image': _is_image,
+    'is_video': _is_video,
+    'is_audio': _is_audio,
+    'is_document': lambda r: r['mime_type'] in DOCUMENT_MIME_TYPES,
+    'can_preview': _can_preview,
+    'duration': _column('duration', float),
+    'page_count': _column('page_count'),
+    'owner_name': _column('owner__name'),
+    'versions_count': _column('versions_count'),
+    'share_links_count': _column('share_links_count'),
+    'cloudinary_public_id': _column('cloudinary_public_id'),
+    'cloudinary_url': _column('cloudinary_url'),
+    'cloudinary_secure_url': _column('cloudinary_secure_url'),
+    'checksum': _column('checksum'),
+}
+
+def file_rows_queryset(queryset, fields=None, columns=()):
+    """A .values() queryset with exactly the columns the fields (plus `columns`) read"""
+    fields = ALL_FILE_FIELDS if fields is None else fields
+    needed = {'id', *columns}
+    for name in fields:
+        needed.update(FILE_FIELD_COLUMNS[name])
+    annotations = [name for name in ('versions_count', 'share_links_count') if name in fields]
+    return file_listing_queryset(queryset, fields, columns).values(*sorted(needed), *annotations)
+
+def build_file_rows(values, fields=None):
+    """Generator of FileSerializer-shaped dicts from file_rows_queryset() rows"""
+    # Same key order as the serializer, which follows FileSerializer.Meta.fields
+    builders = [(name, FIELD_BUILDERS[name]) for name in ALL_FILE_FIELDS if fields is None or name in fields]
+    for r in values:
+        row = {}
+        for name, build in builders:
+            value = build(r)
+            if value is not _SKIP:
+                row[name] = value
+        yield row
+
+def cursor_row(values_row):
+    """Attribute view of a values() row for pagination.encode_cursor"""
+    return SimpleNamespace(**values_row)
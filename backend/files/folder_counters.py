@@ -0,0 +1,188 @@
+"""
+Materialized per-folder aggregate counters.
+Folder rows carry direct counts (ready files, subfolders, bytes) and recursive
+totals for their whole subtree. They are maintained incrementally from file and
+folder lifecycle hooks in models.py; reconcile() repairs any drift.
+"""
+
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Sum
+import logging
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ('files_count', 'subfolders_count', 'total_size_bytes', 'tree_files_count', 'tree_size_bytes')
+
+class FolderCounterManager:
+    """Manager class for maintaining and repairing folder counters"""
+
+    def _ancestor_ids(self, folder_id):
+        """The folder itself and every ancestor, read from its materialized path"""
+        from .models import Folder
+        folder = Folder.objects.filter(id=folder_id).only('path').first()
+        return folder.ancestor_ids(include_self=True) if folder else []
+
+    def _apply(self, folder_id, files_delta, size_delta):
+        """Add a file/byte delta to one folder and to the subtree totals of its ancestors"""
+        from .models import Folder
+        if folder_id is None or not (files_delta or size_delta):
+            return
+        Folder.objects.filter(id=folder_id).update(
+            files_count=F('files_count') + files_delta,
+            total_size_bytes=F('total_size_bytes') + size_delta
+        )
+        self._apply_tree(self._ancestor_ids(folder_id), files_delta, size_delta)
+
+    def _apply_tree(self, folder_ids, files_delta, size_delta):
+        from .models import Folder
+        if folder_ids and (files_delta or size_delta):
+            Folder.objects.filter(id__in=folder_ids).update(
+                tree_files_count=F('tree_files_count') + files_delta,
+                tree_size_bytes=F('tree_size_bytes') + size_delta
+            )
+
+    def file_transition(self, before, after):
+        """
+        Apply a file state change. `before` and `after` are (folder_id, is_ready,
+        size_bytes) tuples, or None for a file that does not exist on that side.
+        Only ready files are counted.
+        """
+        if before == after:
+            return
+        with transaction.atomic():
+            if before and before[1]:
+                self._apply(before[0], -1, -before[2])
+            if after and after[1]:
+                self._apply(after[0], 1, after[2])
+
+    def files_changed(self, transitions):
+        """Apply many file_transition()s with one update per affected folder"""
+        from .models import Folder
+        direct = defaultdict(lambda: [0, 0])
+        for before, after in transitions:
+            for sign, state in ((-1, before), (1, after)):
+                if state and state[1]:
+                    direct[state[0]][0] += sign
+                    direct[state[0]][1] += sign * state[2]
+        direct = {folder_id: delta for folder_id, delta in direct.items() if folder_id and any(delta)}
+        if not direct:
+            return
+
+        tree = defaultdict(lambda: [0, 0])
+        for folder_id, path in Folder.objects.filter(id__in=direct).values_list('id', 'path'):
+            for ancestor_id in Folder(path=path).ancestor_ids(include_self=True):
+                tree[ancestor_id][0] += direct[folder_id][0]
+                tree[ancestor_id][1] += direct[folder_id][1]
+
+        with transaction.atomic():
+            for folder_id, (files_delta, size_delta) in direct.items():
+                Folder.objects.filter(id=folder_id).update(
+                    files_count=F('files_count') + files_delta,
+                    total_size_bytes=F('total_size_bytes') + size_delta
+                )
+            for folder_id, (files_delta, size_delta) in tree.items():
+                self._apply_tree([folder_id], files_delta, size_delta)
+
+    def folder_created(self, folder):
+        from .models import Folder
+        if folder.parent_id:
+            Folder.objects.filter(id=folder.parent_id).update(subfolders_count=F('subfolders_count') + 1)
+
+    def folder_moved(self, folder, old_parent_id):
+        """Move a folder's subtree totals from its old ancestors to its new ones"""
+        from .models import Folder
+        tree_files, tree_size = Folder.objects.filter(id=folder.id).values_list(
+            'tree_files_count', 'tree_size_bytes'
+        ).get()
+        with transaction.atomic():
+            if old_parent_id:
+                Folder.objects.filter(id=old_parent_id).update(subfolders_count=F('subfolders_count') - 1)
+                self._apply_tree(self._ancestor_ids(old_parent_id), -tree_files, -tree_size)
+            if folder.parent_id:
+                Folder.objects.filter(id=folder.parent_id).update(subfolders_count=F('subfolders_count') + 1)
+                self._apply_tree(self._ancestor_ids(folder.parent_id), tree_files, tree_size)
+
+    def folder_deleted(self, folder_id, parent_id):
+        """Remove a folder (and whatever its subtree still holds) from its ancestors"""
+        from .models import Folder
+        if not parent_id:
+            return
+        tree_files, tree_size = Folder.objects.filter(id=folder_id).values_list(
+            'tree_files_count', 'tree_size_bytes'
+        ).first() or (0, 0)
+        with transaction.atomic():
+            Folder.objects.filter(id=parent_id).update(subfolders_count=F('subfolders_count') - 1)
+            self._apply_tree(self._ancestor_ids(parent_id), -tree_files, -tree_size)
+
+    def bulk_status_change(self, rows, is_ready):
+        """Apply a queryset-level status update for [(folder_id, size_bytes), ...]"""
+        sign = 1 if is_ready else -1
+        for folder_id, size_bytes in rows:
+            self._apply(folder_id, sign, sign * size_bytes)
+
+    def compute(self, user=None):
+        """Recompute every counter from scratch; returns {folder_id: {field: value}}"""
+        from .models import File, Folder
+        folders = Folder.objects.all()
+        files = File.objects.all()
+        if user is not None:
+            folders = folders.filter(owner=user)
+            files = files.filter(owner=user)
+        return self.compute_from(folders, files)
+
+    def compute_from(self, folders, files):
+        """Counters for the given folder and file querysets (also used by migrations)"""
+        files = files.filter(status='ready', folder__isnull=False)
+        parents = dict(folders.values_list('id', 'parent_id'))
+        counters = {folder_id: dict.fromkeys(COUNTER_FIELDS, 0) for folder_id in parents}
+
+        for folder_id, count, size in files.order_by().values('folder_id').annotate(
+            count=Count('id'), size=Sum('size_bytes')
+        ).values_list('folder_id', 'count', 'size'):
+            if folder_id in counters:
+                counters[folder_id]['files_count'] = count
+                counters[folder_id]['total_size_bytes'] = size or 0
+
+        children = defaultdict(list)
+        for folder_id, parent_id in parents.items():
+            if parent_id in counters:
+                children[parent_id].append(folder_id)
+                counters[parent_id]['subfolders_count'] += 1
+
+        # Roll subtree totals up from the leaves (iterative post-order walk)
+        for root in [folder_id for folder_id, parent_id in parents.items() if parent_id not in counters]:
+            stack = [(root, False)]
+            while stack:
+                folder_id, expanded = stack.pop()
+                if not expanded:
+                    stack.append((folder_id, True))
+                    stack.extend((child, False) for child in children[folder_id])
+                    continue
+                row = counters[folder_id]
+                row['tree_files_count'] = row['files_count'] + sum(
+                    counters[child]['tree_files_count'] for child in children[folder_id]
+                )
+                row['tree_size_bytes'] = row['total_size_bytes'] + sum(
+                    counters[child]['tree_size_bytes'] for child in children[folder_id]
+                )
+        return counters
+
+    def reconcile(self, user=None, dry_run=False):
+        """Repair folders whose stored counters drifted; returns the number repaired"""
+        from .models import Folder
+        expected = self.compute(user)
+        stale = []
+        current = Folder.objects.all() if user is None else Folder.objects.filter(owner=user)
+        for folder_id, *values in current.values_list('id', *COUNTER_FIELDS).iterator():
+            # Folders created since compute() are skipped until the next run
+            if folder_id in expected and dict(zip(COUNTER_FIELDS, values)) != expected[folder_id]:
+                stale.append(Folder(id=folder_id, **expected[folder_id]))
+
+        if stale and not dry_run:
+            Folder.objects.bulk_update(stale, COUNTER_FIELDS, batch_size=500)
+        logger.info(f"Folder counter reconciliation found {len(stale)} stale folders")
+        return len(stale)
+
+# Global instance
+folder_counters = FolderCounterManager()
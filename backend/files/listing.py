@@ -0,0 +1,105 @@
+"""
+Queryset builders for file listings.
+Per-row counts are computed with correlated subqueries and related names are
+joined up front, so serializing a page costs a constant number of queries.
+Sparse fieldsets (?fields= / ?view=compact) restrict both the serialized fields
+and the selected columns, joins and annotations to what those fields read.
+"""
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import File, FileVersion, Share
+
+def _count_subquery(queryset):
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values('file').annotate(count=Count('id')).values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+# Model columns read by each FileSerializer field
+FILE_FIELD_COLUMNS = {
+    'id': ('id',),
+    'name': ('name',),
+    'description': ('description',),
+    'file_url': ('status', 'cloudinary_secure_url', 'cloudinary_url', 'postgres_lob_oid', 'storage_type', 'file'),
+    'thumbnail_urls': ('thumbnail_keys',),
+    'preview_url': ('mime_type', 'storage_type', 'storage_key', 'name', 'file'),
+    'folder': ('folder',),
+    'folder_name': ('folder', 'folder__name'),
+    'size_bytes': ('size_bytes',),
+    'mime_type': ('mime_type',),
+    'status': ('status',),
+    'version': ('version',),
+    'is_public': ('is_public',),
+    'download_count': ('download_count',),
+    'last_accessed': ('last_accessed',),
+    'created_at': ('created_at',),
+    'modified_at': ('modified_at',),
+    'file_extension': ('name',),
+    'is_image': ('mime_type',),
+    'is_video': ('mime_type',),
+    'is_audio': ('mime_type',),
+    'is_document': ('mime_type',),
+    'can_preview': ('mime_type',),
+    'duration': ('duration',),
+    'page_count': ('page_count',),
+    'owner_name': ('owner', 'owner__name'),
+    'versions_count': (),
+    'share_links_count': (),
+    'cloudinary_public_id': ('cloudinary_public_id',),
+    'cloudinary_url': ('cloudinary_url',),
+    'cloudinary_secure_url': ('cloudinary_secure_url',),
+    'checksum': ('checksum',),
+}
+
+# What the file list and grid views render
+COMPACT_FILE_FIELDS = (
+    'id', 'name', 'size_bytes', 'mime_type', 'status', 'folder', 'modified_at', 'download_count', 'thumbnail_urls'
+)
+
+def parse_file_fields(query_params):
+    """
+    Fields requested with ?view=compact or ?fields=a,b (id is always included);
+    None means the full representation. Raises ValueError for unknown fields.
+    """
+    if query_params.get('view') == 'compact':
+        return COMPACT_FILE_FIELDS
+    requested = query_params.get('fields')
+    if not requested:
+        return None
+    fields = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in FILE_FIELD_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(['id', *fields]))
+
+def file_listing_queryset(queryset=None, fields=None, columns=()):
+    """
+    Annotate versions_count / share_links_count and join owner and folder.
+    With `fields`, only what those serializer fields read (plus `columns`,
+    e.g. the sort key) is selected.
+    """
+    if queryset is None:
+        queryset = File.objects.all()
+    if fields is None:
+        return queryset.select_related('owner', 'folder').annotate(
+            versions_count=_count_subquery(FileVersion.objects.filter(file=OuterRef('pk'))),
+            share_links_count=_count_subquery(Share.objects.filter(file=OuterRef('pk'), is_active=True)),
+        )
+
+    needed = set(columns)
+    for name in fields:
+        needed.update(FILE_FIELD_COLUMNS[name])
+    related = [name for name in ('owner', 'folder') if f'{name}__name' in needed]
+    if related:
+        queryset = queryset.select_related(*related)
+    if 'versions_count' in fields:
+        queryset = queryset.annotate(versions_count=_count_subquery(FileVersion.objects.filter(file=OuterRef('pk'))))
+    if 'share_links_count' in fields:
+        queryset = queryset.annotate(
+            share_links_count=_count_subquery(Share.objects.filter(file=OuterRef('pk'), is_active=True))
+        )
+    return queryset.only(*needed)
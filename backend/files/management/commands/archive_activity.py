@@ -0,0 +1,31 @@
+import time
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from files.activity_log import activity_archiver
+
+class Command(BaseCommand):
+    help = 'Archive activity months past the retention window to gzipped NDJSON and delete them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='List expired months without archiving them')
+        parser.add_argument('--batch-size', type=int, help='Rows per chunk (defaults to ACTIVITY_RETENTION BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a background worker')
+        parser.add_argument('--interval', type=int, default=86400, help='Seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            for table, month, rows in activity_archiver.expired():
+                self.stdout.write(f'{table} {month}: {rows} entries')
+            return
+        try:
+            activity_archiver.archive_dir()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        while True:
+            for table, month, moved in activity_archiver.run(batch_size=options['batch_size']):
+                self.stdout.write(self.style.SUCCESS(
+                    f'Archived {moved} {table} entries of {month} to {activity_archiver.archive_path(table, month)}'
+                ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,95 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from files.models import File
+from files.listing import file_listing_queryset, parse_file_fields
+from files.serializers import FileSerializer
+from files.file_rows import build_file_rows, file_rows_queryset
+from files.renderers import dumps, orjson
+
+User = get_user_model()
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Compare the FileSerializer listing path with the .values() fast path and orjson rendering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Benchmark this email\'s files instead of generated ones')
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per page')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path; the best is reported')
+        parser.add_argument('--fields', help='Sparse fieldset, e.g. id,name,size_bytes or "compact"')
+
+    def handle(self, *args, **options):
+        params = {'view': 'compact'} if options['fields'] == 'compact' else {'fields': options['fields'] or ''}
+        try:
+            fields = parse_file_fields(params)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['user']:
+            self._run(User.objects.get(email=options['user']), fields, options)
+            return
+        # Generated rows are rolled back afterwards
+        try:
+            with transaction.atomic():
+                self._run(self._generate(options['rows']), fields, options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _generate(self, rows):
+        user = User.objects.create_user(
+            email=f'benchmark-{uuid.uuid4().hex[:8]}@example.com', username=f'benchmark-{uuid.uuid4().hex[:8]}'
+        )
+        mime_types = ('image/png', 'application/pdf', 'video/mp4', 'text/plain')
+        File.objects.bulk_create([
+            File(
+                name=f'file-{i}.{mime_types[i % 4].split("/")[1]}', owner=user, size_bytes=i * 1024,
+                mime_type=mime_types[i % 4], storage_type='pack', storage_key=f'pack/{uuid.uuid4()}',
+                thumbnail_keys={'small': f'{i}-s.jpg'} if i % 4 == 0 else {}
+            )
+            for i in range(rows)
+        ], batch_size=1000)
+        return user
+
+    def _time(self, repeat, build, render):
+        best_build = best_render = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = build()
+            built = time.perf_counter()
+            body = render(data)
+            best_build = min(best_build, built - start)
+            best_render = min(best_render, time.perf_counter() - built)
+        return best_build * 1000, best_render * 1000, len(body)
+
+    def _run(self, user, fields, options):
+        files = File.objects.filter(owner=user, status='ready').order_by('-modified_at', '-id')
+        rows, repeat = options['rows'], options['repeat']
+
+        results = {
+            'serializer + json': self._time(
+                repeat,
+                lambda: FileSerializer(list(file_listing_queryset(files, fields)[:rows]), many=True, fields=fields).data,
+                JSONRenderer().render
+            ),
+            f"values() rows + {'orjson' if orjson else 'json'}": self._time(
+                repeat,
+                lambda: list(build_file_rows(file_rows_queryset(files, fields)[:rows], fields)),
+                dumps
+            ),
+        }
+
+        baseline = sum(results['serializer + json'][:2])
+        self.stdout.write(f'{rows} rows, fields: {",".join(fields) if fields else "all"}, best of {repeat}')
+        for path, (build_ms, render_ms, size) in results.items():
+            total = build_ms + render_ms
+            self.stdout.write(
+                f'  {path:<24} build {build_ms:8.1f} ms  render {render_ms:7.1f} ms  '
+                f'total {total:8.1f} ms  {size} bytes  x{baseline / total:.1f}'
+            )
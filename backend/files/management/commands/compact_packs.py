@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from files.pack_utils import pack_manager
+
+class Command(BaseCommand):
+    help = 'Rewrite pack segments whose deleted entries exceed the compaction ratio'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ratio', type=float, default=None,
+            help="Dead-byte ratio that triggers compaction (defaults to PACK_STORAGE['COMPACTION_RATIO'])"
+        )
+
+    def handle(self, *args, **options):
+        reclaimed = pack_manager.compact(ratio=options['ratio'])
+        self.stdout.write(self.style.SUCCESS(f'Reclaimed {reclaimed} bytes from pack segments'))
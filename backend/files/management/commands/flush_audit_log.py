@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from files.audit import audit_sink
+
+class Command(BaseCommand):
+    help = 'Write audit entries left in the spool file by a failed or interrupted flush'
+
+    def handle(self, *args, **options):
+        written = audit_sink.flush()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} audit entries'))
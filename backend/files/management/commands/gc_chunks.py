@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from files.chunk_store import chunk_store
+
+class Command(BaseCommand):
+    help = 'Delete chunk store chunks that are no longer referenced by any manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Chunks deleted per transaction')
+
+    def handle(self, *args, **options):
+        reclaimed = chunk_store.collect_garbage(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Reclaimed {reclaimed} bytes from the chunk store'))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from files.retention import VersionPruner
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = 'Apply version retention policies and free the storage of pruned versions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Files examined per batch')
+        parser.add_argument('--user', help='Only prune files owned by this email')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a background worker')
+        parser.add_argument('--interval', type=int, default=3600, help='Seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        user = User.objects.get(email=options['user']) if options['user'] else None
+
+        while True:
+            deleted, released = VersionPruner(batch_size=options['batch_size']).run(user=user)
+            self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} versions, released {released} bytes'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from files.search import search_index
+
+class Command(BaseCommand):
+    help = 'Rebuild the SQLite FTS5 search mirror (PostgreSQL search indexes need no rebuild)'
+
+    def handle(self, *args, **options):
+        backend = search_index.backend()
+        if backend != 'fts5':
+            self.stdout.write(f'Search backend is {backend}; nothing to rebuild')
+            return
+        indexed = search_index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} files and folders'))
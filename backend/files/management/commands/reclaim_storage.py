@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from files.bulk_delete import StorageReclaimer
+
+class Command(BaseCommand):
+    help = 'Release stored content queued by bulk deletions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Queue entries processed per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a background worker')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            released, freed = StorageReclaimer(batch_size=options['batch_size']).run()
+            self.stdout.write(self.style.SUCCESS(f'Released {released} stored objects ({freed} bytes)'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from files.folder_counters import folder_counters
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = 'Recompute materialized folder counters and repair any that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only reconcile folders owned by this email')
+        parser.add_argument('--dry-run', action='store_true', help='Report stale folders without fixing them')
+
+    def handle(self, *args, **options):
+        user = User.objects.get(email=options['user']) if options['user'] else None
+        stale = folder_counters.reconcile(user=user, dry_run=options['dry_run'])
+        action = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{action} {stale} folders with stale counters'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from files.user_stats import user_stats
+
+User = get_user_model()
+
+class Command(BaseCommand):
+    help = 'Recompute per-user statistics rollups and repair any that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only reconcile statistics of this email')
+        parser.add_argument('--dry-run', action='store_true', help='Report stale rows without fixing them')
+
+    def handle(self, *args, **options):
+        user = User.objects.get(email=options['user']) if options['user'] else None
+        stale = user_stats.reconcile(user=user, dry_run=options['dry_run'])
+        action = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{action} {stale} stale statistics rows'))
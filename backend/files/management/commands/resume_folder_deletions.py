@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from files.bulk_delete import StorageReclaimer, folder_delete_engine
+
+class Command(BaseCommand):
+    help = 'Resume bulk folder deletions whose worker stopped (pending or running without progress)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, default=None,
+                            help='Minutes without progress before a job is resumed (default: BULK_DELETE RESUME_AFTER_MINUTES)')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a background worker')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            jobs = folder_delete_engine.resume_stale(options['stale_after'])
+            if jobs:
+                StorageReclaimer().run()
+            self.stdout.write(self.style.SUCCESS(f'Resumed {len(jobs)} folder deletion jobs'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
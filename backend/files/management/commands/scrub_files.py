@@ -0,0 +1,35 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from files.scrubber import IntegrityScrubber
+
+class Command(BaseCommand):
+    help = 'Verify stored file bytes against their checksums, marking damaged files unavailable and recovered ones ready'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Parallel verification threads')
+        parser.add_argument('--bandwidth', type=int, default=10 * 1024 * 1024,
+                            help='Read budget in bytes per second across all workers (0 = unlimited)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Files per batch between cursor saves')
+        parser.add_argument('--cursor', default='default', help='Name of the persisted resume cursor')
+        parser.add_argument('--loop', action='store_true', help='Scrub continuously')
+        parser.add_argument('--pause', type=int, default=300, help='Seconds to rest between passes with --loop')
+        parser.add_argument('--nice', type=int, default=10, help='CPU niceness increment for this process')
+
+    def handle(self, *args, **options):
+        if options['nice']:
+            os.nice(options['nice'])
+
+        scrubber = IntegrityScrubber(
+            workers=options['workers'],
+            bytes_per_second=options['bandwidth'],
+            batch_size=options['batch_size'],
+            cursor_name=options['cursor'],
+        )
+
+        while True:
+            examined = scrubber.run_pass()
+            self.stdout.write(self.style.SUCCESS(f'Scrub pass finished, examined {examined} files'))
+            if not options['loop']:
+                break
+            time.sleep(options['pause'])
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from files.change_journal import change_journal
+
+class Command(BaseCommand):
+    help = 'Delete change journal entries older than the retention window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Retention in days (defaults to CHANGE_JOURNAL RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Entries deleted per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a background worker')
+        parser.add_argument('--interval', type=int, default=86400, help='Seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = change_journal.truncate(older_than_days=options['days'], batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change journal entries'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+"""
+Lightweight operational counters kept in the Django cache.
+Counters are process-independent when the cache backend is shared (Redis, file).
+"""
+
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = 'metrics:'
+METRIC_TIMEOUT = None  # Counters never expire
+
+def incr(name, delta=1):
+    """Increment a counter, creating it on first use"""
+    key = f'{METRIC_PREFIX}{name}'
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Missing key; add() avoids clobbering a concurrent first increment
+        if not cache.add(key, delta, METRIC_TIMEOUT):
+            cache.incr(key, delta)
+    except Exception as e:
+        logger.debug(f"Failed to record metric {name}: {e}")
+
+def get_metrics(names):
+    """Current values for the given counters"""
+    values = cache.get_many([f'{METRIC_PREFIX}{name}' for name in names])
+    return {name: values.get(f'{METRIC_PREFIX}{name}', 0) for name in names}
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0002_add_postgresql_lob_support'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='s3_key',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='s3_upload_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='use_s3',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='storage_type',
+            field=models.CharField(choices=[('cloudinary', 'Cloudinary'), ('postgres_lob', 'PostgreSQL Large Object'), ('local_file', 'Local File System'), ('s3', 'S3 Object Storage')], default='cloudinary', max_length=20),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:22
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_add_s3_storage_support'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackSegment',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('dead_bytes', models.BigIntegerField(default=0)),
+                ('is_sealed', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='storage_type',
+            field=models.CharField(choices=[('cloudinary', 'Cloudinary'), ('postgres_lob', 'PostgreSQL Large Object'), ('local_file', 'Local File System'), ('s3', 'S3 Object Storage'), ('pack', 'Pack File')], default='cloudinary', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='PackEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('offset', models.BigIntegerField()),
+                ('length', models.BigIntegerField()),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('segment', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='files.packsegment')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['segment', 'offset'], name='files_packe_segment_9f3f89_idx')],
+            },
+        ),
+    ]
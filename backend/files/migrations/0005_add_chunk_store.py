@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:24
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_add_pack_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkManifest',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('size_bytes', models.BigIntegerField()),
+                ('chunk_count', models.IntegerField()),
+                ('checksum', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='storage_type',
+            field=models.CharField(choices=[('cloudinary', 'Cloudinary'), ('postgres_lob', 'PostgreSQL Large Object'), ('local_file', 'Local File System'), ('s3', 'S3 Object Storage'), ('pack', 'Pack File'), ('chunked', 'Deduplicated Chunk Store')], default='cloudinary', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ContentChunk',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size_bytes', models.IntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count'], name='files_conte_ref_cou_db45b1_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ManifestChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('offset', models.BigIntegerField()),
+                ('end_offset', models.BigIntegerField()),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='files.contentchunk')),
+                ('manifest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='files.chunkmanifest')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['manifest', 'offset'], name='files_manif_manifes_fc3576_idx')],
+                'unique_together': {('manifest', 'position')},
+            },
+        ),
+    ]
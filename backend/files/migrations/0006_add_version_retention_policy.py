@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0005_add_chunk_store'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionRetentionPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('max_versions', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_age_days', models.PositiveIntegerField(blank=True, null=True)),
+                ('keep_daily_days', models.PositiveIntegerField(blank=True, null=True)),
+                ('keep_weekly_weeks', models.PositiveIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='version_retention_policy', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
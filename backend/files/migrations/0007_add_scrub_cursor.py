@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0006_add_version_retention_policy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrubCursor',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_file_id', models.UUIDField(blank=True, null=True)),
+                ('passes_completed', models.IntegerField(default=0)),
+                ('files_verified', models.BigIntegerField(default=0)),
+                ('files_failed', models.BigIntegerField(default=0)),
+                ('bytes_verified', models.BigIntegerField(default=0)),
+                ('last_pass_completed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
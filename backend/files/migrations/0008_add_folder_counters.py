@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:30
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    from files.folder_counters import folder_counters, COUNTER_FIELDS
+    Folder = apps.get_model('files', 'Folder')
+    File = apps.get_model('files', 'File')
+    counters = folder_counters.compute_from(Folder.objects.all(), File.objects.all())
+    Folder.objects.bulk_update(
+        [Folder(id=folder_id, **values) for folder_id, values in counters.items()],
+        COUNTER_FIELDS, batch_size=500
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_add_scrub_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='files_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='subfolders_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='total_size_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='tree_files_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='tree_size_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0008_add_folder_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['owner', 'folder', 'status', 'modified_at', 'id'], name='file_list_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['owner', 'folder', 'status', 'created_at', 'id'], name='file_list_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['owner', 'folder', 'status', 'name', 'id'], name='file_list_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['owner', 'folder', 'status', 'size_bytes', 'id'], name='file_list_size_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0009_add_file_listing_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='file',
+            name='file_list_modified_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='file_list_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='file_list_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='file_list_size_idx',
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('status', 'ready')), fields=['owner', 'folder', 'modified_at', 'id'], name='file_list_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('status', 'ready')), fields=['owner', 'folder', 'created_at', 'id'], name='file_list_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('status', 'ready')), fields=['owner', 'folder', 'name', 'id'], name='file_list_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('status', 'ready')), fields=['owner', 'folder', 'size_bytes', 'id'], name='file_list_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('status', 'ready')), fields=['owner', 'modified_at', 'id'], name='file_all_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(condition=models.Q(('status', 'ready')), fields=['owner', 'mime_type', 'size_bytes'], name='file_owner_mime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['owner', 'created_at'], name='file_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='share',
+            index=models.Index(fields=['target_user', 'is_active'], name='share_target_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='share',
+            index=models.Index(fields=['file', 'is_active'], name='share_file_active_idx'),
+        ),
+    ]
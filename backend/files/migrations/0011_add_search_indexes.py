@@ -0,0 +1,66 @@
+from django.db import migrations
+
+
+PG_INDEXES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS file_search_tsv_idx ON files_file USING GIN "
+    "(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, ''))) WHERE status = 'ready'",
+    "CREATE INDEX IF NOT EXISTS file_name_trgm_idx ON files_file USING GIN (name gin_trgm_ops) WHERE status = 'ready'",
+    "CREATE INDEX IF NOT EXISTS folder_search_tsv_idx ON files_folder USING GIN (to_tsvector('simple', name))",
+    "CREATE INDEX IF NOT EXISTS folder_name_trgm_idx ON files_folder USING GIN (name gin_trgm_ops)",
+]
+
+PG_DROP = [
+    "DROP INDEX IF EXISTS file_search_tsv_idx",
+    "DROP INDEX IF EXISTS file_name_trgm_idx",
+    "DROP INDEX IF EXISTS folder_search_tsv_idx",
+    "DROP INDEX IF EXISTS folder_name_trgm_idx",
+]
+
+SQLITE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS files_search USING fts5("
+    "name, description, item_id UNINDEXED, kind UNINDEXED, owner_id UNINDEXED, "
+    "folder_id UNINDEXED, mime_type UNINDEXED, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for statement in PG_INDEXES:
+            schema_editor.execute(statement)
+    elif vendor == 'sqlite':
+        from django.db.utils import OperationalError
+        try:
+            schema_editor.execute(SQLITE_FTS)
+        except OperationalError:
+            # SQLite built without FTS5: search falls back to unindexed matching
+            return
+        schema_editor.execute(
+            "INSERT INTO files_search (name, description, item_id, kind, owner_id, folder_id, mime_type) "
+            "SELECT name, description, id, 'file', owner_id, folder_id, mime_type FROM files_file WHERE status = 'ready'"
+        )
+        schema_editor.execute(
+            "INSERT INTO files_search (name, description, item_id, kind, owner_id, folder_id, mime_type) "
+            "SELECT name, '', id, 'folder', owner_id, parent_id, '' FROM files_folder"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for statement in PG_DROP:
+            schema_editor.execute(statement)
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS files_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0010_add_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
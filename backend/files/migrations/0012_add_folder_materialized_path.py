@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:38
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    Folder = apps.get_model('files', 'Folder')
+    parents = dict(Folder.objects.values_list('id', 'parent_id'))
+    children = {}
+    for folder_id, parent_id in parents.items():
+        children.setdefault(parent_id, []).append(folder_id)
+
+    # Walk down from the roots so every parent's path is known before its children
+    updates = []
+    frontier = [(folder_id, '/', 0) for folder_id in children.get(None, [])]
+    while frontier:
+        folder_id, parent_path, depth = frontier.pop()
+        path = f'{parent_path}{folder_id.hex}/'
+        updates.append(Folder(id=folder_id, path=path, depth=depth))
+        frontier.extend((child, path, depth + 1) for child in children.get(folder_id, []))
+    Folder.objects.bulk_update(updates, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0011_add_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='depth',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(db_index=True, default='', max_length=2600),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_user_stats(apps, schema_editor):
+    from files.user_stats import user_stats
+    File = apps.get_model('files', 'File')
+    Folder = apps.get_model('files', 'Folder')
+    UserStats = apps.get_model('files', 'UserStats')
+    UserDailyStats = apps.get_model('files', 'UserDailyStats')
+    rollups, buckets = user_stats.compute_from(File.objects.all(), Folder.objects.all())
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id, **values) for user_id, values in rollups.items()], batch_size=500
+    )
+    UserDailyStats.objects.bulk_create(
+        [UserDailyStats(user_id=user_id, day=day, **values) for (user_id, day), values in buckets.items()],
+        batch_size=500
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+        ('files', '0013_add_bulk_folder_deletion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='file_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('files_count', models.IntegerField(default=0)),
+                ('folders_count', models.IntegerField(default=0)),
+                ('total_size_bytes', models.BigIntegerField(default=0)),
+                ('documents_bytes', models.BigIntegerField(default=0)),
+                ('images_bytes', models.BigIntegerField(default=0)),
+                ('videos_bytes', models.BigIntegerField(default=0)),
+                ('audio_bytes', models.BigIntegerField(default=0)),
+                ('other_bytes', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('uploads', models.IntegerField(default=0)),
+                ('uploaded_bytes', models.BigIntegerField(default=0)),
+                ('downloads', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_file_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'day')},
+            },
+        ),
+        migrations.RunPython(populate_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0014_add_user_stats_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='change_version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='change_version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0016_add_change_journal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='share',
+            index=models.Index(fields=['target_user', 'is_active', 'created_at', 'id'], name='share_target_recent_idx'),
+        ),
+    ]
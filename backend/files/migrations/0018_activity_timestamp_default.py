@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0017_add_share_target_recent_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:25
+
+from datetime import timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def populate_months(apps, schema_editor):
+    Activity = apps.get_model('files', 'Activity')
+    Activity.objects.update(
+        month=ExtractYear('timestamp', tzinfo=timezone.utc) * 100 + ExtractMonth('timestamp', tzinfo=timezone.utc)
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0018_activity_timestamp_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='month',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_months, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['month', 'id'], name='activity_month_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def populate_seq(apps, schema_editor):
+    # Existing cursors are global ids: seq = id keeps them valid and is increasing per user
+    ChangeJournalEntry = apps.get_model('files', 'ChangeJournalEntry')
+    ChangeJournalCounter = apps.get_model('files', 'ChangeJournalCounter')
+    ChangeJournalEntry.objects.update(seq=F('id'))
+    ChangeJournalCounter.objects.bulk_create([
+        ChangeJournalCounter(user_id=user_id, last_seq=last_seq)
+        for user_id, last_seq in ChangeJournalEntry.objects.order_by().values('user_id').annotate(
+            last=Max('id')
+        ).values_list('user_id', 'last')
+    ], batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0019_activity_month_bucket'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeJournalCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='change_journal_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='changejournalentry',
+            name='seq',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_seq, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='changejournalentry',
+            name='journal_user_seq_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='changejournalentry',
+            constraint=models.UniqueConstraint(fields=('user', 'seq'), name='journal_user_seq_uniq'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:40
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def populate_storage_types(apps, schema_editor):
+    # Derived from the key prefix, as storage_utils.storage_backend_for_key does
+    FileVersion = apps.get_model('files', 'FileVersion')
+    prefixes = (('lob/', 'postgres_lob'), ('s3/', 's3'), ('pack/', 'pack'), ('cas/', 'chunked'), ('filora/', 'cloudinary'))
+    FileVersion.objects.update(storage_type=Case(
+        *[When(storage_key__startswith=prefix, then=Value(storage_type)) for prefix, storage_type in prefixes],
+        default=Value('local_file'),
+    ))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0020_change_journal_user_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileversion',
+            name='storage_type',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.RunPython(populate_storage_types, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:20
+
+from django.db import migrations
+from django.db.models import F
+
+
+def use_stored_names_as_keys(apps, schema_editor):
+    # Local uploads got a made-up key next to their real storage name
+    File = apps.get_model('files', 'File')
+    File.objects.filter(storage_key__startswith='files/').exclude(file='').exclude(file__isnull=True).update(storage_key=F('file'))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0021_fileversion_storage_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(use_stored_names_as_keys, migrations.RunPython.noop),
+    ]
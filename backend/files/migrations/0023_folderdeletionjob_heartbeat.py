@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    # Keep the oldest active job per folder; the constraint allows only one
+    FolderDeletionJob = apps.get_model('files', 'FolderDeletionJob')
+    seen = set()
+    duplicates = []
+    for job_id, folder_id in FolderDeletionJob.objects.filter(status__in=['pending', 'running']).order_by('created_at').values_list('id', 'folder_id'):
+        if folder_id in seen:
+            duplicates.append(job_id)
+        seen.add(folder_id)
+    FolderDeletionJob.objects.filter(id__in=duplicates).update(status='failed', error='Duplicate of an active job for the same folder')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0022_local_file_storage_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folderdeletionjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='folderdeletionjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('folder_id',), name='folder_deletion_active_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:40
+
+from datetime import timezone
+from django.db import migrations, models
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def populate_missing_months(apps, schema_editor):
+    # Rows written without save() kept the old default of 0 and looked expired
+    Activity = apps.get_model('files', 'Activity')
+    Activity.objects.filter(month=0).update(
+        month=ExtractYear('timestamp', tzinfo=timezone.utc) * 100 + ExtractMonth('timestamp', tzinfo=timezone.utc)
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0023_folderdeletionjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_missing_months, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='activity',
+            name='month',
+            field=models.IntegerField(),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0024_activity_month_required'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='object_type',
+            field=models.CharField(choices=[('file', 'File'), ('folder', 'Folder'), ('share', 'Share'), ('token', 'API Token'), ('webhook', 'Webhook'), ('batch', 'Batch Operation')], max_length=20),
+        ),
+    ]
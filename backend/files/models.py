@@ -1,11 +1,13 @@
 import os
 import uuid
-from django.db import models
+from datetime import timezone as dt_timezone
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
 from django.core.mail import send_mail
 from django.conf import settings
+from .cache_utils import bump_generation
 
 User = get_user_model()
 
@@ -20,15 +22,102 @@ class Folder(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Materialized counters, maintained by folder_counters (ready files only)
+    files_count = models.IntegerField(default=0)
+    subfolders_count = models.IntegerField(default=0)
+    total_size_bytes = models.BigIntegerField(default=0)
+    tree_files_count = models.IntegerField(default=0)  # Including all subfolders
+    tree_size_bytes = models.BigIntegerField(default=0)
+    
+    # Materialized path: '/<root id>/.../<own id>/' (hex ids), so ancestors are read
+    # from the path and a subtree is one prefix scan (on PostgreSQL through the
+    # varchar_pattern_ops index Django adds next to db_index)
+    path = models.CharField(max_length=2600, default='', db_index=True)
+    depth = models.IntegerField(default=0)
+    
+    # Bumped whenever anything this folder's listing shows changes (see change_versions.py)
+    change_version = models.BigIntegerField(default=0)
+    
+    MAX_DEPTH = 64  # Keeps paths within the index entry size limit
+    
     class Meta:
         unique_together = ['name', 'owner', 'parent']
     
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+    
+    @staticmethod
+    def subtree_q(path):
+        """Folders at or below `path`; a prefix match holds whatever the database collation"""
+        return models.Q(path__startswith=path)
+    
+    def ancestor_ids(self, include_self=False):
+        """Ids from the root down, read from the path without a query"""
+        ids = [uuid.UUID(part) for part in self.path.strip('/').split('/') if part]
+        return ids if include_self else ids[:-1]
+    
+    def get_ancestors(self, include_self=False):
+        return Folder.objects.filter(id__in=self.ancestor_ids(include_self)).order_by('depth')
+    
+    def get_descendants(self, include_self=False):
+        descendants = Folder.objects.filter(self.subtree_q(self.path))
+        return descendants if include_self else descendants.exclude(id=self.id)
+    
+    def is_ancestor_of(self, folder):
+        return folder.path.startswith(self.path)
+    
+    def _parent_path(self):
+        if not self.parent_id:
+            return '/', -1
+        return Folder.objects.filter(id=self.parent_id).values_list('path', 'depth').get()
+    
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        super().save(*args, **kwargs)
+        from .folder_counters import folder_counters, COUNTER_FIELDS
+        is_new = self._state.adding
+        old_parent_id = getattr(self, '_loaded_parent_id', None)
+        moved = not is_new and self.parent_id != old_parent_id
+        if is_new:
+            parent_path, parent_depth = self._parent_path()
+            self.path = f'{parent_path}{self.id.hex}/'
+            self.depth = parent_depth + 1
+        elif kwargs.get('update_fields') is None:
+            # Counters and the path are written with bulk UPDATEs; never let a stale instance overwrite them
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in COUNTER_FIELDS + ('path', 'depth', 'change_version')
+            ]
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if moved:
+                self._move_subtree()
+            from .change_journal import change_journal
+            change_journal.folder_saved(self, created=is_new)
+        
+        if is_new:
+            folder_counters.folder_created(self)
+        elif moved:
+            folder_counters.folder_moved(self, old_parent_id)
+        self._loaded_parent_id = self.parent_id
+        
+        from .search import search_index
+        search_index.folder_changed(self)
+        if is_new:
+            from .user_stats import user_stats
+            user_stats.folder_created(self.owner_id)
+        self._bump_change_versions(is_new, moved, old_parent_id)
+        self._loaded_name = self.name
+        bump_generation(self.owner_id)
+        if moved:
+            from .permissions import access_resolver
+            access_resolver.owner_changed(self.owner_id)  # Inherited folder shares changed below it
         
         # Trigger webhook event for new folders
         if is_new:
@@ -45,6 +134,47 @@ class Folder(models.Model):
                 )
             except ImportError:
                 pass
+    
+    def _bump_change_versions(self, is_new, moved, old_parent_id):
+        from .change_versions import change_versions
+        if is_new:
+            change_versions.folders_changed(self.owner_id, [self.parent_id])
+        elif moved or self.name != getattr(self, '_loaded_name', self.name):
+            change_versions.subtree_changed(self)
+            if moved:
+                change_versions.folders_changed(self.owner_id, [old_parent_id])
+        else:
+            change_versions.folders_changed(self.owner_id, [self.id])
+    
+    def _move_subtree(self):
+        """Rewrite the path prefix and depth of this folder and all its descendants"""
+        from django.db.models.functions import Concat, Substr
+        old_path, old_depth = Folder.objects.filter(id=self.id).values_list('path', 'depth').get()
+        parent_path, parent_depth = self._parent_path()
+        new_path = f'{parent_path}{self.id.hex}/'
+        Folder.objects.filter(self.subtree_q(old_path)).update(
+            path=Concat(models.Value(new_path), Substr('path', len(old_path) + 1), output_field=models.CharField()),
+            depth=models.F('depth') + (parent_depth + 1 - old_depth)
+        )
+        self.path, self.depth = new_path, parent_depth + 1
+    
+    def delete(self, *args, **kwargs):
+        from .folder_counters import folder_counters
+        from .search import search_index
+        from .user_stats import user_stats
+        from .change_journal import change_journal
+        with transaction.atomic():
+            folder_counters.folder_deleted(self.id, self.parent_id)
+            user_stats.folder_tree_deleted(self)
+            change_journal.folder_tree_deleted(self)
+            search_index.remove_folder_tree(self.id)
+            result = super().delete(*args, **kwargs)
+            from .change_versions import change_versions
+            change_versions.folders_changed(self.owner_id, [self.parent_id])
+        bump_generation(self.owner_id)
+        return result
+
+READY = models.Q(status='ready')
 
 class File(models.Model):
     STATUS_CHOICES = [
@@ -72,6 +202,9 @@ class File(models.Model):
         ('cloudinary', 'Cloudinary'),
         ('postgres_lob', 'PostgreSQL Large Object'),
         ('local_file', 'Local File System'),
+        ('s3', 'S3 Object Storage'),
+        ('pack', 'Pack File'),
+        ('chunked', 'Deduplicated Chunk Store'),
     ])
     
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='files')
@@ -92,6 +225,17 @@ class File(models.Model):
     
     class Meta:
         ordering = ['-modified_at']
+        # Listings only ever show ready files, so the hot indexes are partial on status='ready'.
+        # Each listing sort has an (owner, folder, sort value, id) index for keyset pagination.
+        indexes = [
+            models.Index(fields=['owner', 'folder', 'modified_at', 'id'], name='file_list_modified_idx', condition=READY),
+            models.Index(fields=['owner', 'folder', 'created_at', 'id'], name='file_list_created_idx', condition=READY),
+            models.Index(fields=['owner', 'folder', 'name', 'id'], name='file_list_name_idx', condition=READY),
+            models.Index(fields=['owner', 'folder', 'size_bytes', 'id'], name='file_list_size_idx', condition=READY),
+            models.Index(fields=['owner', 'modified_at', 'id'], name='file_all_modified_idx', condition=READY),
+            models.Index(fields=['owner', 'mime_type', 'size_bytes'], name='file_owner_mime_idx', condition=READY),  # Covers usage totals
+            models.Index(fields=['owner', 'created_at'], name='file_owner_created_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -100,14 +244,35 @@ class File(models.Model):
     def file_extension(self):
         return os.path.splitext(self.name)[1].lower()
     
+    @property
+    def s3_object_key(self):
+        """Object key inside the S3 bucket (storage_key is 's3/<object key>')"""
+        if self.storage_type == 's3' and self.storage_key.startswith('s3/'):
+            return self.storage_key[len('s3/'):]
+        return None
+    
+    @property
+    def pack_entry_id(self):
+        """PackEntry id for pack-stored files (storage_key is 'pack/<entry id>')"""
+        if self.storage_type == 'pack' and self.storage_key.startswith('pack/'):
+            return self.storage_key[len('pack/'):]
+        return None
+    
+    @property
+    def chunk_manifest_id(self):
+        """ChunkManifest id for chunk-stored files (storage_key is 'cas/<manifest id>')"""
+        if self.storage_type == 'chunked' and self.storage_key.startswith('cas/'):
+            return self.storage_key[len('cas/'):]
+        return None
+    
     @property
     def file_url(self):
-        """Get the file URL - prioritize Cloudinary, then PostgreSQL LOB, then local"""
+        """Get the file URL - prioritize Cloudinary, then PostgreSQL LOB / S3 / pack / chunks, then local"""
         if self.cloudinary_secure_url:
             return self.cloudinary_secure_url
         elif self.cloudinary_url:
             return self.cloudinary_url
-        elif self.postgres_lob_oid:
+        elif self.postgres_lob_oid or self.storage_type in ('s3', 'pack', 'chunked'):
             # Return URL for PostgreSQL LOB download endpoint
             return f'/api/files/{self.id}/download/'
         elif self.file:
@@ -117,7 +282,7 @@ class File(models.Model):
     @property
     def download_url(self):
         """Get the download URL"""
-        if self.postgres_lob_oid:
+        if self.postgres_lob_oid or self.storage_type in ('s3', 'pack', 'chunked'):
             return f'/api/files/{self.id}/download/'
         return self.file_url
     
@@ -152,25 +317,74 @@ class File(models.Model):
         """Get preview URL for streaming/viewing"""
         if not self.can_preview:
             return None
+        if self.storage_type == 's3':
+            from .s3_utils import s3_manager
+            return s3_manager.generate_presigned_url(
+                self.s3_object_key, filename=self.name, content_type=self.mime_type, inline=True
+            )
         # In production, this would generate streaming-friendly signed URLs
         return f'/media/{self.file.name}'
     
     def get_signed_url(self, expires_in=3600):
         """Generate signed URL for secure file access"""
-        # In production, this would generate S3 signed URLs
+        if self.storage_type == 's3':
+            from .s3_utils import s3_manager
+            return s3_manager.generate_presigned_url(
+                self.s3_object_key, expires_in=expires_in, filename=self.name
+            )
         return f'/media/{self.file.name}'
     
     def increment_download_count(self):
         self.download_count += 1
         self.last_accessed = timezone.now()
         self.save(update_fields=['download_count', 'last_accessed'])
+        from .user_stats import user_stats
+        user_stats.download(self.owner_id)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counter_state = instance.counter_state()
+        instance._stats_state = instance.stats_state()
+        instance._access_state = instance.access_state()
+        return instance
+    
+    def access_state(self):
+        """(folder_id, is_public): what effective permissions of other users depend on"""
+        return (self.__dict__.get('folder_id'), self.__dict__.get('is_public'))
+    
+    def counter_state(self):
+        """(folder_id, is_ready, size_bytes) as seen by the folder counters"""
+        return (self.__dict__.get('folder_id'), self.__dict__.get('status') == 'ready', self.__dict__.get('size_bytes') or 0)
+    
+    def _update_folder_counters(self, update_fields=None):
+        from .folder_counters import folder_counters
+        if update_fields is not None and not {'folder', 'folder_id', 'status', 'size_bytes'} & set(update_fields):
+            return
+        before = getattr(self, '_counter_state', None)
+        after = self.counter_state()
+        folder_counters.file_transition(before, after)
+        self._counter_state = after
+    
+    def stats_state(self):
+        from .user_stats import file_state
+        return file_state(*(self.__dict__.get(f) for f in ('status', 'size_bytes', 'mime_type', 'created_at')))
+    
+    def _update_user_stats(self, update_fields=None):
+        from .user_stats import user_stats
+        if update_fields is not None and not {'status', 'size_bytes', 'mime_type'} & set(update_fields):
+            return
+        before = getattr(self, '_stats_state', None)
+        after = self.stats_state()
+        user_stats.file_transition(self.owner_id, before, after)
+        self._stats_state = after
     
     def save(self, *args, **kwargs):
         is_new = self.pk is None
         old_version = None
         
         # Store old version if file is being updated
-        if not is_new and self.status == 'ready':
+        if not is_new and self.status == 'ready' and not getattr(self, '_version_recorded', False):
             try:
                 old_file = File.objects.get(pk=self.pk)
                 if old_file.file != self.file:  # File content changed
@@ -179,6 +393,7 @@ class File(models.Model):
                         file=self,
                         version_number=self.version,
                         storage_key=old_file.storage_key,
+                        storage_type=old_file.storage_type,
                         size_bytes=old_file.size_bytes,
                         checksum=old_file.checksum,
                         created_by=getattr(self, '_updated_by', self.owner)
@@ -187,11 +402,31 @@ class File(models.Model):
                     old_version = True
             except File.DoesNotExist:
                 pass
+        elif getattr(self, '_version_recorded', False):
+            old_version = True
         
-        super().save(*args, **kwargs)
+        previous_folder_id = getattr(self, '_counter_state', (self.folder_id,))[0]
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Download bookkeeping is not a change sync clients need to see
+            if not set(kwargs.get('update_fields') or ['*']) <= {'download_count', 'last_accessed'}:
+                from .change_journal import change_journal
+                change_journal.file_saved(self, created=adding)
+        self._update_folder_counters(kwargs.get('update_fields'))
+        self._update_user_stats(kwargs.get('update_fields'))
+        from .search import search_index
+        from .change_versions import change_versions
+        search_index.file_changed(self, kwargs.get('update_fields'))
+        change_versions.folders_changed(self.owner_id, {previous_folder_id, self.folder_id})
+        bump_generation(self.owner_id)
+        if not adding and getattr(self, '_access_state', None) != self.access_state():
+            from .permissions import access_resolver
+            access_resolver.owner_changed(self.owner_id)
+        self._access_state = self.access_state()
         
         # Create activity log
-        self._log_activity(is_new, old_version)
+        self._log_activity(is_new, old_version, kwargs.get('update_fields'))
         
         # Trigger webhook events
         if is_new and self.status == 'ready':
@@ -211,12 +446,25 @@ class File(models.Model):
             except ImportError:
                 pass
     
-    def _log_activity(self, is_new, old_version):
-        """Log file activity"""
+    def _log_activity(self, is_new, old_version, update_fields=None):
+        """
+        Log file activity through the audit sink. Callers describe their change
+        (renamed, moved, downloaded...) by setting _activity to a dict of action,
+        metadata and meta (request.META) before saving, instead of writing a
+        second entry of their own.
+        """
+        override = getattr(self, '_activity', None) or {}
+        self._activity = None
+        # Download bookkeeping on its own is not an update
+        if not override.get('action') and set(update_fields or ['*']) <= {'download_count', 'last_accessed'}:
+            return
         try:
-            user = getattr(self, '_updated_by', self.owner)
+            user_id = getattr(getattr(self, '_updated_by', None), 'id', None) or self.owner_id
             
-            if is_new:
+            if override.get('action'):
+                action = override['action']
+                metadata = {'file_name': self.name, **override.get('metadata', {})}
+            elif is_new:
                 action = 'created'
                 metadata = {
                     'file_name': self.name,
@@ -237,13 +485,8 @@ class File(models.Model):
                     'file_size': self.size_bytes
                 }
             
-            Activity.objects.create(
-                user=user,
-                object_type='file',
-                object_id=self.id,
-                action=action,
-                metadata=metadata
-            )
+            from .audit import audit_sink
+            audit_sink.log(user_id, 'file', self.id, action, metadata, meta=override.get('meta'))
         except Exception:
             pass  # Don't fail file save if activity logging fails
     
@@ -259,19 +502,55 @@ class File(models.Model):
                 logger = logging.getLogger(__name__)
                 logger.warning(f"Failed to cleanup PostgreSQL LOB {self.postgres_lob_oid} for file {self.name}: {e}")
         
+        # Clean up S3 object before deletion
+        if self.storage_type == 's3' and self.s3_object_key:
+            try:
+                from .s3_utils import s3_manager
+                s3_manager.delete_object(self.s3_object_key)
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Failed to cleanup S3 object {self.s3_object_key} for file {self.name}: {e}")
+        
+        # Release pack entry; the bytes are reclaimed by pack compaction
+        if self.storage_type == 'pack' and self.pack_entry_id:
+            try:
+                from .pack_utils import pack_manager
+                pack_manager.delete_entry(self.pack_entry_id)
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Failed to release pack entry {self.pack_entry_id} for file {self.name}: {e}")
+        
+        # Release chunk manifests of the current content and every version;
+        # restored versions share a manifest with the file, so release each once
+        manifest_keys = set(self.versions.filter(storage_key__startswith='cas/').values_list('storage_key', flat=True))
+        if self.chunk_manifest_id:
+            manifest_keys.add(self.storage_key)
+        if manifest_keys:
+            from .chunk_store import chunk_store
+            for key in manifest_keys:
+                try:
+                    chunk_store.release(key[len('cas/'):])
+                except Exception as e:
+                    import logging
+                    logger = logging.getLogger(__name__)
+                    logger.warning(f"Failed to release chunk manifest {key} for file {self.name}: {e}")
+        
         # Log activity before deletion
         try:
-            user = getattr(self, '_deleted_by', self.owner)
-            Activity.objects.create(
-                user=user,
-                object_type='file',
-                object_id=self.id,
-                action='deleted',
-                metadata={
+            from .audit import audit_sink
+            audit_sink.log(
+                getattr(getattr(self, '_deleted_by', None), 'id', None) or self.owner_id,
+                'file',
+                self.id,
+                'deleted',
+                {
                     'file_name': self.name,
                     'file_size': self.size_bytes,
                     'mime_type': self.mime_type
-                }
+                },
+                meta=(getattr(self, '_activity', None) or {}).get('meta')
             )
         except Exception:
             pass
@@ -292,7 +571,46 @@ class File(models.Model):
         except ImportError:
             pass
         
-        super().delete(*args, **kwargs)
+        before = getattr(self, '_counter_state', self.counter_state())
+        stats_before = getattr(self, '_stats_state', self.stats_state())
+        file_id = self.id
+        from .change_journal import change_journal
+        with transaction.atomic():
+            change_journal.shares_removed(Share.objects.filter(file_id=file_id))
+            change_journal.record(self.owner_id, 'file', file_id, 'deleted')
+            super().delete(*args, **kwargs)
+        
+        from .folder_counters import folder_counters
+        from .search import search_index
+        from .user_stats import user_stats
+        folder_counters.file_transition(before, None)
+        user_stats.file_transition(self.owner_id, stats_before, None)
+        from .change_versions import change_versions
+        change_versions.folders_changed(self.owner_id, [before[0]])
+        search_index.remove([file_id])
+        bump_generation(self.owner_id)
+    
+    def replace_content(self, user, **storage_fields):
+        """Replace file content, keeping the current content as a version"""
+        FileVersion.objects.create(
+            file=self,
+            version_number=self.version,
+            storage_key=self.storage_key,
+            storage_type=self.storage_type,
+            size_bytes=self.size_bytes,
+            checksum=self.checksum,
+            created_by=user
+        )
+        
+        for field, value in storage_fields.items():
+            setattr(self, field, value)
+        self.version += 1
+        self._updated_by = user
+        self._version_recorded = True
+        try:
+            self.save()
+        finally:
+            self._version_recorded = False
     
     def restore_version(self, version_id, user):
         """Restore file to a specific version"""
@@ -304,33 +622,28 @@ class File(models.Model):
                 file=self,
                 version_number=self.version,
                 storage_key=self.storage_key,
+                storage_type=self.storage_type,
                 size_bytes=self.size_bytes,
                 checksum=self.checksum,
                 created_by=user
             )
             
-            # Restore from version
+            # Restore from version; the storage type decides how the key is read back
+            from .storage_utils import storage_backend_for_key
             self.storage_key = version.storage_key
+            self.storage_type = version.storage_type or storage_backend_for_key(version.storage_key)
+            self.postgres_lob_oid = int(version.storage_key.split('/', 1)[1]) if self.storage_type == 'postgres_lob' else None
             self.size_bytes = version.size_bytes
             self.checksum = version.checksum
             self.version += 1
             self._updated_by = user
+            self._activity = {
+                'action': 'restored',
+                'metadata': {'restored_from_version': version.version_number, 'new_version': self.version}
+            }
             
             self.save()
             
-            # Log restore activity
-            Activity.objects.create(
-                user=user,
-                object_type='file',
-                object_id=self.id,
-                action='restored',
-                metadata={
-                    'file_name': self.name,
-                    'restored_from_version': version.version_number,
-                    'new_version': self.version
-                }
-            )
-            
             return True
         except FileVersion.DoesNotExist:
             return False
@@ -340,6 +653,7 @@ class FileVersion(models.Model):
     file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='versions')
     version_number = models.IntegerField()
     storage_key = models.CharField(max_length=500)
+    storage_type = models.CharField(max_length=20, blank=True, default='')  # File.storage_type of this content
     size_bytes = models.BigIntegerField()
     checksum = models.CharField(max_length=64, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -364,6 +678,161 @@ class FileVersion(models.Model):
             self.size_bytes /= 1024.0
         return f"{self.size_bytes:.1f} TB"
 
+class VersionRetentionPolicy(models.Model):
+    """Per-user override of settings.VERSION_RETENTION; null fields use the site default"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='version_retention_policy')
+    max_versions = models.PositiveIntegerField(null=True, blank=True)
+    max_age_days = models.PositiveIntegerField(null=True, blank=True)
+    keep_daily_days = models.PositiveIntegerField(null=True, blank=True)  # Keep newest version per day
+    keep_weekly_weeks = models.PositiveIntegerField(null=True, blank=True)  # Keep newest version per week
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Retention policy for {self.user.email}"
+
+class ScrubCursor(models.Model):
+    """Persisted resume point and running totals of the integrity scrubber"""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_file_id = models.UUIDField(null=True, blank=True)  # Files are scrubbed in id order
+    passes_completed = models.IntegerField(default=0)
+    files_verified = models.BigIntegerField(default=0)
+    files_failed = models.BigIntegerField(default=0)
+    bytes_verified = models.BigIntegerField(default=0)
+    last_pass_completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Scrub cursor {self.name} at {self.last_file_id}"
+
+class FolderDeletionJob(models.Model):
+    """Progress of a bulk folder deletion running outside the request"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='folder_deletion_jobs')
+    folder_id = models.UUIDField()  # Not a foreign key: the folder is gone once the job completes
+    folder_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    folders_total = models.IntegerField(default=0)
+    files_total = models.IntegerField(default=0)
+    files_deleted = models.IntegerField(default=0)
+    bytes_deleted = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Heartbeat: stale pending/running jobs are resumed
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    ACTIVE_STATUSES = ('pending', 'running')
+    
+    class Meta:
+        constraints = [
+            # One active job per folder
+            models.UniqueConstraint(
+                fields=['folder_id'], condition=models.Q(status__in=['pending', 'running']), name='folder_deletion_active_uniq'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Delete {self.folder_name} ({self.status})"
+
+class StorageReclaimTask(models.Model):
+    """Stored content queued for release after its rows were bulk-deleted"""
+    storage_key = models.CharField(max_length=500)
+    size_bytes = models.BigIntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['attempts', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"Reclaim {self.storage_key}"
+
+class ChangeJournalEntry(models.Model):
+    """One file, folder or share mutation in a user's change journal; seq is the user's sync sequence"""
+    OBJECT_TYPE_CHOICES = [
+        ('file', 'File'),
+        ('folder', 'Folder'),
+        ('share', 'Share'),
+    ]
+    
+    OPERATION_CHOICES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='change_journal')
+    seq = models.BigIntegerField()
+    object_type = models.CharField(max_length=10, choices=OBJECT_TYPE_CHOICES)
+    object_id = models.UUIDField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'seq'], name='journal_user_seq_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.seq} {self.object_type} {self.object_id} {self.operation}"
+
+class ChangeJournalCounter(models.Model):
+    """Last sequence handed out in a user's journal; locked by writers until they commit"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='change_journal_counter')
+    last_seq = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user} journal at #{self.last_seq}"
+
+class ChangeJournalTruncation(models.Model):
+    """Highest sequence truncated from a user's journal; older cursors must resync"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='change_journal_truncation')
+    through_seq = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user} journal truncated through #{self.through_seq}"
+
+class UserStats(models.Model):
+    """Per-user storage rollup, maintained by user_stats (ready files only)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='file_stats')
+    files_count = models.IntegerField(default=0)
+    folders_count = models.IntegerField(default=0)
+    total_size_bytes = models.BigIntegerField(default=0)
+    documents_bytes = models.BigIntegerField(default=0)
+    images_bytes = models.BigIntegerField(default=0)
+    videos_bytes = models.BigIntegerField(default=0)
+    audio_bytes = models.BigIntegerField(default=0)
+    other_bytes = models.BigIntegerField(default=0)
+    change_version = models.BigIntegerField(default=0)  # Root and all-files listings, see change_versions.py
+
+    def __str__(self):
+        return f"Stats for {self.user}"
+
+class UserDailyStats(models.Model):
+    """Per-user daily buckets: ready files by creation day and downloads by day"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_file_stats')
+    day = models.DateField()
+    uploads = models.IntegerField(default=0)
+    uploaded_bytes = models.BigIntegerField(default=0)
+    downloads = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'day']
+
+    def __str__(self):
+        return f"{self.user} on {self.day}"
+
 class Activity(models.Model):
     OBJECT_TYPE_CHOICES = [
         ('file', 'File'),
@@ -371,6 +840,7 @@ class Activity(models.Model):
         ('share', 'Share'),
         ('token', 'API Token'),
         ('webhook', 'Webhook'),
+        ('batch', 'Batch Operation'),
     ]
     
     ACTION_CHOICES = [
@@ -393,19 +863,35 @@ class Activity(models.Model):
     metadata = models.JSONField(default=dict, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Set when logged, not when the audit sink writes it
+    # UTC month of the timestamp as YYYYMM: queries prune by it and retention archives a month at a time.
+    # No default: every writer sets it (save(), audit_sink), a row without it fails instead of looking expired
+    month = models.IntegerField()
     
     class Meta:
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['user', '-timestamp']),
             models.Index(fields=['object_type', 'object_id', '-timestamp']),
+            models.Index(fields=['month', 'id'], name='activity_month_idx'),
         ]
     
+    @staticmethod
+    def month_of(value):
+        value = value.astimezone(dt_timezone.utc)
+        return value.year * 100 + value.month
+    
+    def save(self, *args, **kwargs):
+        self.month = Activity.month_of(self.timestamp)
+        super().save(*args, **kwargs)
+        bump_generation(self.user_id)  # Recent activity is part of cached dashboard responses
+    
     def __str__(self):
         return f"{self.user.email} {self.action} {self.object_type} {self.object_id}"
 
 class FileActivity(models.Model):
+    """Per-file history written before audit.py; new entries go to Activity"""
+    
     ACTION_CHOICES = [
         ('created', 'Created'),
         ('updated', 'Updated'),
@@ -456,12 +942,86 @@ class UploadSession(models.Model):
     total_bytes_written = models.BigIntegerField(default=0)  # Track progress
     use_postgres_lob = models.BooleanField(default=False)  # Flag to use LOB storage
     
+    # S3 multipart upload tracking
+    use_s3 = models.BooleanField(default=False)  # Flag to use S3 multipart storage
+    s3_key = models.CharField(max_length=500, blank=True)  # Object key being uploaded
+    s3_upload_id = models.CharField(max_length=255, blank=True)  # S3 multipart UploadId
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.filename} - {self.status}"
 
+class PackSegment(models.Model):
+    """Append-only file holding many small files back to back"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    path = models.CharField(max_length=255, unique=True)  # Relative to PACK_STORAGE['ROOT']
+    size_bytes = models.BigIntegerField(default=0)
+    dead_bytes = models.BigIntegerField(default=0)  # Bytes owned by deleted entries
+    is_sealed = models.BooleanField(default=False)  # Full segments take no more appends
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.path} ({self.size_bytes} bytes)"
+
+class PackEntry(models.Model):
+    """(offset, length) index of a file inside a pack segment"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    segment = models.ForeignKey(PackSegment, on_delete=models.PROTECT, related_name='entries')
+    offset = models.BigIntegerField()
+    length = models.BigIntegerField()
+    is_deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['segment', 'offset']),
+        ]
+    
+    def __str__(self):
+        return f"{self.segment.path}@{self.offset}+{self.length}"
+
+class ContentChunk(models.Model):
+    """Unique content-defined chunk, stored once and shared by reference"""
+    digest = models.CharField(max_length=64, primary_key=True)  # SHA-256 of the chunk
+    size_bytes = models.IntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count']),
+        ]
+    
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.size_bytes} bytes, {self.ref_count} refs)"
+
+class ChunkManifest(models.Model):
+    """Ordered list of chunks making up one file or version"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    size_bytes = models.BigIntegerField()
+    chunk_count = models.IntegerField()
+    checksum = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Manifest {self.id} ({self.chunk_count} chunks)"
+
+class ManifestChunk(models.Model):
+    manifest = models.ForeignKey(ChunkManifest, on_delete=models.CASCADE, related_name='entries')
+    position = models.IntegerField()
+    chunk = models.ForeignKey(ContentChunk, on_delete=models.PROTECT, related_name='+')
+    offset = models.BigIntegerField()  # Cumulative offset of the chunk within the manifest
+    end_offset = models.BigIntegerField()
+    
+    class Meta:
+        unique_together = ['manifest', 'position']
+        indexes = [
+            models.Index(fields=['manifest', 'offset']),
+        ]
+
 class Share(models.Model):
     SHARE_TYPE_CHOICES = [
         ('public', 'Public Link'),
@@ -490,13 +1050,23 @@ class Share(models.Model):
     
     class Meta:
         unique_together = [['file', 'target_user'], ['folder', 'target_user']]
+        indexes = [
+            models.Index(fields=['target_user', 'is_active'], name='share_target_active_idx'),
+            models.Index(fields=['target_user', 'is_active', 'created_at', 'id'], name='share_target_recent_idx'),  # Shared-with-me pages
+            models.Index(fields=['file', 'is_active'], name='share_file_active_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if self.share_type == 'public' and not self.token:
             self.token = uuid.uuid4().hex
         
         is_new = self.pk is None
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        from .change_journal import change_journal
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            change_journal.share_changed(self, 'created' if adding else 'updated')
+        self._bump_generations()
         
         # Trigger webhook event for new shares
         if is_new:
@@ -517,6 +1087,34 @@ class Share(models.Model):
             except ImportError:
                 pass
     
+    def delete(self, *args, **kwargs):
+        from .change_journal import change_journal
+        with transaction.atomic():
+            change_journal.share_changed(self, 'deleted')
+            result = super().delete(*args, **kwargs)
+        self._bump_generations()
+        return result
+    
+    def _bump_generations(self):
+        from .permissions import access_resolver
+        # The target's shared-with-me listing changes along with the actor's data
+        bump_generation(self.actor_id)
+        access_resolver.owner_changed(self.actor_id)
+        if self.target_user_id:
+            bump_generation(self.target_user_id)
+        if self.file_id:
+            # Listings show each file's active share count
+            from .change_versions import change_versions
+            file_info = File.objects.filter(id=self.file_id).values_list('owner_id', 'folder_id').first()
+            if file_info:
+                change_versions.folders_changed(file_info[0], [file_info[1]])
+                if file_info[0] != self.actor_id:
+                    access_resolver.owner_changed(file_info[0])
+        elif self.folder_id:
+            owner_id = Folder.objects.filter(id=self.folder_id).values_list('owner_id', flat=True).first()
+            if owner_id and owner_id != self.actor_id:
+                access_resolver.owner_changed(owner_id)
+    
     def is_expired(self):
         if self.expires_at:
             return timezone.now() > self.expires_at
@@ -545,6 +1143,20 @@ class Invite(models.Model):
     expires_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._bump_generations()
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._bump_generations()
+        return result
+    
+    def _bump_generations(self):
+        from .permissions import access_resolver
+        bump_generation(self.actor_id)
+        access_resolver.owner_changed(self.actor_id)  # Pending invites grant access once the email registers
+    
     def get_item(self):
         return self.file or self.folder
     
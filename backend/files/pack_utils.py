@@ -0,0 +1,178 @@
+"""
+Pack-file storage for small files.
+Small uploads are appended to large pack segments and addressed by an
+(offset, length) index, avoiding a Large Object or directory per file.
+"""
+
+import os
+import uuid
+import fcntl
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PackFileManager:
+    """Manager class for pack segment append, positioned read and compaction"""
+
+    @property
+    def config(self):
+        return getattr(settings, 'PACK_STORAGE', {})
+
+    @property
+    def root(self):
+        return str(self.config.get('ROOT') or os.path.join(settings.MEDIA_ROOT, 'packs'))
+
+    @property
+    def threshold(self):
+        return self.config.get('THRESHOLD', 64 * 1024)
+
+    @property
+    def segment_max_bytes(self):
+        return self.config.get('SEGMENT_MAX_BYTES', 64 * 1024 * 1024)
+
+    def is_pack_available(self):
+        """Check if the pack tier is enabled"""
+        return getattr(settings, 'USE_PACK_STORAGE', False)
+
+    def should_pack(self, size):
+        """Whether a file of this size belongs in the pack tier"""
+        return self.is_pack_available() and int(size) <= self.threshold
+
+    def _segment_path(self, segment):
+        return os.path.join(self.root, segment.path)
+
+    def _new_segment(self):
+        from .models import PackSegment
+        os.makedirs(self.root, exist_ok=True)
+        segment_id = uuid.uuid4()
+        return PackSegment.objects.create(id=segment_id, path=f'{segment_id.hex}.pack')
+
+    def _open_segment(self, size):
+        """Lock and return an unsealed segment with room for `size` more bytes"""
+        from .models import PackSegment
+        segment = PackSegment.objects.select_for_update().filter(
+            is_sealed=False,
+            size_bytes__lte=self.segment_max_bytes - size
+        ).order_by('created_at').first()
+        return segment or self._new_segment()
+
+    def append(self, data):
+        """Append data to a pack segment and return the new PackEntry"""
+        from .models import PackEntry
+        try:
+            with transaction.atomic():
+                segment = self._open_segment(len(data))
+
+                with open(self._segment_path(segment), 'ab') as f:
+                    # The file lock guards against appenders in other processes;
+                    # the offset is taken from the real end of file under the lock
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    try:
+                        offset = f.seek(0, os.SEEK_END)
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    finally:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+                segment.size_bytes = offset + len(data)
+                # Seal once a file at the pack threshold would no longer fit
+                segment.is_sealed = segment.size_bytes + self.threshold > self.segment_max_bytes
+                segment.save(update_fields=['size_bytes', 'is_sealed', 'updated_at'])
+
+                entry = PackEntry.objects.create(segment=segment, offset=offset, length=len(data))
+                logger.debug(f"Packed {len(data)} bytes into segment {segment.id} at offset {offset}")
+                return entry
+        except Exception as e:
+            logger.error(f"Failed to append to pack segment: {e}")
+            raise
+
+    def read(self, entry_id, start=0, length=None):
+        """Read an entry (or a slice of it) with a single positioned read"""
+        from .models import PackEntry
+        for attempt in range(2):
+            entry = PackEntry.objects.select_related('segment').get(id=entry_id, is_deleted=False)
+            if length is None or start + length > entry.length:
+                length = entry.length - start
+            try:
+                fd = os.open(self._segment_path(entry.segment), os.O_RDONLY)
+            except FileNotFoundError:
+                # The segment was compacted away between lookup and open; reload the entry
+                if attempt:
+                    raise
+                continue
+            try:
+                return os.pread(fd, max(length, 0), entry.offset + start)
+            finally:
+                os.close(fd)
+
+    def delete_entry(self, entry_id):
+        """Mark an entry deleted; its bytes are reclaimed by compaction"""
+        from .models import PackEntry, PackSegment
+        with transaction.atomic():
+            entry = PackEntry.objects.select_for_update().filter(id=entry_id, is_deleted=False).first()
+            if not entry:
+                return
+            entry.is_deleted = True
+            entry.save(update_fields=['is_deleted'])
+            PackSegment.objects.filter(id=entry.segment_id).update(dead_bytes=F('dead_bytes') + entry.length)
+
+    def compact(self, ratio=None):
+        """Rewrite sealed segments whose dead bytes exceed `ratio`; returns bytes reclaimed"""
+        from .models import PackSegment
+        ratio = ratio if ratio is not None else self.config.get('COMPACTION_RATIO', 0.5)
+        reclaimed = 0
+
+        for segment in PackSegment.objects.filter(is_sealed=True, dead_bytes__gt=0).order_by('created_at'):
+            if segment.size_bytes and segment.dead_bytes / segment.size_bytes >= ratio:
+                reclaimed += self._compact_segment(segment)
+
+        return reclaimed
+
+    def _compact_segment(self, segment):
+        """Copy live entries of one segment into a fresh segment and drop the old one"""
+        from .models import PackEntry, PackSegment
+        old_path = self._segment_path(segment)
+
+        with transaction.atomic():
+            segment = PackSegment.objects.select_for_update().get(id=segment.id)
+            live_entries = list(segment.entries.filter(is_deleted=False).order_by('offset'))
+
+            new_segment = None
+            if live_entries:
+                new_segment = self._new_segment()
+                fd = os.open(old_path, os.O_RDONLY)
+                try:
+                    with open(self._segment_path(new_segment), 'wb') as out:
+                        for entry in live_entries:
+                            data = os.pread(fd, entry.length, entry.offset)
+                            entry.offset = out.tell()
+                            entry.segment = new_segment
+                            out.write(data)
+                        out.flush()
+                        os.fsync(out.fileno())
+                        new_segment.size_bytes = out.tell()
+                finally:
+                    os.close(fd)
+
+                new_segment.is_sealed = True
+                new_segment.save(update_fields=['size_bytes', 'is_sealed', 'updated_at'])
+                PackEntry.objects.bulk_update(live_entries, ['segment', 'offset'], batch_size=500)
+
+            segment.entries.filter(is_deleted=True).delete()
+            reclaimed = segment.size_bytes - (new_segment.size_bytes if new_segment else 0)
+            segment.delete()
+
+        try:
+            os.remove(old_path)
+        except FileNotFoundError:
+            pass
+
+        logger.info(f"Compacted pack segment {segment.path}: reclaimed {reclaimed} bytes")
+        return reclaimed
+
+# Global instance
+pack_manager = PackFileManager()
@@ -0,0 +1,70 @@
+"""
+Keyset pagination for file listings.
+Cursors are opaque tokens encoding the sort field, the last row's sort value and
+its id; the next page is a single range scan on (sort value, id), so page cost
+does not grow with depth and rows sharing a sort value are never skipped.
+"""
+
+import json
+import uuid
+import base64
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+FILE_SORT_FIELDS = ('name', 'modified_at', 'size_bytes', 'created_at')
+DATETIME_SORT_FIELDS = ('modified_at', 'created_at', 'updated_at', 'timestamp')
+INTEGER_SORT_FIELDS = ('size_bytes',)
+STRING_SORT_FIELDS = ('name', 'item_name')
+
+class InvalidCursor(ValueError):
+    pass
+
+def _sort_field(sort_by):
+    return sort_by.lstrip('-')
+
+def keyset_ordering(sort_by):
+    """order_by() arguments with id as a tie-breaker in the same direction"""
+    return [sort_by, '-id' if sort_by.startswith('-') else 'id']
+
+def encode_cursor(obj, sort_by):
+    """Opaque cursor pointing just past `obj` in a listing sorted by sort_by"""
+    value = getattr(obj, _sort_field(sort_by))
+    if _sort_field(sort_by) in DATETIME_SORT_FIELDS:
+        value = value.isoformat()
+    payload = json.dumps({'s': sort_by, 'v': value, 'i': str(obj.id)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(token, sort_by):
+    """Return (sort value, id) from a cursor; raises InvalidCursor"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value, pk, cursor_sort = payload['v'], uuid.UUID(payload['i']), payload['s']
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise InvalidCursor('Malformed cursor') from e
+    if cursor_sort != sort_by:
+        raise InvalidCursor('Cursor was issued for a different sort order')
+
+    field = _sort_field(sort_by)
+    if field in DATETIME_SORT_FIELDS:
+        value = parse_datetime(value) if isinstance(value, str) else None
+        valid = value is not None
+    elif field in INTEGER_SORT_FIELDS:
+        valid = isinstance(value, int) and not isinstance(value, bool)
+    else:
+        valid = field in STRING_SORT_FIELDS and isinstance(value, str)
+    if not valid:
+        raise InvalidCursor('Malformed cursor')
+    return value, pk
+
+def apply_keyset(queryset, sort_by, cursor=None):
+    """Order by (sort value, id) and, given a cursor, start right after it"""
+    queryset = queryset.order_by(*keyset_ordering(sort_by))
+    if not cursor:
+        return queryset
+
+    value, pk = decode_cursor(cursor, sort_by)
+    field = _sort_field(sort_by)
+    op = 'lt' if sort_by.startswith('-') else 'gt'
+    # Row-value comparison (field, id) > (value, pk), spelled so every backend can use the index
+    return queryset.filter(Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk}))
@@ -0,0 +1,126 @@
+"""
+Effective permissions on files and folders.
+A user's permission on an item is the highest of: ownership, a direct user
+share or invite, a user share or invite on any ancestor folder (read from the
+materialized path, no tree walk) and is_public (viewer). Public links are not
+grants: they are only honoured through public_file_access with their token and
+password. Resolved permissions are cached per (user, item) under the owner's
+ACL generation, which moves on share, invite, move and visibility changes, so
+a check costs at most one indexed query on a cache miss. Caching needs a cache
+shared by all workers; with a process-local one a revocation in one worker
+would not reach the others, so every check is resolved from the database.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
+from rest_framework.exceptions import PermissionDenied
+from .cache_utils import ACL_GENERATION_PREFIX, bump_generation, cache_is_shared, get_generation
+import logging
+
+logger = logging.getLogger(__name__)
+
+PERMISSION_LEVELS = {'viewer': 1, 'editor': 2, 'owner': 3}
+PUBLIC_PERMISSION = 'viewer'  # Public files can be seen and downloaded, never changed
+
+def _config():
+    return getattr(settings, 'ACCESS_CACHE', {})
+
+def _highest(permissions):
+    return max(permissions, key=lambda p: PERMISSION_LEVELS[p], default=None)
+
+def allows(permission, required):
+    """Whether an effective permission (None for no access) satisfies `required`"""
+    return permission is not None and PERMISSION_LEVELS[permission] >= PERMISSION_LEVELS[required]
+
+class AccessResolver:
+    """Manager class for resolving and caching effective permissions"""
+
+    def _cache_key(self, user_id, kind, item):
+        generation = get_generation(item.owner_id, prefix=ACL_GENERATION_PREFIX)
+        return f'acl:{user_id}:{kind}:{item.id}:g{generation}'
+
+    def _grants(self, user, file_id, folder_ids):
+        """
+        (permission, expires_at) of every unexpired user share and pending
+        invite reaching the user on the file or the folders, as one query
+        """
+        from .models import Invite, Share
+        now = timezone.now()
+        target = Q(folder_id__in=folder_ids)
+        if file_id is not None:
+            target |= Q(file_id=file_id)
+        unexpired = Q(expires_at__isnull=True) | Q(expires_at__gt=now)
+        shares = Share.objects.filter(target, unexpired, target_user=user, share_type='user', is_active=True)
+        invites = Invite.objects.filter(target, unexpired, target_email=user.email, is_accepted=False)
+        return shares.order_by().values_list('permission', 'expires_at').union(
+            invites.order_by().values_list('permission', 'expires_at'), all=True
+        )
+
+    def _resolve(self, user, file_id, folder, is_public):
+        """(permission, valid_until) from is_public and the grants"""
+        folder_ids = folder.ancestor_ids(include_self=True) if folder is not None else []
+        permissions, expiries = [PUBLIC_PERMISSION] if is_public else [], []
+        for permission, expires_at in self._grants(user, file_id, folder_ids):
+            permissions.append(permission)
+            if expires_at:
+                expiries.append(expires_at)
+        return _highest(permissions), min(expiries, default=None)
+
+    def _cached(self, user, kind, item, resolve):
+        if not cache_is_shared():
+            return resolve()[0]
+        key = self._cache_key(user.id, kind, item)
+        cached = cache.get(key)
+        if cached is not None:
+            permission, valid_until = cached
+            if valid_until is None or timezone.now() < valid_until:
+                return permission or None
+        permission, valid_until = resolve()
+        try:
+            cache.set(key, (permission or '', valid_until), _config().get('TIMEOUT', 600))
+        except Exception as e:
+            logger.warning(f"Failed to cache permission for {kind} {item.id}: {e}")
+        return permission
+
+    def file_permission(self, user, file_obj):
+        """Effective permission of the user on a file, or None"""
+        if file_obj.owner_id == user.id:
+            return 'owner'
+        return self._cached(user, 'file', file_obj, lambda: self._resolve(
+            user, file_obj.id, file_obj.folder, file_obj.is_public
+        ))
+
+    def folder_permission(self, user, folder):
+        """Effective permission of the user on a folder, or None"""
+        if folder.owner_id == user.id:
+            return 'owner'
+        return self._cached(user, 'folder', folder, lambda: self._resolve(user, None, folder, False))
+
+    def owner_changed(self, owner_id):
+        """Drop every cached permission on the owner's items"""
+        bump_generation(owner_id, prefix=ACL_GENERATION_PREFIX)
+
+# Global instance
+access_resolver = AccessResolver()
+
+def get_file_or_404(user, file_id, required='viewer'):
+    """
+    The file if the user's effective permission is at least `required`.
+    Raises Http404 when the user has no access at all (so existence is not
+    revealed) and PermissionDenied when the access is too low.
+    """
+    from .models import File
+    try:
+        file_obj = File.objects.select_related('folder').get(id=file_id)
+    except (File.DoesNotExist, ValueError):
+        raise Http404('File not found')
+    permission = access_resolver.file_permission(user, file_obj)
+    if permission is None:
+        raise Http404('File not found')
+    if not allows(permission, required):
+        raise PermissionDenied(f'{required.capitalize()} access is required')
+    file_obj.effective_permission = permission
+    return file_obj
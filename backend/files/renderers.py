@@ -0,0 +1,71 @@
+"""
+JSON rendering for API responses.
+FastJSONRenderer encodes with orjson when it is installed and falls back to
+the stdlib encoder otherwise; output is byte-compatible with DRF's compact
+JSONRenderer. streaming_json_response() sends large listings as chunked JSON
+so the first rows leave before the last ones are read.
+"""
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+import logging
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is used without it
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_encoder = encoders.JSONEncoder()
+
+def _default(obj):
+    # Datetimes are passed through so they keep DRF's format (millisecond precision, Z suffix)
+    return _encoder.default(obj)
+
+def dumps(data):
+    """Encode like the compact JSONRenderer, with orjson when available"""
+    if orjson is None:
+        return JSONRenderer().render(data)
+    ret = orjson.dumps(
+        data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    )
+    # Like DRF, escape the line separators JSON allows but JavaScript string literals do not
+    return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer backed by orjson; indented output still goes through the stdlib"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+def streaming_json_response(items_key, items, tail, chunk_size=200):
+    """
+    Stream {"<items_key>": [...], **tail()} as chunked JSON. `items` is
+    consumed lazily and `tail()` runs after it, so trailing keys such as
+    has_more and next_cursor can depend on what was streamed.
+    """
+    def generate():
+        yield b'{' + dumps(items_key) + b':['
+        separator, chunk = b'', []
+        try:
+            for item in items:
+                chunk.append(dumps(item))
+                if len(chunk) >= chunk_size:
+                    yield separator + b','.join(chunk)
+                    separator, chunk = b',', []
+            if chunk:
+                yield separator + b','.join(chunk)
+            rest = dumps(tail())
+        except Exception as e:
+            # Headers are already sent; a truncated body is what the client will see
+            logger.error(f"Streaming {items_key} failed: {e}")
+            raise
+        yield b']' + (b',' + rest[1:] if rest != b'{}' else b'}')
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
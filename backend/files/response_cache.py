@@ -0,0 +1,92 @@
+"""
+Per-user response cache for read endpoints.
+Responses are stored under a key made of the user, the endpoint, its arguments
+and the user's cache generation (see cache_utils). Every file, folder, share or
+activity write bumps the generation, so a cached response is never served after
+the data behind it changed; the timeout only bounds time-dependent output such
+as signed URLs. Works with any shared Django cache backend; with a per-process
+one (locmem) another worker's write would not reach this worker's entries, so
+responses are never cached there.
+"""
+
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.response import Response
+from .cache_utils import cache_is_shared, generation_key, get_generations
+from . import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHED_ENDPOINTS = []
+
+def _config():
+    return getattr(settings, 'RESPONSE_CACHE', {})
+
+def response_cache_key(request, name, args, kwargs, related_users=None, per_day=False):
+    parts = [
+        request.get_host(),
+        sorted(request.query_params.lists()),
+        list(args),
+        sorted((key, str(value)) for key, value in kwargs.items()),
+    ]
+    if related_users is not None:
+        # Output that includes other users' data also depends on their generations
+        parts.append(sorted(get_generations(related_users(request)).items()))
+    if per_day:
+        parts.append(timezone.localdate().isoformat())
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    return generation_key(request.user.id, 'response', name, digest)
+
+def cache_response(name, related_users=None, per_day=False):
+    """
+    Cache successful GET responses of a function view per user. Apply it below
+    @api_view/@permission_classes so it runs for authenticated requests only.
+    `related_users(request)` returns ids of other users whose data is included.
+    """
+    CACHED_ENDPOINTS.append(name)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or not _config().get('ENABLED', True) or not cache_is_shared():
+                return view(request, *args, **kwargs)
+            try:
+                key = response_cache_key(request, name, args, kwargs, related_users, per_day)
+                cached = cache.get(key)
+            except Exception as e:
+                logger.warning(f"Response cache lookup failed for {name}: {e}")
+                return view(request, *args, **kwargs)
+
+            if cached is not None:
+                metrics.incr(f'response_cache.{name}.hits')
+                return Response(cached)
+
+            metrics.incr(f'response_cache.{name}.misses')
+            response = view(request, *args, **kwargs)
+            # Streamed pages have no data to keep
+            if response.status_code == 200 and not getattr(response, 'streaming', False):
+                try:
+                    cache.set(key, response.data, _config().get('TIMEOUT', 300))
+                except Exception as e:
+                    logger.warning(f"Failed to cache response for {name}: {e}")
+            return response
+        return wrapper
+    return decorator
+
+def get_stats():
+    """Hits, misses and hit ratio per cached endpoint"""
+    names = [f'response_cache.{name}.{kind}' for name in CACHED_ENDPOINTS for kind in ('hits', 'misses')]
+    values = metrics.get_metrics(names)
+    stats = {}
+    for name in CACHED_ENDPOINTS:
+        hits, misses = values[f'response_cache.{name}.hits'], values[f'response_cache.{name}.misses']
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None
+        }
+    return stats
@@ -0,0 +1,159 @@
+"""
+Version retention policies and the background version pruner.
+Pruning runs outside the request path (see the prune_versions command) and
+frees the storage of deleted versions through their storage backend.
+"""
+
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Optional
+from django.conf import settings
+from django.utils import timezone
+from .models import File, FileVersion, VersionRetentionPolicy, MAX_VERSIONS_PER_FILE
+from .storage_utils import is_storage_key_referenced, release_storage_key
+from .cache_utils import bump_generation
+from .change_versions import change_versions
+import logging
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RetentionPolicy:
+    max_versions: Optional[int] = MAX_VERSIONS_PER_FILE
+    max_age_days: Optional[int] = None
+    keep_daily_days: Optional[int] = None
+    keep_weekly_weeks: Optional[int] = None
+
+    @classmethod
+    def default(cls):
+        """Site-wide policy from settings.VERSION_RETENTION"""
+        config = getattr(settings, 'VERSION_RETENTION', {})
+        return cls(
+            max_versions=config.get('MAX_VERSIONS', MAX_VERSIONS_PER_FILE),
+            max_age_days=config.get('MAX_AGE_DAYS'),
+            keep_daily_days=config.get('KEEP_DAILY_DAYS'),
+            keep_weekly_weeks=config.get('KEEP_WEEKLY_WEEKS'),
+        )
+
+    @classmethod
+    def for_override(cls, override, default):
+        """Per-user override; unset fields fall back to the site-wide policy"""
+        if override is None:
+            return default
+        return cls(**{
+            field: getattr(override, field) if getattr(override, field) is not None else getattr(default, field)
+            for field in ('max_versions', 'max_age_days', 'keep_daily_days', 'keep_weekly_weeks')
+        })
+
+def select_versions_to_prune(versions, policy, now=None):
+    """
+    Pick versions to delete from [(id, created_at), ...].
+    Versions inside the daily window keep the newest per day, inside the weekly
+    window the newest per ISO week; older versions are dropped past max_age_days,
+    and the survivors are capped at max_versions.
+    """
+    now = now or timezone.now()
+    daily_cutoff = now - timedelta(days=policy.keep_daily_days) if policy.keep_daily_days else None
+    weekly_cutoff = now - timedelta(weeks=policy.keep_weekly_weeks) if policy.keep_weekly_weeks else None
+    age_cutoff = now - timedelta(days=policy.max_age_days) if policy.max_age_days else None
+
+    keep, prune, seen_buckets = [], [], set()
+    for version_id, created_at in sorted(versions, key=lambda v: v[1], reverse=True):
+        if age_cutoff and created_at < age_cutoff:
+            prune.append(version_id)
+            continue
+
+        bucket = None
+        if daily_cutoff and created_at >= daily_cutoff:
+            bucket = ('day', created_at.date())
+        elif weekly_cutoff and created_at >= weekly_cutoff:
+            bucket = ('week',) + tuple(created_at.isocalendar()[:2])
+
+        if bucket is not None:
+            if bucket in seen_buckets:
+                prune.append(version_id)
+                continue
+            seen_buckets.add(bucket)
+        keep.append(version_id)
+
+    if policy.max_versions is not None:
+        prune.extend(keep[policy.max_versions:])
+    return prune
+
+class VersionPruner:
+    """Applies retention policies to all files in batches"""
+
+    def __init__(self, batch_size=500, now=None):
+        self.batch_size = batch_size
+        self.now = now
+        self.default_policy = RetentionPolicy.default()
+
+    def _policies_for(self, owner_ids):
+        overrides = {p.user_id: p for p in VersionRetentionPolicy.objects.filter(user_id__in=owner_ids)}
+        return {
+            owner_id: RetentionPolicy.for_override(overrides.get(owner_id), self.default_policy)
+            for owner_id in owner_ids
+        }
+
+    def run(self, user=None):
+        """Prune every file with versions; returns (versions deleted, logical bytes released)"""
+        files = File.objects.filter(versions__isnull=False).distinct().order_by('id')
+        if user is not None:
+            files = files.filter(owner=user)
+
+        deleted = freed = 0
+        last_id = None
+        while True:
+            # Keyset pagination over files so each batch is one indexed range scan
+            batch = files.filter(id__gt=last_id) if last_id else files
+            batch = list(batch.values_list('id', 'owner_id')[:self.batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            batch_deleted, batch_freed = self._prune_batch(batch)
+            deleted += batch_deleted
+            freed += batch_freed
+
+        logger.info(f"Version pruning deleted {deleted} versions and released {freed} bytes")
+        return deleted, freed
+
+    def _prune_batch(self, batch):
+        policies = self._policies_for({owner_id for _, owner_id in batch})
+        owners = dict(batch)
+
+        versions_by_file = {}
+        for version_id, file_id, created_at in FileVersion.objects.filter(
+            file_id__in=owners.keys()
+        ).values_list('id', 'file_id', 'created_at'):
+            versions_by_file.setdefault(file_id, []).append((version_id, created_at))
+
+        prune_ids = []
+        for file_id, versions in versions_by_file.items():
+            prune_ids.extend(select_versions_to_prune(versions, policies[owners[file_id]], self.now))
+        if not prune_ids:
+            return 0, 0
+
+        doomed = list(FileVersion.objects.filter(id__in=prune_ids).values_list('storage_key', 'file_id', 'size_bytes'))
+        FileVersion.objects.filter(id__in=prune_ids).delete()
+
+        # Listings show each file's version count
+        folders_by_owner = {}
+        for owner_id, folder_id in File.objects.filter(id__in={file_id for _, file_id, _ in doomed}).values_list('owner_id', 'folder_id'):
+            folders_by_owner.setdefault(owner_id, set()).add(folder_id)
+        for owner_id, folder_ids in folders_by_owner.items():
+            change_versions.folders_changed(owner_id, folder_ids)
+            bump_generation(owner_id)
+
+        # Content may still be shared with the file itself (after a restore) or other versions
+        freed = 0
+        for storage_key in {key for key, _, _ in doomed}:
+            if is_storage_key_referenced(storage_key):
+                continue
+            try:
+                release_storage_key(storage_key)
+                freed += sum(size for key, _, size in doomed if key == storage_key)
+            except Exception as e:
+                logger.warning(f"Failed to free storage for pruned version content {storage_key}: {e}")
+
+        return len(prune_ids), freed
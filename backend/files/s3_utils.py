@@ -0,0 +1,193 @@
+"""
+S3-compatible object storage utilities (AWS S3, MinIO, etc.).
+Maps upload chunks directly onto S3 multipart parts and hands out presigned URLs
+so file bytes never have to be assembled or served by the app workers.
+"""
+
+from django.conf import settings
+import logging
+
+try:
+    import boto3
+    from botocore.config import Config
+except ImportError:  # boto3 is only required when S3 storage is configured
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+# S3 rejects multipart parts smaller than 5MB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+class S3StorageManager:
+    """Manager class for S3-compatible object storage operations"""
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def config(self):
+        return getattr(settings, 'S3_STORAGE', {})
+
+    @property
+    def bucket(self):
+        return self.config.get('BUCKET_NAME')
+
+    @property
+    def client(self):
+        """Lazily create the boto3 client so settings overrides are honoured"""
+        if self._client is None:
+            if boto3 is None:
+                raise RuntimeError('boto3 is required for S3 storage')
+            self._client = boto3.client(
+                's3',
+                endpoint_url=self.config.get('ENDPOINT_URL') or None,
+                region_name=self.config.get('REGION_NAME') or None,
+                aws_access_key_id=self.config.get('ACCESS_KEY_ID') or None,
+                aws_secret_access_key=self.config.get('SECRET_ACCESS_KEY') or None,
+                config=Config(signature_version='s3v4'),
+            )
+        return self._client
+
+    def reset_client(self):
+        """Drop the cached client (used when settings change, e.g. in tests)"""
+        self._client = None
+
+    def is_s3_available(self):
+        """Check if S3 storage is configured and boto3 is installed"""
+        return boto3 is not None and getattr(settings, 'USE_S3', False) and bool(self.bucket)
+
+    def build_object_key(self, user_id, upload_id, filename):
+        """Build the object key for a new upload"""
+        return f'files/{user_id}/{upload_id}/{filename}'
+
+    def create_multipart_upload(self, key, content_type):
+        """Start a multipart upload and return its UploadId"""
+        try:
+            response = self.client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                ContentType=content_type or 'application/octet-stream'
+            )
+            logger.info(f"Created S3 multipart upload for {key}")
+            return response['UploadId']
+        except Exception as e:
+            logger.error(f"Failed to create S3 multipart upload for {key}: {e}")
+            raise
+
+    def upload_part(self, key, upload_id, part_number, data):
+        """Upload a single part and return its ETag"""
+        try:
+            response = self.client.upload_part(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=data
+            )
+            logger.debug(f"Uploaded part {part_number} ({len(data)} bytes) for {key}")
+            return response['ETag']
+        except Exception as e:
+            logger.error(f"Failed to upload part {part_number} for {key}: {e}")
+            raise
+
+    def generate_part_upload_url(self, key, upload_id, part_number, expires_in=3600):
+        """Presigned URL so clients can PUT a part straight to the bucket"""
+        return self.client.generate_presigned_url(
+            'upload_part',
+            Params={
+                'Bucket': self.bucket,
+                'Key': key,
+                'UploadId': upload_id,
+                'PartNumber': part_number,
+            },
+            ExpiresIn=expires_in
+        )
+
+    def list_parts(self, key, upload_id):
+        """Return the uploaded parts as [{'PartNumber', 'ETag', 'Size'}] ordered by part number"""
+        parts = []
+        kwargs = {'Bucket': self.bucket, 'Key': key, 'UploadId': upload_id}
+        while True:
+            response = self.client.list_parts(**kwargs)
+            for part in response.get('Parts', []):
+                parts.append({
+                    'PartNumber': part['PartNumber'],
+                    'ETag': part['ETag'],
+                    'Size': part['Size'],
+                })
+            if not response.get('IsTruncated'):
+                break
+            kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+        return sorted(parts, key=lambda p: p['PartNumber'])
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        """Complete a multipart upload from the parts reported by list_parts"""
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={
+                    'Parts': [{'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in parts]
+                }
+            )
+            logger.info(f"Completed S3 multipart upload for {key} ({len(parts)} parts)")
+        except Exception as e:
+            logger.error(f"Failed to complete S3 multipart upload for {key}: {e}")
+            raise
+
+    def abort_multipart_upload(self, key, upload_id):
+        """Abort a multipart upload and discard its parts"""
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            logger.info(f"Aborted S3 multipart upload for {key}")
+        except Exception as e:
+            logger.error(f"Failed to abort S3 multipart upload for {key}: {e}")
+            raise
+
+    def get_object_size(self, key):
+        """Get the size of a stored object"""
+        return self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+
+    def read_object(self, key, start=None, end=None, chunk_size=8192):
+        """Generator to read an object (or an inclusive byte range of it) in chunks"""
+        kwargs = {'Bucket': self.bucket, 'Key': key}
+        if start is not None:
+            kwargs['Range'] = f'bytes={start}-{end if end is not None else ""}'
+        try:
+            body = self.client.get_object(**kwargs)['Body']
+            try:
+                for chunk in body.iter_chunks(chunk_size):
+                    yield chunk
+            finally:
+                body.close()
+        except Exception as e:
+            logger.error(f"Failed to read S3 object {key}: {e}")
+            raise
+
+    def generate_presigned_url(self, key, expires_in=None, filename=None, content_type=None, inline=False):
+        """Presigned GET URL; S3 serves Range requests against it natively"""
+        params = {'Bucket': self.bucket, 'Key': key}
+        if filename:
+            disposition = 'inline' if inline else 'attachment'
+            params['ResponseContentDisposition'] = f'{disposition}; filename="{filename}"'
+        if content_type:
+            params['ResponseContentType'] = content_type
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params=params,
+            ExpiresIn=expires_in or self.config.get('PRESIGNED_URL_EXPIRY', 3600)
+        )
+
+    def delete_object(self, key):
+        """Delete a stored object"""
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+            logger.info(f"Deleted S3 object {key}")
+        except Exception as e:
+            logger.error(f"Failed to delete S3 object {key}: {e}")
+            raise
+
+# Global instance
+s3_manager = S3StorageManager()
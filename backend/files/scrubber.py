@@ -0,0 +1,218 @@
+"""
+Background integrity scrubber.
+Walks files in primary-key order from a persisted cursor, re-hashes their stored
+bytes under an I/O bandwidth budget and marks damaged files unavailable. Only
+missing content or a size/checksum mismatch counts as damage: other read errors
+are retried and, if they persist, the file is skipped until the next pass.
+Unavailable files are scrubbed too and become ready again once they verify.
+"""
+
+import time
+import hashlib
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import File, ScrubCursor
+from .storage_utils import is_missing_content, iter_file_content
+from .folder_counters import folder_counters
+from .cache_utils import bump_generation
+from .search import search_index
+from .user_stats import user_stats, file_state
+from .change_versions import change_versions
+from .change_journal import change_journal, file_payload
+from . import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of IntegrityScrubber.verify
+OK = 'ok'
+DAMAGED = 'damaged'
+UNREADABLE = 'unreadable'
+
+SCRUBBED_STATUSES = ('ready', 'unavailable')
+
+class BandwidthThrottle:
+    """Token bucket shared by all scrub workers (bytes per second)"""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.tokens = bytes_per_second
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        """Block until `amount` bytes fit in the budget"""
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class IntegrityScrubber:
+    """Verifies stored bytes against File.checksum and File.size_bytes"""
+
+    def __init__(self, workers=2, bytes_per_second=10 * 1024 * 1024, batch_size=100, cursor_name='default',
+                 retries=2, retry_delay=1.0):
+        self.workers = workers
+        self.throttle = BandwidthThrottle(bytes_per_second)
+        self.batch_size = batch_size
+        self.cursor_name = cursor_name
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def verify(self, file_obj):
+        """Return (result, bytes read, reason) for one file; the result is OK, DAMAGED or UNREADABLE"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay * attempt)
+            digest = hashlib.sha256()
+            size = 0
+            try:
+                for chunk in iter_file_content(file_obj):
+                    self.throttle.consume(len(chunk))
+                    digest.update(chunk)
+                    size += len(chunk)
+                break
+            except Exception as e:
+                if is_missing_content(e):
+                    return DAMAGED, size, f'content missing: {e}'
+                reason = f'read failed: {e}'
+        else:
+            return UNREADABLE, size, reason
+
+        if size != file_obj.size_bytes:
+            return DAMAGED, size, f'size mismatch: expected {file_obj.size_bytes}, read {size}'
+        if not file_obj.checksum:
+            # Content written without a checksum (e.g. S3 multipart) is trusted on first scrub
+            if File.objects.filter(id=file_obj.id, storage_key=file_obj.storage_key, checksum='').update(checksum=digest.hexdigest()):
+                file_obj.checksum = digest.hexdigest()
+                # Listings and cached responses show the checksum
+                change_versions.folders_changed(file_obj.owner_id, [file_obj.folder_id])
+                bump_generation(file_obj.owner_id)
+            return OK, size, None
+        if digest.hexdigest() != file_obj.checksum:
+            return DAMAGED, size, 'checksum mismatch'
+        return OK, size, None
+
+    def _verify_in_worker(self, file_obj):
+        try:
+            return self.verify(file_obj)
+        finally:
+            # Worker threads hold their own database connections
+            connection.close()
+
+    def run_batch(self):
+        """Scrub the next batch after the cursor; returns the number of files examined"""
+        cursor, _ = ScrubCursor.objects.get_or_create(name=self.cursor_name)
+
+        files = File.objects.filter(status__in=SCRUBBED_STATUSES).order_by('id')
+        if cursor.last_file_id:
+            files = files.filter(id__gt=cursor.last_file_id)
+        batch = list(files[:self.batch_size])
+
+        if not batch:
+            # End of the table: start the next pass from the beginning
+            ScrubCursor.objects.filter(pk=cursor.pk).update(
+                last_file_id=None, passes_completed=F('passes_completed') + 1, last_pass_completed_at=timezone.now()
+            )
+            metrics.incr('scrub.passes_completed')
+            return 0
+
+        if self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(self._verify_in_worker, batch))
+        else:
+            results = [self.verify(file_obj) for file_obj in batch]
+
+        counts = defaultdict(int)
+        damaged, recovered = [], []
+        bytes_read = 0
+        for file_obj, (result, size, reason) in zip(batch, results):
+            bytes_read += size
+            counts[result] += 1
+            if result == UNREADABLE:
+                logger.warning(f"Skipping file {file_obj.id} ({file_obj.name}) until the next pass: {reason}")
+            elif result == DAMAGED:
+                logger.warning(f"Integrity check failed for file {file_obj.id} ({file_obj.name}): {reason}")
+                if file_obj.status == 'ready':
+                    damaged.append(file_obj)
+            elif file_obj.status == 'unavailable':
+                logger.info(f"File {file_obj.id} ({file_obj.name}) verified again, making it available")
+                recovered.append(file_obj)
+
+        self._set_status(damaged, 'ready', 'unavailable')
+        self._set_status(recovered, 'unavailable', 'ready')
+
+        ScrubCursor.objects.filter(pk=cursor.pk).update(
+            last_file_id=batch[-1].id,
+            files_verified=F('files_verified') + counts[OK],
+            files_failed=F('files_failed') + counts[DAMAGED],
+            bytes_verified=F('bytes_verified') + bytes_read,
+            updated_at=timezone.now()
+        )
+        metrics.incr('scrub.files_verified', counts[OK])
+        metrics.incr('scrub.files_failed', counts[DAMAGED])
+        metrics.incr('scrub.files_skipped', counts[UNREADABLE])
+        metrics.incr('scrub.bytes_read', bytes_read)
+        return len(batch)
+
+    def _set_status(self, files, from_status, to_status):
+        """
+        Move verified files between ready and unavailable. A file whose content
+        changed after it was read (new storage_key or checksum) is left alone.
+        """
+        if not files:
+            return
+        unchanged = Q()
+        for file_obj in files:
+            unchanged |= Q(id=file_obj.id, storage_key=file_obj.storage_key, checksum=file_obj.checksum)
+        is_ready = to_status == 'ready'
+
+        with transaction.atomic():
+            rows = list(
+                File.objects.select_for_update().filter(unchanged, status=from_status)
+                .values_list('id', 'folder_id', 'size_bytes', 'owner_id', 'mime_type', 'created_at', 'name', 'version')
+            )
+            file_ids = [row[0] for row in rows]
+            File.objects.filter(id__in=file_ids).update(status=to_status)
+            change_journal.record_many([
+                (owner_id, 'file', file_id, 'updated', file_payload(File(
+                    name=name, folder_id=folder_id, size_bytes=size, mime_type=mime_type,
+                    status=to_status, version=version
+                )))
+                for file_id, folder_id, size, owner_id, mime_type, _, name, version in rows
+            ])
+            folder_counters.bulk_status_change([(row[1], row[2]) for row in rows], is_ready=is_ready)
+            if is_ready:
+                search_index.files_changed(list(File.objects.filter(id__in=file_ids)))
+            else:
+                search_index.remove(file_ids)
+            by_owner = defaultdict(list)
+            for _, _, size, owner_id, mime_type, created_at, _, _ in rows:
+                by_owner[owner_id].append(file_state('ready', size, mime_type, created_at))
+            for owner_id, states in by_owner.items():
+                if is_ready:
+                    user_stats.files_restored(owner_id, states)
+                else:
+                    user_stats.files_removed(owner_id, states)
+                change_versions.folders_changed(owner_id, {row[1] for row in rows if row[3] == owner_id})
+        for owner_id in by_owner:
+            bump_generation(owner_id)
+
+    def run_pass(self):
+        """Scrub until the cursor wraps around; returns the number of files examined"""
+        examined = 0
+        while True:
+            count = self.run_batch()
+            if not count:
+                return examined
+            examined += count
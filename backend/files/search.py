@@ -0,0 +1,251 @@
+"""
+Indexed name/description search over files and folders.
+PostgreSQL matches against tsvector and pg_trgm expression indexes (created in
+migration 0011) and ranks by ts_rank plus trigram similarity. SQLite installs
+keep an FTS5 mirror table, maintained from the model hooks, ranked by bm25.
+Owner, folder and type filters are part of the indexed query on both backends.
+"""
+
+import re
+import uuid
+from django.db import connection
+from .models import File, Folder
+from .listing import file_listing_queryset
+import logging
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'files_search'
+
+DOCUMENT_MIME_TYPES = (
+    'application/pdf', 'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+)
+
+# Fields whose change requires re-indexing a file
+INDEXED_FILE_FIELDS = {'name', 'description', 'status', 'folder', 'folder_id', 'mime_type'}
+
+# Same expression as the PostgreSQL expression index, so the planner can use it
+PG_FILE_TSVECTOR = "to_tsvector('simple', coalesce(f.name, '') || ' ' || coalesce(f.description, ''))"
+PG_FOLDER_TSVECTOR = "to_tsvector('simple', d.name)"
+
+def _hex(value):
+    """UUIDs as SQLite stores them (32 hex digits)"""
+    return uuid.UUID(str(value)).hex if value else None
+
+def _tokens(query):
+    return re.findall(r'\w+', query.lower())[:8]
+
+def _type_condition(file_type, column):
+    """SQL condition (and params) for a listing type filter"""
+    placeholders = ', '.join(['%s'] * len(DOCUMENT_MIME_TYPES))
+    if file_type in ('image', 'video'):
+        return f"{column} LIKE %s", [f'{file_type}/%']
+    if file_type == 'document':
+        return f"{column} IN ({placeholders})", list(DOCUMENT_MIME_TYPES)
+    if file_type == 'other':
+        return (
+            f"{column} NOT LIKE %s AND {column} NOT LIKE %s AND {column} NOT IN ({placeholders})",
+            ['image/%', 'video/%', *DOCUMENT_MIME_TYPES]
+        )
+    return None, []
+
+class SearchIndexManager:
+    """Manager class for the search backends and the SQLite FTS5 mirror"""
+
+    _fts_available = False
+
+    def backend(self):
+        if connection.vendor == 'postgresql':
+            return 'postgresql'
+        if connection.vendor == 'sqlite' and self._fts_table_exists():
+            return 'fts5'
+        return 'basic'
+
+    def _fts_table_exists(self):
+        # Only a positive answer is remembered: the table appears once migrations run
+        if not self._fts_available:
+            self._fts_available = FTS_TABLE in connection.introspection.table_names()
+        return self._fts_available
+
+    # SQLite mirror maintenance (no-ops on other backends)
+
+    def file_changed(self, file_obj, update_fields=None):
+        if update_fields is not None and not INDEXED_FILE_FIELDS & set(update_fields):
+            return
+        if self.backend() != 'fts5':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE item_id = %s", [_hex(file_obj.id)])
+            if file_obj.status == 'ready':
+                cursor.execute(
+                    f"INSERT INTO {FTS_TABLE} (name, description, item_id, kind, owner_id, folder_id, mime_type) "
+                    f"VALUES (%s, %s, %s, 'file', %s, %s, %s)",
+                    [file_obj.name, file_obj.description, _hex(file_obj.id), file_obj.owner_id,
+                     _hex(file_obj.folder_id), file_obj.mime_type]
+                )
+
+    def files_changed(self, file_objs):
+        """Re-index many files with two statements"""
+        if not file_objs or self.backend() != 'fts5':
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE item_id = %s", [[_hex(f.id)] for f in file_objs])
+            rows = [
+                [f.name, f.description, _hex(f.id), f.owner_id, _hex(f.folder_id), f.mime_type]
+                for f in file_objs if f.status == 'ready'
+            ]
+            if rows:
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (name, description, item_id, kind, owner_id, folder_id, mime_type) "
+                    f"VALUES (%s, %s, %s, 'file', %s, %s, %s)",
+                    rows
+                )
+
+    def folder_changed(self, folder):
+        if self.backend() != 'fts5':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE item_id = %s", [_hex(folder.id)])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (name, description, item_id, kind, owner_id, folder_id, mime_type) "
+                f"VALUES (%s, '', %s, 'folder', %s, %s, '')",
+                [folder.name, _hex(folder.id), folder.owner_id, _hex(folder.parent_id)]
+            )
+
+    def remove(self, item_ids):
+        if not item_ids or self.backend() != 'fts5':
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE item_id = %s", [[_hex(item_id)] for item_id in item_ids])
+
+    def remove_folder_tree(self, folder_id):
+        """Drop a folder and everything below it (they go with it by cascade)"""
+        if self.backend() != 'fts5':
+            return
+        path = Folder.objects.filter(id=folder_id).values_list('path', flat=True).first() or ''
+        folder_ids = list(Folder.objects.filter(Folder.subtree_q(path)).values_list('id', flat=True)) if path else [folder_id]
+        file_ids = list(File.objects.filter(folder_id__in=folder_ids).values_list('id', flat=True))
+        self.remove(folder_ids + file_ids)
+
+    def rebuild(self):
+        """Refill the FTS5 mirror from the files and folders tables"""
+        if self.backend() != 'fts5':
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (name, description, item_id, kind, owner_id, folder_id, mime_type) "
+                f"SELECT name, description, id, 'file', owner_id, folder_id, mime_type FROM files_file WHERE status = 'ready'"
+            )
+            files = cursor.rowcount
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (name, description, item_id, kind, owner_id, folder_id, mime_type) "
+                f"SELECT name, '', id, 'folder', owner_id, parent_id, '' FROM files_folder"
+            )
+            return files + cursor.rowcount
+
+    # Queries
+
+    def _search_postgresql(self, kind, user, tokens, raw_query, folder_id, file_type, limit):
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        if kind == 'file':
+            table, alias, vector, parent = 'files_file', 'f', PG_FILE_TSVECTOR, 'folder_id'
+            conditions, params = ["f.owner_id = %s", "f.status = 'ready'"], [user.id]
+        else:
+            table, alias, vector, parent = 'files_folder', 'd', PG_FOLDER_TSVECTOR, 'parent_id'
+            conditions, params = ["d.owner_id = %s"], [user.id]
+
+        if folder_id:
+            conditions.append(f"{alias}.{parent} = %s")
+            params.append(folder_id)
+        if kind == 'file':
+            type_sql, type_params = _type_condition(file_type, 'f.mime_type')
+            if type_sql:
+                conditions.append(type_sql)
+                params.extend(type_params)
+
+        sql = (
+            f"SELECT {alias}.id, ts_rank({vector}, q) + similarity({alias}.name, %s) AS rank "
+            f"FROM {table} {alias}, to_tsquery('simple', %s) q "
+            f"WHERE {' AND '.join(conditions)} AND ({vector} @@ q OR {alias}.name %% %s) "
+            f"ORDER BY rank DESC, {alias}.id LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [raw_query, tsquery, *params, raw_query, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def _search_fts5(self, kind, user, tokens, folder_id, file_type, limit):
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        conditions, params = ["kind = %s", "owner_id = %s"], [kind, user.id]
+        if folder_id:
+            conditions.append("folder_id = %s")
+            params.append(_hex(folder_id))
+        if kind == 'file':
+            type_sql, type_params = _type_condition(file_type, 'mime_type')
+            if type_sql:
+                conditions.append(type_sql)
+                params.extend(type_params)
+
+        sql = (
+            f"SELECT item_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND {' AND '.join(conditions)} "
+            f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, *params, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def _search_basic(self, kind, user, tokens, folder_id, file_type, limit):
+        """Unindexed fallback for databases without a search index"""
+        if kind == 'file':
+            queryset = File.objects.filter(owner=user, status='ready')
+            if folder_id:
+                queryset = queryset.filter(folder_id=folder_id)
+            if file_type in ('image', 'video'):
+                queryset = queryset.filter(mime_type__startswith=f'{file_type}/')
+            elif file_type == 'document':
+                queryset = queryset.filter(mime_type__in=DOCUMENT_MIME_TYPES)
+            elif file_type == 'other':
+                queryset = queryset.exclude(mime_type__startswith='image/').exclude(
+                    mime_type__startswith='video/'
+                ).exclude(mime_type__in=DOCUMENT_MIME_TYPES)
+        else:
+            queryset = Folder.objects.filter(owner=user)
+            if folder_id:
+                queryset = queryset.filter(parent_id=folder_id)
+        for token in tokens:
+            queryset = queryset.filter(name__icontains=token)
+        return list(queryset.order_by('name').values_list('id', flat=True)[:limit])
+
+    def search(self, user, query, folder_id=None, file_type=None, limit=50):
+        """Return (files, folders) matching `query`, best match first"""
+        tokens = _tokens(query)
+        if not tokens:
+            return [], []
+        if folder_id:
+            folder_id = str(uuid.UUID(str(folder_id)))  # Raises ValueError for malformed ids
+
+        backend = self.backend()
+        results = {}
+        for kind in ('file', 'folder'):
+            if kind == 'folder' and file_type:
+                results[kind] = []
+            elif backend == 'postgresql':
+                results[kind] = self._search_postgresql(kind, user, tokens, query, folder_id, file_type, limit)
+            elif backend == 'fts5':
+                results[kind] = self._search_fts5(kind, user, tokens, folder_id, file_type, limit)
+            else:
+                results[kind] = self._search_basic(kind, user, tokens, folder_id, file_type, limit)
+
+        files = file_listing_queryset(File.objects.filter(id__in=results['file']))
+        folders = Folder.objects.filter(id__in=results['folder'])
+        return self._in_order(files, results['file']), self._in_order(folders, results['folder'])
+
+    @staticmethod
+    def _in_order(queryset, ids):
+        # The mirror may briefly list rows that no longer exist; they are dropped here
+        by_id = {obj.id.hex: obj for obj in queryset}
+        return [by_id[_hex(item_id)] for item_id in ids if _hex(item_id) in by_id]
+
+# Global instance
+search_index = SearchIndexManager()
@@ -1,26 +1,27 @@
 from rest_framework import serializers
-from django.db import models
 from .models import File, Folder, Share, Invite, FileVersion, FileActivity, Activity
-import uuid
 
 class FolderSerializer(serializers.ModelSerializer):
-    subfolders_count = serializers.SerializerMethodField()
-    files_count = serializers.SerializerMethodField()
-    total_size = serializers.SerializerMethodField()
+    # Materialized counters, see folder_counters.py
+    total_size = serializers.IntegerField(source='total_size_bytes', read_only=True)
     
     class Meta:
         model = Folder
-        fields = ('id', 'name', 'parent', 'created_at', 'updated_at', 'subfolders_count', 'files_count', 'total_size')
-        read_only_fields = ('id', 'created_at', 'updated_at')
-    
-    def get_subfolders_count(self, obj):
-        return obj.subfolders.count()
-    
-    def get_files_count(self, obj):
-        return obj.files.filter(status='ready').count()
+        fields = (
+            'id', 'name', 'parent', 'created_at', 'updated_at', 'subfolders_count', 'files_count', 'total_size',
+            'tree_files_count', 'tree_size_bytes'
+        )
+        read_only_fields = (
+            'id', 'created_at', 'updated_at', 'subfolders_count', 'files_count', 'tree_files_count', 'tree_size_bytes'
+        )
     
-    def get_total_size(self, obj):
-        return obj.files.filter(status='ready').aggregate(total=models.Sum('size_bytes'))['total'] or 0
+    def __init__(self, *args, **kwargs):
+        # Optional sparse fieldset, like FileSerializer
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 class FileVersionSerializer(serializers.ModelSerializer):
     created_by_name = serializers.CharField(source='created_by.name', read_only=True)
@@ -37,6 +38,17 @@ class FileActivitySerializer(serializers.ModelSerializer):
         model = FileActivity
         fields = ('id', 'action', 'details', 'created_at', 'user_name', 'user_email')
 
+class RecentFileActivitySerializer(serializers.ModelSerializer):
+    """Activity entries in the FileActivitySerializer shape, for file details"""
+    details = serializers.JSONField(source='metadata', read_only=True)
+    created_at = serializers.DateTimeField(source='timestamp', read_only=True)
+    user_name = serializers.CharField(source='user.name', read_only=True)
+    user_email = serializers.CharField(source='user.email', read_only=True)
+    
+    class Meta:
+        model = Activity
+        fields = ('id', 'action', 'details', 'created_at', 'user_name', 'user_email')
+
 class FileSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
     thumbnail_urls = serializers.SerializerMethodField()
@@ -64,6 +76,14 @@ class FileSerializer(serializers.ModelSerializer):
             'versions_count', 'share_links_count'
         )
     
+    def __init__(self, *args, **kwargs):
+        # Optional sparse fieldset, see listing.parse_file_fields
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+    
     def get_file_url(self, obj):
         if obj.status == 'ready':
             return obj.file_url  # Uses the new property that handles Cloudinary URLs
@@ -83,10 +103,16 @@ class FileSerializer(serializers.ModelSerializer):
             return obj.get_preview_url()
         return None
     
+    # Listings annotate these counts (see listing.file_listing_queryset);
+    # single objects fall back to a query each
     def get_versions_count(self, obj):
+        if hasattr(obj, 'versions_count'):
+            return obj.versions_count
         return obj.versions.count()
     
     def get_share_links_count(self, obj):
+        if hasattr(obj, 'share_links_count'):
+            return obj.share_links_count
         return obj.shares.filter(is_active=True).count()
 
 class FileDetailSerializer(FileSerializer):
@@ -97,8 +123,18 @@ class FileDetailSerializer(FileSerializer):
         fields = FileSerializer.Meta.fields + ('versions', 'recent_activity')
     
     def get_recent_activity(self, obj):
-        activities = obj.activities.all()[:10]
-        return FileActivitySerializer(activities, many=True).data
+        activities = Activity.objects.filter(
+            object_type='file', object_id=obj.id
+        ).select_related('user').order_by('-timestamp')[:10]
+        # History logged before the Activity table is still in FileActivity
+        legacy = obj.activities.select_related('user').order_by('-created_at')[:10]
+        entries = sorted(
+            [*activities, *legacy], key=lambda e: e.timestamp if isinstance(e, Activity) else e.created_at, reverse=True
+        )[:10]
+        return [
+            (RecentFileActivitySerializer if isinstance(entry, Activity) else FileActivitySerializer)(entry).data
+            for entry in entries
+        ]
 
 class FileUploadSerializer(serializers.ModelSerializer):
     file = serializers.FileField()
@@ -113,8 +149,13 @@ class FileUploadSerializer(serializers.ModelSerializer):
         validated_data['size_bytes'] = file_obj.size
         validated_data['mime_type'] = file_obj.content_type or 'application/octet-stream'
         validated_data['owner'] = self.context['request'].user
-        validated_data['storage_key'] = f'files/{self.context["request"].user.id}/{uuid.uuid4()}/{file_obj.name}'
-        return super().create(validated_data)
+        # Store the upload first: its storage name is the storage_key, so the bytes can be released by key
+        upload = validated_data.pop('file')
+        instance = File(**validated_data)
+        instance.file.save(upload.name, upload, save=False)
+        instance.storage_key = instance.file.name
+        instance.save()
+        return instance
 
 class FileRenameSerializer(serializers.Serializer):
     new_name = serializers.CharField(max_length=255)
@@ -0,0 +1,76 @@
+"""
+Queries behind the shared-with-me listing.
+Shares are read with their file or folder and the sharing user joined in the
+same query and returned as .values() rows, so a page costs one query however
+many shares a collaborator holds. Pages use keyset pagination (see pagination)
+on the share time or the item name. Contents of shared folders are listed
+from the folder's subtree range, after an effective-permission check.
+"""
+
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import File, Folder, Share
+
+# Public sort names -> columns of shared_items_queryset()
+SHARED_SORT_FIELDS = {'shared_at': 'created_at', 'name': 'item_name'}
+
+def shared_sort(sort_by):
+    """Column sort (with direction) for a public sort name; newest shares first by default"""
+    descending = sort_by.startswith('-')
+    column = SHARED_SORT_FIELDS.get(sort_by.lstrip('-'))
+    if column is None:
+        return '-created_at'
+    return f'-{column}' if descending else column
+
+def shared_items_queryset(user, item_type=None, permission=None, query=''):
+    """Active, unexpired shares targeting the user, joined with their item and sharer"""
+    now = timezone.now()
+    shares = Share.objects.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=now),
+        Q(file__isnull=False) | Q(folder__isnull=False),
+        target_user=user,
+        is_active=True
+    )
+    if item_type == 'file':
+        shares = shares.filter(file__isnull=False)
+    elif item_type == 'folder':
+        shares = shares.filter(folder__isnull=False)
+    if permission:
+        shares = shares.filter(permission=permission)
+
+    shares = shares.annotate(item_name=Coalesce(F('file__name'), F('folder__name')))
+    if query:
+        shares = shares.filter(item_name__icontains=query)
+    return shares.annotate(
+        item_created_at=Coalesce(F('file__created_at'), F('folder__created_at')),
+        item_modified_at=Coalesce(F('file__modified_at'), F('folder__updated_at')),
+    ).values(
+        'id', 'file_id', 'folder_id', 'permission', 'created_at', 'item_name', 'item_created_at',
+        'item_modified_at', 'file__size_bytes', 'file__mime_type', 'actor__email'
+    )
+
+def shared_item_row(row):
+    """The shared-with-me item representation of a shared_items_queryset() row"""
+    return {
+        'share_id': str(row['id']),
+        'item_type': 'file' if row['file_id'] else 'folder',
+        'item': {
+            'id': str(row['file_id'] or row['folder_id']),
+            'name': row['item_name'],
+            'size_bytes': row['file__size_bytes'],
+            'mime_type': row['file__mime_type'],
+            'created_at': row['item_created_at'],
+            'modified_at': row['item_modified_at']
+        },
+        'permission': row['permission'],
+        'shared_by': row['actor__email'],
+        'shared_at': row['created_at']
+    }
+
+def shared_folder_files(folder, recursive=False):
+    """Ready files directly in a shared folder, or anywhere in its subtree (one index range)"""
+    files = File.objects.filter(owner_id=folder.owner_id, status='ready')
+    if recursive:
+        return files.filter(folder__in=Folder.objects.filter(Folder.subtree_q(folder.path)).values('id'))
+    return files.filter(folder_id=folder.id)
@@ -0,0 +1,103 @@
+"""
+Storage-key helpers shared by every storage backend.
+A storage_key identifies stored content independently of the File row, so
+versions, pruning and cleanup can reach the right backend from the key alone.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
+import logging
+
+logger = logging.getLogger(__name__)
+
+def storage_backend_for_key(storage_key):
+    """Return the storage type a storage_key belongs to"""
+    if storage_key.startswith('lob/'):
+        return 'postgres_lob'
+    if storage_key.startswith('s3/'):
+        return 's3'
+    if storage_key.startswith('pack/'):
+        return 'pack'
+    if storage_key.startswith('cas/'):
+        return 'chunked'
+    if storage_key.startswith('filora/'):
+        return 'cloudinary'
+    return 'local_file'
+
+def is_storage_key_referenced(storage_key, exclude_version_ids=()):
+    """Whether any file or (non-excluded) version still points at this content"""
+    from .models import File, FileVersion
+    if File.objects.filter(storage_key=storage_key).exists():
+        return True
+    return FileVersion.objects.filter(storage_key=storage_key).exclude(id__in=exclude_version_ids).exists()
+
+def release_storage_key(storage_key):
+    """Free the stored content behind a storage_key through its backend (local files are keyed by their storage name)"""
+    backend = storage_backend_for_key(storage_key)
+    value = storage_key.split('/', 1)[1] if backend != 'local_file' else storage_key
+
+    if backend == 'postgres_lob':
+        from .lob_utils import lob_manager
+        lob_manager.delete_lob(int(value))
+    elif backend == 's3':
+        from .s3_utils import s3_manager
+        s3_manager.delete_object(value)
+    elif backend == 'pack':
+        from .pack_utils import pack_manager
+        pack_manager.delete_entry(value)
+    elif backend == 'chunked':
+        from .chunk_store import chunk_store
+        chunk_store.release(value)
+    elif backend == 'cloudinary':
+        if getattr(settings, 'USE_CLOUDINARY', False):
+            import cloudinary.uploader
+            # The resource type is not part of the key, so try each in turn
+            for resource_type in ('raw', 'image', 'video'):
+                result = cloudinary.uploader.destroy(storage_key, resource_type=resource_type)
+                if result.get('result') == 'ok':
+                    break
+    elif default_storage.exists(storage_key):
+        default_storage.delete(storage_key)
+    else:
+        logger.debug(f"No stored content found for {storage_key}")
+
+def is_missing_content(error):
+    """Whether a read failed because the stored content is gone, as opposed to a transient error"""
+    if isinstance(error, (FileNotFoundError, ObjectDoesNotExist)):  # Local, pack and chunk files, their rows
+        return True
+    if getattr(error, 'pgcode', None) == '42704':  # Large object does not exist
+        return True
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):  # botocore ClientError
+        return response.get('Error', {}).get('Code') in ('NoSuchKey', 'NotFound', '404')
+    return getattr(response, 'status_code', None) in (404, 410)  # requests HTTPError (Cloudinary)
+
+def iter_file_content(file_obj, chunk_size=64 * 1024):
+    """Generator over the stored bytes of a file, whatever backend holds them"""
+    if file_obj.storage_type == 's3' and file_obj.s3_object_key:
+        from .s3_utils import s3_manager
+        yield from s3_manager.read_object(file_obj.s3_object_key, chunk_size=chunk_size)
+    elif file_obj.storage_type == 'pack' and file_obj.pack_entry_id:
+        from .pack_utils import pack_manager
+        yield pack_manager.read(file_obj.pack_entry_id)
+    elif file_obj.storage_type == 'chunked' and file_obj.chunk_manifest_id:
+        from .chunk_store import chunk_store
+        yield from chunk_store.read(file_obj.chunk_manifest_id, chunk_size=chunk_size)
+    elif file_obj.storage_type == 'postgres_lob' and file_obj.postgres_lob_oid:
+        from .lob_utils import lob_manager
+        yield from lob_manager.read_lob(file_obj.postgres_lob_oid, chunk_size=chunk_size)
+    elif file_obj.storage_type == 'cloudinary' and (file_obj.cloudinary_secure_url or file_obj.cloudinary_url):
+        import requests
+        with requests.get(file_obj.cloudinary_secure_url or file_obj.cloudinary_url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size)
+    elif file_obj.file:
+        with default_storage.open(file_obj.file.name, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    else:
+        raise FileNotFoundError(f"No stored content for file {file_obj.id}")
@@ -1,3 +1,1948 @@
-from django.test import TestCase
+import os
+import base64
+import gzip
+import json
+import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.test import APIClient
+from django.core.files.uploadedfile import SimpleUploadedFile
+from .models import (
+    File, FileVersion, UploadSession, PackSegment, PackEntry, ContentChunk, ChunkManifest,
+    VersionRetentionPolicy, ScrubCursor, Folder, Share, Activity, FolderDeletionJob, StorageReclaimTask,
+    UserStats, UserDailyStats, ChangeJournalEntry, Invite, FileActivity
+)
+from .s3_utils import s3_manager, MIN_PART_SIZE
+from .pack_utils import pack_manager
+from .chunk_store import chunk_store
+from .retention import RetentionPolicy, VersionPruner, select_versions_to_prune
+from .scrubber import IntegrityScrubber
+from .cache_utils import get_generation
+from .listing import file_listing_queryset, COMPACT_FILE_FIELDS
+from .folder_counters import folder_counters
+from .pagination import apply_keyset
+from .audit import audit_sink
+from .activity_log import activity_archiver
+from .change_journal import change_journal
+from .search import search_index
+from .bulk_delete import StorageReclaimer, folder_delete_engine
+from .user_stats import user_stats
+from .file_rows import build_file_rows, file_rows_queryset
+from .renderers import dumps, orjson
+from .permissions import access_resolver
+from .serializers import FileSerializer
+from integrations.models import Webhook, WebhookDelivery
+from rest_framework.renderers import JSONRenderer
 
-# Create your tests here.
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+User = get_user_model()
+
+S3_TEST_STORAGE = {
+    'BUCKET_NAME': 'filora-test',
+    'ENDPOINT_URL': '',
+    'REGION_NAME': 'us-east-1',
+    'ACCESS_KEY_ID': 'testing',
+    'SECRET_ACCESS_KEY': 'testing',
+    'PRESIGNED_URL_EXPIRY': 3600,
+}
+
+@skipUnless(mock_aws, 'boto3 and moto are required for S3 tests')
+@override_settings(USE_S3=True, S3_STORAGE=S3_TEST_STORAGE)
+class S3MultipartUploadTestCase(TestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        s3_manager.reset_client()
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='filora-test')
+
+        self.user = User.objects.create_user(
+            email='s3@example.com',
+            username='s3user',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.mock.stop()
+        s3_manager.reset_client()
+
+    def test_chunks_map_to_multipart_parts(self):
+        data = b'a' * MIN_PART_SIZE + b'tail'
+        response = self.client.post('/api/uploads/init/', {
+            'filename': 'big.bin', 'size': len(data), 'mime_type': 'application/octet-stream'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['use_s3'])
+        self.assertEqual(len(response.data['part_upload_urls']), 2)
+        upload_id = response.data['upload_id']
+        chunk_size = response.data['chunk_size']
+
+        # Upload the chunks out of order, as parallel clients would
+        for chunk_number in (1, 0):
+            chunk = data[chunk_number * chunk_size:(chunk_number + 1) * chunk_size]
+            response = self.client.post(f'/api/uploads/{upload_id}/chunk/', {
+                'chunk': SimpleUploadedFile('chunk', chunk),
+                'chunk_number': chunk_number,
+                'total_chunks': 2,
+            })
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+
+        file_obj = File.objects.get(id=response.data['id'])
+        self.assertEqual(file_obj.storage_type, 's3')
+        self.assertEqual(file_obj.size_bytes, len(data))
+        self.assertEqual(b''.join(s3_manager.read_object(file_obj.s3_object_key)), data)
+        self.assertEqual(b''.join(s3_manager.read_object(file_obj.s3_object_key, 0, 3)), b'aaaa')
+        self.assertEqual(UploadSession.objects.get(id=upload_id).status, 'completed')
+
+        # Downloads are handed off to a presigned URL
+        response = self.client.get(f'/api/files/{file_obj.id}/download/')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('X-Amz-Signature', response['Location'])
+
+    def test_cancel_aborts_multipart_upload(self):
+        response = self.client.post('/api/uploads/init/', {
+            'filename': 'small.txt', 'size': 10, 'mime_type': 'text/plain'
+        }, format='json')
+        upload_id = response.data['upload_id']
+        session = UploadSession.objects.get(id=upload_id)
+
+        response = self.client.delete(f'/api/uploads/{upload_id}/cancel/')
+        self.assertEqual(response.status_code, 200)
+
+        uploads = s3_manager.client.list_multipart_uploads(Bucket='filora-test').get('Uploads', [])
+        self.assertFalse([u for u in uploads if u['UploadId'] == session.s3_upload_id])
+
+
+class TempMediaMixin:
+    """Point MEDIA_ROOT (and everything derived from it) at a throwaway directory"""
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root, PACK_STORAGE={
+            'ROOT': f'{self.media_root}/packs',
+            'THRESHOLD': 1024,
+            'SEGMENT_MAX_BYTES': 4096,
+            'COMPACTION_RATIO': 0.5,
+        }, CHUNK_STORAGE={
+            'ROOT': f'{self.media_root}/chunks',
+            'MIN_CHUNK_SIZE': 1024,
+            'AVG_CHUNK_SIZE': 4096,
+            'MAX_CHUNK_SIZE': 16384,
+        })
+        self.media_override.enable()
+
+    def tearDown(self):
+        self.media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+@override_settings(USE_PACK_STORAGE=True, USE_CLOUDINARY=False)
+class PackStorageTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email='pack@example.com',
+            username='packuser',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_small_upload_is_packed(self):
+        data = b'{"small": true}'
+        response = self.client.post('/api/uploads/init/', {
+            'filename': 'small.json', 'size': len(data), 'mime_type': 'application/json'
+        }, format='json')
+        upload_id = response.data['upload_id']
+        self.client.post(f'/api/uploads/{upload_id}/chunk/', {
+            'chunk': SimpleUploadedFile('chunk', data), 'chunk_number': 0, 'total_chunks': 1,
+        })
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+
+        file_obj = File.objects.get(id=response.data['id'])
+        self.assertEqual(file_obj.storage_type, 'pack')
+        self.assertEqual(pack_manager.read(file_obj.pack_entry_id), data)
+
+        response = self.client.get(f'/api/files/{file_obj.id}/download/')
+        self.assertEqual(response.content, data)
+
+    def test_stream_ranges(self):
+        entry = pack_manager.append(b'0123456789')
+        file_obj = File.objects.create(
+            name='clip.mp3', owner=self.user, size_bytes=10, mime_type='audio/mpeg',
+            storage_type='pack', storage_key=f'pack/{entry.id}'
+        )
+        url = f'/api/files/{file_obj.id}/stream/'
+        for header, body, content_range in (
+            ('bytes=2-4', b'234', 'bytes 2-4/10'),
+            ('bytes=7-', b'789', 'bytes 7-9/10'),
+            ('bytes=-3', b'789', 'bytes 7-9/10'),
+            ('bytes=8-100', b'89', 'bytes 8-9/10'),
+        ):
+            response = self.client.get(url, HTTP_RANGE=header)
+            self.assertEqual((response.status_code, response.content, response['Content-Range']), (206, body, content_range), header)
+        for header in ('bytes=5-2', 'bytes=10-', 'bytes=-0', 'bytes=x-y'):
+            response = self.client.get(url, HTTP_RANGE=header)
+            self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'), header)
+
+    def test_compaction_rewrites_mostly_dead_segments(self):
+        entries = [pack_manager.append(bytes([i]) * 1000) for i in range(5)]
+        sealed = entries[0].segment
+        self.assertTrue(PackSegment.objects.get(id=sealed.id).is_sealed)
+
+        for entry in entries[:3]:
+            pack_manager.delete_entry(entry.id)
+
+        reclaimed = pack_manager.compact()
+        self.assertEqual(reclaimed, 3000)
+        self.assertFalse(PackSegment.objects.filter(id=sealed.id).exists())
+        self.assertFalse(PackEntry.objects.filter(is_deleted=True).exists())
+        self.assertEqual(pack_manager.read(entries[3].id), bytes([3]) * 1000)
+        self.assertEqual(pack_manager.read(entries[4].id, 10, 5), bytes([4]) * 5)
+
+
+@override_settings(USE_CHUNK_STORE=True, USE_PACK_STORAGE=False, USE_CLOUDINARY=False)
+class ChunkStoreTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email='chunks@example.com',
+            username='chunkuser',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _upload(self, data, **extra):
+        response = self.client.post('/api/uploads/init/', {
+            'filename': 'doc.bin', 'size': len(data), 'mime_type': 'application/octet-stream', **extra
+        }, format='json')
+        upload_id = response.data['upload_id']
+        self.client.post(f'/api/uploads/{upload_id}/chunk/', {
+            'chunk': SimpleUploadedFile('chunk', data), 'chunk_number': 0, 'total_chunks': 1,
+        })
+        return self.client.post(f'/api/uploads/{upload_id}/complete/')
+
+    def test_edited_versions_share_chunks(self):
+        original = os.urandom(200 * 1024)
+        edited = original[:100000] + b'inserted bytes' + original[100000:]
+
+        response = self._upload(original)
+        self.assertEqual(response.status_code, 201)
+        file_id = response.data['id']
+        chunks_after_first = ContentChunk.objects.count()
+
+        response = self._upload(edited, file_id=file_id)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['id'], file_id)
+
+        file_obj = File.objects.get(id=file_id)
+        self.assertEqual(file_obj.storage_type, 'chunked')
+        self.assertEqual(file_obj.version, 2)
+        self.assertEqual(file_obj.versions.count(), 1)
+        self.assertEqual(b''.join(chunk_store.read(file_obj.chunk_manifest_id)), edited)
+
+        # Content-defined boundaries resynchronise after the insertion
+        new_chunks = ContentChunk.objects.count() - chunks_after_first
+        self.assertLess(new_chunks, 6)
+        self.assertLess(new_chunks * 4, chunks_after_first)
+
+    def test_range_reads_and_release(self):
+        data = os.urandom(100 * 1024)
+        manifest = chunk_store.store(data)
+        self.assertEqual(b''.join(chunk_store.read(manifest.id, 5000, 70000)), data[5000:70001])
+        self.assertEqual(b''.join(chunk_store.read(manifest.id, 0, 0)), data[:1])
+
+        duplicate = chunk_store.store(data)
+        chunk_store.release(manifest.id)
+        self.assertEqual(chunk_store.collect_garbage(), 0)
+
+        chunk_store.release(duplicate.id)
+        self.assertEqual(chunk_store.collect_garbage(), len(data))
+        self.assertFalse(ContentChunk.objects.exists())
+        self.assertFalse(ChunkManifest.objects.exists())
+
+    def test_garbage_collection_removes_files_while_holding_their_rows(self):
+        data = os.urandom(32 * 1024)
+        chunk_store.release(chunk_store.store(data).id)
+        real_remove, rows_at_removal = os.remove, []
+
+        def remove(path):
+            rows_at_removal.append(ContentChunk.objects.filter(digest=os.path.basename(path)).exists())
+            real_remove(path)
+
+        with patch('files.chunk_store.os.remove', side_effect=remove):
+            self.assertEqual(chunk_store.collect_garbage(), len(data))
+        self.assertTrue(rows_at_removal)
+        self.assertTrue(all(rows_at_removal))
+        self.assertFalse(ContentChunk.objects.exists())
+
+        manifest = chunk_store.store(data)
+        self.assertEqual(b''.join(chunk_store.read(manifest.id)), data)
+
+    def test_release_is_idempotent(self):
+        data = os.urandom(32 * 1024)
+        kept, released = chunk_store.store(data), chunk_store.store(data)
+        chunk_store.release(released.id)
+        chunk_store.release(released.id)
+        self.assertEqual(chunk_store.collect_garbage(), 0)
+        self.assertEqual(b''.join(chunk_store.read(kept.id)), data)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'row locks across connections need PostgreSQL')
+@override_settings(USE_CHUNK_STORE=True)
+class ChunkStoreConcurrencyTestCase(TempMediaMixin, TransactionTestCase):
+    def _in_thread(self, results, name, target, *args):
+        def run():
+            try:
+                results[name] = target(*args)
+            finally:
+                connection.close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_store_waits_for_garbage_collection_of_its_chunks(self):
+        data = os.urandom(32 * 1024)
+        chunk_store.release(chunk_store.store(data).id)
+        real_remove, removing, resume = os.remove, threading.Event(), threading.Event()
+
+        def remove(path):
+            removing.set()
+            resume.wait(10)
+            real_remove(path)
+
+        results = {}
+        with patch('files.chunk_store.os.remove', side_effect=remove):
+            collector = self._in_thread(results, 'reclaimed', chunk_store.collect_garbage)
+            self.assertTrue(removing.wait(10))
+            storer = self._in_thread(results, 'manifest', chunk_store.store, data)
+            storer.join(0.5)
+            self.assertTrue(storer.is_alive())  # Waits on the chunk rows the collector holds
+            resume.set()
+            collector.join(10)
+            storer.join(10)
+
+        self.assertEqual(results['reclaimed'], len(data))
+        self.assertEqual(b''.join(chunk_store.read(results['manifest'].id)), data)
+
+
+class VersionRetentionTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email='retention@example.com',
+            username='retentionuser',
+            password='testpass123'
+        )
+
+    def test_thinning_keeps_newest_per_day_and_week(self):
+        now = timezone.now()
+        versions = [
+            ('today-1', now - timedelta(hours=1)),
+            ('today-2', now - timedelta(hours=2)),
+            ('3-days', now - timedelta(days=3)),
+            ('20-days-a', now - timedelta(days=20)),
+            ('20-days-b', now - timedelta(days=20, hours=1)),
+            ('400-days', now - timedelta(days=400)),
+        ]
+        policy = RetentionPolicy(max_versions=10, max_age_days=365, keep_daily_days=7, keep_weekly_weeks=8)
+        pruned = select_versions_to_prune(versions, policy, now)
+        self.assertEqual(set(pruned), {'today-2', '20-days-b', '400-days'})
+
+        policy = RetentionPolicy(max_versions=2)
+        self.assertEqual(select_versions_to_prune(versions, policy, now), ['3-days', '20-days-a', '20-days-b', '400-days'])
+
+    def test_restore_brings_back_the_storage_type(self):
+        file_obj = File.objects.create(
+            name='movie.mp4', owner=self.user, size_bytes=5, mime_type='video/mp4',
+            storage_type='postgres_lob', storage_key='lob/4242', postgres_lob_oid=4242
+        )
+        manifest = chunk_store.store(b'v2')
+        file_obj.replace_content(
+            self.user, storage_type='chunked', storage_key=f'cas/{manifest.id}', size_bytes=2, postgres_lob_oid=None
+        )
+        version = file_obj.versions.get()
+        self.assertEqual(version.storage_type, 'postgres_lob')
+
+        self.assertTrue(file_obj.restore_version(version.id, self.user))
+        file_obj.refresh_from_db()
+        self.assertEqual((file_obj.storage_type, file_obj.storage_key, file_obj.postgres_lob_oid), ('postgres_lob', 'lob/4242', 4242))
+        self.assertEqual(file_obj.versions.get(version_number=2).storage_type, 'chunked')
+
+    def test_pruner_deletes_versions_and_releases_storage(self):
+        file_obj = File.objects.create(
+            name='doc.txt', owner=self.user, size_bytes=5, mime_type='text/plain',
+            storage_type='chunked', storage_key=f'cas/{chunk_store.store(b"v1").id}'
+        )
+        for content in (b'v2', b'v3', b'v4'):
+            manifest = chunk_store.store(content)
+            file_obj.replace_content(self.user, storage_key=f'cas/{manifest.id}', size_bytes=len(content))
+        self.assertEqual(file_obj.versions.count(), 3)
+
+        VersionRetentionPolicy.objects.create(user=self.user, max_versions=1)
+        deleted, _ = VersionPruner().run()
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual(list(file_obj.versions.values_list('version_number', flat=True)), [3])
+        self.assertEqual(ChunkManifest.objects.count(), 2)
+        chunk_store.collect_garbage()
+        self.assertEqual(ContentChunk.objects.count(), 2)
+
+
+class IntegrityScrubberTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email='scrub@example.com',
+            username='scrubuser',
+            password='testpass123'
+        )
+
+    def _packed_file(self, data, checksum=None):
+        entry = pack_manager.append(data)
+        return File.objects.create(
+            name='small.txt', owner=self.user, size_bytes=len(data), mime_type='text/plain',
+            storage_type='pack', storage_key=f'pack/{entry.id}',
+            checksum=hashlib.sha256(data).hexdigest() if checksum is None else checksum
+        )
+
+    def test_scrub_marks_damaged_files_unavailable(self):
+        good = self._packed_file(b'good bytes')
+        unchecked = self._packed_file(b'no checksum yet', checksum='')
+        damaged = self._packed_file(b'will rot')
+
+        entry = PackEntry.objects.select_related('segment').get(id=damaged.pack_entry_id)
+        with open(os.path.join(pack_manager.root, entry.segment.path), 'r+b') as f:
+            f.seek(entry.offset)
+            f.write(b'W')
+
+        scrubber = IntegrityScrubber(workers=1, bytes_per_second=0, batch_size=2)
+        self.assertEqual(scrubber.run_batch(), 2)
+        self.assertIsNotNone(ScrubCursor.objects.get(name='default').last_file_id)
+        self.assertEqual(scrubber.run_pass(), 1)
+
+        good.refresh_from_db()
+        unchecked.refresh_from_db()
+        damaged.refresh_from_db()
+        self.assertEqual(good.status, 'ready')
+        self.assertEqual(unchecked.checksum, hashlib.sha256(b'no checksum yet').hexdigest())
+        self.assertEqual(damaged.status, 'unavailable')
+
+        cursor = ScrubCursor.objects.get(name='default')
+        self.assertIsNone(cursor.last_file_id)
+        self.assertEqual(cursor.passes_completed, 1)
+        self.assertEqual((cursor.files_verified, cursor.files_failed), (2, 1))
+
+    def test_checksum_backfill_invalidates_listings(self):
+        folder = Folder.objects.create(name='Docs', owner=self.user)
+        unchecked = self._packed_file(b'no checksum yet', checksum='')
+        File.objects.filter(id=unchecked.id).update(folder=folder)
+        generation = get_generation(self.user.id)
+        version = Folder.objects.get(id=folder.id).change_version
+        IntegrityScrubber(workers=1, bytes_per_second=0).run_pass()
+        self.assertGreater(Folder.objects.get(id=folder.id).change_version, version)
+        self.assertNotEqual(get_generation(self.user.id), generation)
+
+    def test_transient_read_errors_are_skipped(self):
+        flaky = self._packed_file(b'flaky bytes')
+        scrubber = IntegrityScrubber(workers=1, bytes_per_second=0, retries=1, retry_delay=0)
+        with patch('files.scrubber.iter_file_content', side_effect=OSError('connection reset')) as read:
+            self.assertEqual(scrubber.run_pass(), 1)
+        self.assertEqual(read.call_count, 2)
+        flaky.refresh_from_db()
+        self.assertEqual(flaky.status, 'ready')
+
+        with patch('files.scrubber.iter_file_content', side_effect=FileNotFoundError('gone')):
+            scrubber.run_pass()
+        flaky.refresh_from_db()
+        self.assertEqual(flaky.status, 'unavailable')
+
+    def test_unavailable_files_recover_once_they_verify(self):
+        damaged = self._packed_file(b'comes back')
+        scrubber = IntegrityScrubber(workers=1, bytes_per_second=0)
+        with patch('files.scrubber.iter_file_content', side_effect=FileNotFoundError('volume not mounted')):
+            scrubber.run_pass()
+        self.assertEqual(UserStats.objects.get(user=self.user).files_count, 0)
+
+        scrubber.run_pass()
+        damaged.refresh_from_db()
+        self.assertEqual(damaged.status, 'ready')
+        self.assertEqual(UserStats.objects.get(user=self.user).files_count, 1)
+
+    def test_content_replaced_during_the_read_is_not_marked(self):
+        replaced = self._packed_file(b'old bytes', checksum='0' * 64)
+        scrubber = IntegrityScrubber(workers=1, bytes_per_second=0)
+        verify = scrubber.verify
+
+        def replace_then_verify(file_obj):
+            result = verify(file_obj)
+            File.objects.filter(id=file_obj.id).update(storage_key='pack/replaced', checksum='1' * 64)
+            return result
+        with patch.object(scrubber, 'verify', side_effect=replace_then_verify):
+            scrubber.run_pass()
+        replaced.refresh_from_db()
+        self.assertEqual(replaced.status, 'ready')
+
+class FileListingQueryCountTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='listing@example.com',
+            username='listinguser',
+            password='testpass123'
+        )
+        self.folder = Folder.objects.create(name='Docs', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _create_files(self, count):
+        for i in range(count):
+            file_obj = File.objects.create(
+                name=f'file-{i}.txt', owner=self.user, folder=self.folder, size_bytes=10,
+                mime_type='text/plain', storage_key=f'uploads/file-{i}.txt'
+            )
+            for number in (1, 2):
+                FileVersion.objects.create(
+                    file=file_obj, version_number=number, storage_key=f'uploads/file-{i}.v{number}',
+                    size_bytes=10, created_by=self.user
+                )
+            Share.objects.create(file=file_obj, actor=self.user, share_type='public')
+            Share.objects.create(file=file_obj, actor=self.user, share_type='public', is_active=False)
+
+    def _list_queries(self, limit):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/files/', {'folder': str(self.folder.id), 'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['files']), limit)
+        return response, len(ctx.captured_queries)
+
+    def test_listing_query_count_is_constant(self):
+        self._create_files(25)
+        small_response, small_queries = self._list_queries(5)
+        _, large_queries = self._list_queries(25)
+        self.assertEqual(small_queries, large_queries)
+
+        row = small_response.data['files'][0]
+        self.assertEqual(row['versions_count'], 2)
+        self.assertEqual(row['share_links_count'], 1)
+        self.assertEqual(row['folder_name'], 'Docs')
+
+    def test_annotations_match_per_object_counts(self):
+        self._create_files(2)
+        for file_obj in file_listing_queryset(File.objects.filter(owner=self.user)):
+            self.assertEqual(file_obj.versions_count, file_obj.versions.count())
+            self.assertEqual(file_obj.share_links_count, file_obj.shares.filter(is_active=True).count())
+
+class FolderCounterTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='counters@example.com',
+            username='countersuser',
+            password='testpass123'
+        )
+        self.root = Folder.objects.create(name='Root', owner=self.user)
+        self.child = Folder.objects.create(name='Child', owner=self.user, parent=self.root)
+        self.other = Folder.objects.create(name='Other', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _create_file(self, folder, size, status='ready'):
+        return File.objects.create(
+            name='f.txt', owner=self.user, folder=folder, size_bytes=size, mime_type='text/plain',
+            storage_key=f'uploads/{uuid.uuid4()}', status=status
+        )
+
+    def _counters(self, folder):
+        folder.refresh_from_db()
+        return (folder.files_count, folder.subfolders_count, folder.total_size_bytes,
+                folder.tree_files_count, folder.tree_size_bytes)
+
+    def test_counters_follow_file_lifecycle(self):
+        self._create_file(self.root, 10)
+        moving = self._create_file(self.child, 100)
+        pending = self._create_file(self.child, 1000, status='processing')
+        self.assertEqual(self._counters(self.root), (1, 1, 10, 2, 110))
+        self.assertEqual(self._counters(self.child), (1, 0, 100, 1, 100))
+
+        pending.status = 'ready'
+        pending.save()
+        self.assertEqual(self._counters(self.root), (1, 1, 10, 3, 1110))
+
+        moving.folder = self.other
+        moving.save()
+        self.assertEqual(self._counters(self.child), (1, 0, 1000, 1, 1000))
+        self.assertEqual(self._counters(self.other), (1, 0, 100, 1, 100))
+
+        pending.delete()
+        self.assertEqual(self._counters(self.root), (1, 1, 10, 1, 10))
+
+        # Moving a folder carries its subtree totals to the new ancestors
+        self.child.parent = self.other
+        self.child.save()
+        self._create_file(self.child, 5)
+        self.assertEqual(self._counters(self.root), (1, 0, 10, 1, 10))
+        self.assertEqual(self._counters(self.other), (1, 1, 100, 2, 105))
+
+        self.assertEqual(folder_counters.reconcile(), 0)
+
+    def test_reconcile_repairs_drift(self):
+        self._create_file(self.child, 42)
+        Folder.objects.filter(id=self.root.id).update(tree_files_count=7, subfolders_count=0)
+
+        self.assertEqual(folder_counters.reconcile(dry_run=True), 1)
+        self.assertEqual(folder_counters.reconcile(), 1)
+        self.assertEqual(self._counters(self.root), (0, 1, 0, 1, 42))
+
+    def test_folder_listing_reads_counters(self):
+        self._create_file(self.root, 10)
+
+        def contents_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(f'/api/folders/{self.root.id}/contents/')
+            self.assertEqual(response.status_code, 200)
+            return response, len(ctx.captured_queries)
+
+        _, few_queries = contents_queries()
+        for _ in range(5):
+            Folder.objects.create(name=f'Sub {uuid.uuid4()}', owner=self.user, parent=self.root)
+        response, many_queries = contents_queries()
+
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(response.data['folder']['subfolders_count'], 6)
+        self.assertEqual(response.data['folder']['total_size'], 10)
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='keyset@example.com',
+            username='keysetuser',
+            password='testpass123'
+        )
+        self.folder = Folder.objects.create(name='Many', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        for i in range(7):
+            File.objects.create(
+                name=f'same-{i % 2}.txt', owner=self.user, folder=self.folder, size_bytes=100,
+                mime_type='text/plain', storage_key=f'uploads/keyset-{i}'
+            )
+        # Every file shares one timestamp so only the id tie-breaker orders them
+        File.objects.filter(owner=self.user).update(modified_at=timezone.now())
+
+    def _walk(self, sort_by):
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {'folder': str(self.folder.id), 'limit': 3, 'sort_by': sort_by}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/files/', params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data['files'])
+            pages += 1
+            cursor = response.data['next_cursor']
+            if not response.data['has_more']:
+                return seen, pages
+
+    def test_pages_cover_ties_exactly_once(self):
+        expected = sorted(str(pk) for pk in File.objects.filter(owner=self.user).values_list('id', flat=True))
+        for sort_by in ('-modified_at', 'modified_at', 'name', '-name', 'size_bytes', '-created_at'):
+            seen, pages = self._walk(sort_by)
+            self.assertEqual(sorted(seen), expected, sort_by)
+            self.assertEqual(len(seen), len(set(seen)), sort_by)
+            self.assertEqual(pages, 3)
+
+    def test_rejects_tampered_cursor(self):
+        response = self.client.get('/api/files/', {'folder': str(self.folder.id), 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+        first = self.client.get('/api/files/', {'folder': str(self.folder.id), 'limit': 3, 'sort_by': 'name'})
+        response = self.client.get('/api/files/', {
+            'folder': str(self.folder.id), 'cursor': first.data['next_cursor'], 'sort_by': '-size_bytes'
+        })
+        self.assertEqual(response.status_code, 400)
+
+        # Well-formed cursors carrying a value of the wrong type for the sort field
+        for sort_by, value in (('size_bytes', 'abc'), ('name', 7), ('-modified_at', 'yesterday'), ('size_bytes', True)):
+            payload = json.dumps({'s': sort_by, 'v': value, 'i': str(uuid.uuid4())}).encode()
+            forged = base64.urlsafe_b64encode(payload).decode().rstrip('=')
+            response = self.client.get('/api/files/', {'folder': str(self.folder.id), 'cursor': forged, 'sort_by': sort_by})
+            self.assertEqual(response.status_code, 400, (sort_by, value))
+
+    def test_limit_is_validated_and_clamped(self):
+        self.assertEqual(self.client.get('/api/files/', {'folder': str(self.folder.id), 'limit': 'abc'}).status_code, 400)
+        for limit in ('0', '-1'):
+            response = self.client.get('/api/files/', {'folder': str(self.folder.id), 'limit': limit, 'sort_by': 'name'})
+            self.assertEqual(response.status_code, 200, limit)
+            self.assertEqual(len(response.data['files']), 1, limit)
+            self.assertTrue(response.data['has_more'])
+            cursor = response.data['next_cursor']
+            second = self.client.get('/api/files/', {'folder': str(self.folder.id), 'limit': 1, 'sort_by': 'name', 'cursor': cursor})
+            self.assertNotEqual(second.data['files'][0]['id'], response.data['files'][0]['id'])
+
+class ListingCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='count@example.com',
+            username='countuser',
+            password='testpass123'
+        )
+        self.folder = Folder.objects.create(name='Counted', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(3):
+            self._create_file(f'doc-{i}.txt')
+
+    def _create_file(self, name, folder=None):
+        return File.objects.create(
+            name=name, owner=self.user, folder=folder or self.folder, size_bytes=1,
+            mime_type='text/plain', storage_key=f'uploads/{uuid.uuid4()}'
+        )
+
+    def _total(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/files/', {'folder': str(self.folder.id), **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['total_count_approximate'])
+        counted = any('"__count"' in q['sql'] for q in ctx.captured_queries)
+        return response.data['total_count'], counted
+
+    def test_folder_total_comes_from_counters(self):
+        self.assertEqual(self._total(), (3, False))
+
+    def test_filtered_total_is_cached_until_files_change(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.enterContext(override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+        ))
+        self.assertEqual(self._total(q='doc-1'), (1, True))
+        self.assertEqual(self._total(q='doc-1'), (1, False))
+
+        self._create_file('doc-10.txt')
+        self.assertEqual(self._total(q='doc-1'), (2, True))
+
+    def test_filtered_total_is_counted_with_a_per_process_cache(self):
+        self.assertEqual(self._total(q='doc-1'), (1, True))
+        self.assertEqual(self._total(q='doc-1'), (1, True))
+
+    def test_large_unfiltered_sets_use_estimates(self):
+        with patch('files.counting.estimate_count', return_value=250000):
+            response = self.client.get('/api/files/', {'folder': ''})
+        self.assertEqual(response.data['total_count'], 250000)
+        self.assertTrue(response.data['total_count_approximate'])
+
+class QueryPlanTestCase(TestCase):
+    """EXPLAIN regression suite: each endpoint's main query must use its index without sorting"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(email=f'plan{i}@example.com', username=f'plan{i}', password='testpass123')
+            for i in range(4)
+        ]
+        cls.user = cls.users[0]
+        files, shares, deliveries = [], [], []
+        for owner in cls.users:
+            folders = [Folder.objects.create(name=f'Folder {i}', owner=owner) for i in range(5)]
+            for i in range(250):
+                files.append(File(
+                    name=f'file-{i}.dat', owner=owner, folder=folders[i % 5] if i % 6 else None,
+                    size_bytes=i * 100, storage_key=f'uploads/{uuid.uuid4()}',
+                    mime_type=('image/png', 'application/pdf', 'text/plain', 'video/mp4')[i % 4],
+                    status='ready' if i % 10 else 'processing'
+                ))
+            webhook = Webhook.objects.create(user=owner, url='https://example.com/hook', events=['file.deleted'])
+            deliveries.extend(
+                WebhookDelivery(webhook=webhook, event='file.deleted', payload={}, status='delivered')
+                for _ in range(50)
+            )
+        File.objects.bulk_create(files)
+        cls.folder = Folder.objects.filter(owner=cls.user).first()
+
+        owned = list(File.objects.filter(owner=cls.user)[:60])
+        for i, file_obj in enumerate(owned):
+            shares.append(Share(file=file_obj, actor=cls.user, share_type='public', token=uuid.uuid4().hex))
+            shares.append(Share(
+                file=file_obj, actor=cls.user, share_type='user', token=uuid.uuid4().hex,
+                target_user=cls.users[1 + i % 3], is_active=bool(i % 4)
+            ))
+        Share.objects.bulk_create(shares)
+        WebhookDelivery.objects.bulk_create(deliveries)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertIndexPlan(self, queryset, index_name=None):
+        """The plan reads through `index_name` (or any index) and has no sort step"""
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Tiny test tables would otherwise be sequentially scanned whatever the indexes
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = json.loads(queryset.explain(format='json'))
+            nodes, stack = [], [plan[0]['Plan']]
+            while stack:
+                node = stack.pop()
+                nodes.append(node)
+                stack.extend(node.get('Plans', []))
+            self.assertNotIn('Sort', [node['Node Type'] for node in nodes], plan)
+            index_names = [node['Index Name'] for node in nodes if 'Index Name' in node]
+            if index_name:
+                self.assertIn(index_name, index_names, plan)
+            else:
+                self.assertTrue(index_names, plan)
+        else:
+            plan = queryset.explain()
+            self.assertNotIn('TEMP B-TREE', plan)
+            self.assertIn(f'INDEX {index_name}' if index_name else 'INDEX', plan)
+
+    def _ready(self):
+        return File.objects.filter(owner=self.user, status='ready')
+
+    def test_folder_listing_plans(self):
+        for sort_by, index_name in (
+            ('-modified_at', 'file_list_modified_idx'),
+            ('name', 'file_list_name_idx'),
+            ('-size_bytes', 'file_list_size_idx'),
+            ('created_at', 'file_list_created_idx'),
+        ):
+            queryset = apply_keyset(self._ready().filter(folder=self.folder), sort_by)
+            self.assertIndexPlan(queryset[:50], index_name)
+
+        root = apply_keyset(self._ready().filter(folder=None), '-modified_at')
+        self.assertIndexPlan(root[:50], 'file_list_modified_idx')
+
+    def test_all_files_listing_plan(self):
+        self.assertIndexPlan(apply_keyset(self._ready(), '-modified_at')[:50], 'file_all_modified_idx')
+
+    def test_dashboard_plans(self):
+        documents = self._ready().filter(mime_type__in=['application/pdf', 'application/msword'])
+        self.assertIndexPlan(documents.order_by().values('size_bytes'), 'file_owner_mime_idx')
+
+        week_ago = timezone.now() - timedelta(days=7)
+        recent = File.objects.filter(owner=self.user, created_at__gte=week_ago).order_by('-created_at')[:10]
+        self.assertIndexPlan(recent, 'file_owner_created_idx')
+
+    def test_share_plans(self):
+        shared_with_me = Share.objects.filter(target_user=self.users[1], is_active=True)
+        self.assertIndexPlan(shared_with_me, 'share_target_active_idx')
+
+        file_obj = Share.objects.filter(actor=self.user).first().file
+        self.assertIndexPlan(Share.objects.filter(file=file_obj, is_active=True), 'share_file_active_idx')
+
+        token = Share.objects.values_list('token', flat=True).first()
+        self.assertIndexPlan(Share.objects.filter(token=token))
+
+    def test_webhook_delivery_plan(self):
+        webhook = Webhook.objects.get(user=self.user)
+        deliveries = WebhookDelivery.objects.filter(webhook__id=webhook.id, webhook__user=self.user)
+        self.assertIndexPlan(deliveries[:20], 'delivery_webhook_created_idx')
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='search@example.com',
+            username='searchuser',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            email='search-other@example.com',
+            username='searchother',
+            password='testpass123'
+        )
+        self.reports = Folder.objects.create(name='Quarterly Reports', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.budget = self._create_file('budget-2024.xlsx', description='quarterly budget forecast')
+        self.report = self._create_file('Quarterly report.pdf', mime_type='application/pdf', folder=self.reports)
+        self.photo = self._create_file('quarry.png', mime_type='image/png')
+        self._create_file('quarterly secret.pdf', owner=self.other)
+
+    def _create_file(self, name, description='', mime_type='text/plain', folder=None, owner=None):
+        return File.objects.create(
+            name=name, description=description, owner=owner or self.user, folder=folder, size_bytes=1,
+            mime_type=mime_type, storage_key=f'uploads/{uuid.uuid4()}'
+        )
+
+    def _search(self, **params):
+        response = self.client.get('/api/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data['files']], [row['name'] for row in response.data['folders']]
+
+    def test_prefix_search_ranks_and_scopes_to_owner(self):
+        self.assertEqual(search_index.backend(), 'fts5' if connection.vendor == 'sqlite' else 'postgresql')
+        files_found, folders_found = self._search(q='quarter')
+        self.assertEqual(files_found, ['Quarterly report.pdf', 'budget-2024.xlsx'])
+        self.assertEqual(folders_found, ['Quarterly Reports'])
+
+        self.assertEqual(set(self._search(q='quar')[0]), {'Quarterly report.pdf', 'budget-2024.xlsx', 'quarry.png'})
+
+    def test_filters_apply_inside_the_query(self):
+        self.assertEqual(self._search(q='quar', type='image'), (['quarry.png'], []))
+        self.assertEqual(self._search(q='quar', folder=str(self.reports.id))[0], ['Quarterly report.pdf'])
+
+    def test_index_follows_renames_and_deletes(self):
+        self.photo.name = 'holiday.png'
+        self.photo.save()
+        self.assertEqual(self._search(q='holiday')[0], ['holiday.png'])
+        self.assertNotIn('holiday.png', self._search(q='quar')[0])
+
+        self.reports.delete()
+        self.budget.delete()
+        self.assertEqual(self._search(q='quarter'), ([], []))
+
+        if search_index.backend() == 'fts5':
+            # holiday.png and the other user's file remain
+            self.assertEqual(search_index.rebuild(), 2)
+            self.assertEqual(self._search(q='holiday')[0], ['holiday.png'])
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get('/api/search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'x', 'folder': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'x', 'limit': 'abc'}).status_code, 400)
+        self.assertEqual(len(self._search(q='quar', limit=-5)[0]), 1)  # Clamped to at least one result
+
+class FolderHierarchyTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='tree@example.com',
+            username='treeuser',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        # a > b > c > d, plus a sibling root
+        self.chain = []
+        parent = None
+        for name in 'abcd':
+            parent = Folder.objects.create(name=name, owner=self.user, parent=parent)
+            self.chain.append(parent)
+        self.other = Folder.objects.create(name='other', owner=self.user)
+
+    def test_paths_and_single_query_breadcrumbs(self):
+        a, b, c, d = self.chain
+        self.assertEqual(d.path, f'/{a.id.hex}/{b.id.hex}/{c.id.hex}/{d.id.hex}/')
+        self.assertEqual(d.depth, 3)
+        self.assertEqual(list(a.get_descendants()), sorted([b, c, d], key=lambda f: f.path))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/folders/{d.id}/contents/')
+        self.assertEqual([crumb['name'] for crumb in response.data['breadcrumbs']], ['My Files', 'a', 'b', 'c', 'd'])
+        self.assertEqual(sum('"files_folder"' in q['sql'] and 'IN (' in q['sql'] for q in ctx.captured_queries), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'collation-dependent ordering needs PostgreSQL')
+    def test_subtree_ignores_linguistic_collation(self):
+        # Linguistic collations skip '/' and sort letters after '0', so a path range would drop 'f...'
+        root = Folder.objects.create(id=uuid.UUID('a' * 32), name='root', owner=self.user)
+        child = Folder.objects.create(id=uuid.UUID('f' * 32), name='child', owner=self.user, parent=root)
+        grandchild = Folder.objects.create(id=uuid.UUID('1' * 32), name='grandchild', owner=self.user, parent=child)
+        Folder.objects.create(id=uuid.UUID('a' * 31 + 'b'), name='neighbour', owner=self.user)
+        self.assertEqual(set(root.get_descendants()), {child, grandchild})
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = Folder.objects.filter(Folder.subtree_q(root.path)).explain()
+        self.assertIn('files_folder_path', plan)
+
+    def test_move_rewrites_subtree_and_rejects_cycles(self):
+        a, b, c, d = self.chain
+        response = self.client.put(f'/api/folders/{b.id}/', {'parent': str(d.id)}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.put(f'/api/folders/{b.id}/', {'parent': str(self.other.id)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        d.refresh_from_db()
+        self.assertEqual(d.path, f'/{self.other.id.hex}/{b.id.hex}/{c.id.hex}/{d.id.hex}/')
+        self.assertEqual(d.depth, 3)
+        self.assertEqual(list(a.get_descendants()), [])
+
+    def test_force_delete_removes_subtree(self):
+        a, b, c, d = self.chain
+        for folder in (b, d):
+            File.objects.create(
+                name='x.txt', owner=self.user, folder=folder, size_bytes=5,
+                mime_type='text/plain', storage_key=f'uploads/{uuid.uuid4()}'
+            )
+        response = self.client.delete(f'/api/folders/{b.id}/delete-force/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(Folder.objects.filter(owner=self.user).order_by('name')), [a, self.other])
+        self.assertFalse(File.objects.filter(owner=self.user).exists())
+        a.refresh_from_db()
+        self.assertEqual((a.subfolders_count, a.tree_files_count), (0, 0))
+
+class BulkFolderDeletionTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email='bulk@example.com',
+            username='bulkuser',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.keep = Folder.objects.create(name='keep', owner=self.user)
+        self.doomed = Folder.objects.create(name='doomed', owner=self.user, parent=self.keep)
+        self.nested = Folder.objects.create(name='nested', owner=self.user, parent=self.doomed)
+
+        self.entries = []
+        for i, folder in enumerate([self.doomed, self.nested, self.nested]):
+            entry = pack_manager.append(f'content {i}'.encode())
+            self.entries.append(entry)
+            file_obj = File.objects.create(
+                name=f'f{i}.txt', owner=self.user, folder=folder, size_bytes=9, mime_type='text/plain',
+                storage_type='pack', storage_key=f'pack/{entry.id}'
+            )
+            FileVersion.objects.create(
+                file=file_obj, version_number=1, storage_key=f'uploads/old-{i}', size_bytes=1, created_by=self.user
+            )
+        self.survivor = File.objects.create(
+            name='survivor.txt', owner=self.user, folder=self.keep, size_bytes=4, mime_type='text/plain',
+            storage_key='uploads/survivor.txt'
+        )
+
+    def test_small_subtree_is_deleted_inline_with_one_activity(self):
+        with override_settings(BULK_DELETE={'BATCH_SIZE': 2, 'ASYNC_THRESHOLD': 100}), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/folders/{self.doomed.id}/delete-force/')
+        self.assertEqual(response.status_code, 204)
+        audit_sink.flush()
+
+        self.assertEqual(list(File.objects.filter(owner=self.user)), [self.survivor])
+        self.assertFalse(Folder.objects.filter(id__in=[self.doomed.id, self.nested.id]).exists())
+        self.assertFalse(FileVersion.objects.exists())
+        self.keep.refresh_from_db()
+        self.assertEqual((self.keep.subfolders_count, self.keep.tree_files_count, self.keep.tree_size_bytes), (0, 1, 4))
+        self.assertEqual(folder_counters.reconcile(), 0)
+
+        activity = Activity.objects.get(object_type='folder', action='deleted')
+        self.assertEqual(activity.metadata['files_deleted'], 3)
+        self.assertEqual(activity.metadata['folders_deleted'], 2)
+        self.assertEqual(StorageReclaimTask.objects.count(), 6)
+
+        released, freed = StorageReclaimer().run()
+        self.assertEqual(released, 6)
+        self.assertFalse(StorageReclaimTask.objects.exists())
+        self.assertTrue(all(PackEntry.objects.get(id=entry.id).is_deleted for entry in self.entries))
+
+    def test_reclaimer_removes_local_uploads(self):
+        response = self.client.post('/api/files/', {
+            'file': SimpleUploadedFile('local.txt', b'local bytes', content_type='text/plain'),
+            'folder': str(self.nested.id),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        local = File.objects.get(id=response.data['id'])
+        self.assertEqual(local.storage_key, local.file.name)
+        self.assertTrue(default_storage.exists(local.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/folders/{self.doomed.id}/delete-force/')
+        audit_sink.flush()
+        StorageReclaimer().run()
+        self.assertFalse(default_storage.exists(local.file.name))
+
+    def test_large_subtree_returns_job(self):
+        with override_settings(BULK_DELETE={'BATCH_SIZE': 2, 'ASYNC_THRESHOLD': 1}), \
+                patch('files.bulk_delete.threading.Thread') as thread:
+            response = self.client.delete(f'/api/folders/{self.doomed.id}/delete-force/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['files_total'], 3)
+        thread.return_value.start.assert_called_once()
+
+        job = FolderDeletionJob.objects.get(id=response.data['job_id'])
+        folder_delete_engine.run(job)
+        response = self.client.get(f'/api/folder-deletions/{job.id}/')
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual((response.data['files_deleted'], response.data['bytes_deleted']), (3, 27))
+
+    def test_stale_job_is_resumed_once_and_not_duplicated(self):
+        with override_settings(BULK_DELETE={'BATCH_SIZE': 2, 'ASYNC_THRESHOLD': 1}), \
+                patch('files.bulk_delete.threading.Thread') as thread:
+            first = self.client.delete(f'/api/folders/{self.doomed.id}/delete-force/')
+            second = self.client.delete(f'/api/folders/{self.doomed.id}/delete-force/')
+        self.assertEqual(second.status_code, 202)
+        self.assertEqual(second.data['job_id'], first.data['job_id'])
+        thread.return_value.start.assert_called_once()
+
+        # The worker thread never ran (as after a restart)
+        self.assertEqual(folder_delete_engine.resume_stale(), [])
+        FolderDeletionJob.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('resume_folder_deletions', stdout=StringIO())
+        audit_sink.flush()
+        job = FolderDeletionJob.objects.get(id=first.data['job_id'])
+        self.assertEqual((job.status, job.files_deleted), ('completed', 3))
+        self.assertFalse(Folder.objects.filter(id=self.doomed.id).exists())
+        self.assertEqual(folder_delete_engine.resume_stale(stale_after=0), [])
+
+class UserStatsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='stats@example.com',
+            username='statsuser',
+            password='testpass123'
+        )
+        self.folder = Folder.objects.create(name='Docs', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _create_file(self, size, mime_type, folder=None, status='ready'):
+        return File.objects.create(
+            name='f', owner=self.user, folder=folder, size_bytes=size, mime_type=mime_type,
+            storage_key=f'uploads/{uuid.uuid4()}', status=status
+        )
+
+    def _stats(self):
+        stats = UserStats.objects.get(user=self.user)
+        return (stats.files_count, stats.folders_count, stats.total_size_bytes,
+                stats.images_bytes, stats.documents_bytes, stats.other_bytes)
+
+    def test_rollup_follows_lifecycle(self):
+        self._create_file(100, 'image/png')
+        self._create_file(10, 'application/pdf', folder=self.folder)
+        pending = self._create_file(1, 'text/plain', status='processing')
+        self.assertEqual(self._stats(), (2, 1, 110, 100, 10, 0))
+
+        pending.status = 'ready'
+        pending.save()
+        pending.mime_type = 'image/jpeg'
+        pending.save(update_fields=['mime_type'])
+        self.assertEqual(self._stats(), (3, 1, 111, 101, 10, 0))
+
+        pending.increment_download_count()
+        pending.delete()
+        self.folder.delete()
+        self.assertEqual(self._stats(), (1, 0, 100, 100, 0, 0))
+
+        bucket = UserDailyStats.objects.get(user=self.user, day=timezone.localdate())
+        self.assertEqual((bucket.uploads, bucket.uploaded_bytes, bucket.downloads), (1, 100, 1))
+        self.assertEqual(user_stats.reconcile(), 0)
+
+    def test_reconcile_repairs_drift(self):
+        self._create_file(5, 'video/mp4')
+        UserStats.objects.filter(user=self.user).update(files_count=9, videos_bytes=0)
+        UserDailyStats.objects.filter(user=self.user).delete()
+
+        self.assertEqual(user_stats.reconcile(dry_run=True), 2)
+        self.assertEqual(user_stats.reconcile(), 2)
+        self.assertEqual(UserStats.objects.get(user=self.user).videos_bytes, 5)
+        self.assertEqual(UserDailyStats.objects.get(user=self.user).uploads, 1)
+
+    def test_dashboard_reads_rollup_in_constant_queries(self):
+        def dashboard_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/dashboard/')
+            self.assertEqual(response.status_code, 200)
+            return response, len(queries)
+
+        self._create_file(100, 'image/png')
+        _, baseline = dashboard_queries()
+        for i in range(20):
+            self._create_file(10, 'application/pdf', folder=self.folder)
+        self._create_file(1, 'text/plain').increment_download_count()
+        response, count = dashboard_queries()
+
+        self.assertEqual(count, baseline)
+        self.assertEqual(response.data['stats']['total_files'], 22)
+        self.assertEqual(response.data['storage']['used'], 301)
+        self.assertEqual(response.data['storage']['file_types']['documents'], 200)
+        self.assertEqual(len(response.data['upload_trends']), 30)
+        self.assertEqual(response.data['upload_trends'][-1]['uploads'], 22)
+        self.assertEqual(response.data['quick_stats']['files_this_week'], 22)
+        self.assertEqual(response.data['quick_stats']['downloads_this_week'], 1)
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        # Responses are only cached in a cache every worker shares
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.enterContext(override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}},
+            RESPONSE_CACHE={'ENABLED': True, 'TIMEOUT': 300},
+        ))
+        self.user = User.objects.create_user(
+            email='cached@example.com',
+            username='cacheduser',
+            password='testpass123'
+        )
+        self.friend = User.objects.create_user(
+            email='friend@example.com',
+            username='frienduser',
+            password='testpass123'
+        )
+        self.folder = Folder.objects.create(name='Cached', owner=self.user)
+        self.file = File.objects.create(
+            name='a.txt', owner=self.user, folder=self.folder, size_bytes=1, mime_type='text/plain',
+            storage_key='uploads/cached-a'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _get(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_repeat_reads_are_served_from_cache_until_a_write(self):
+        url = f'/api/folders/{self.folder.id}/contents/'
+        first, _ = self._get(self.client, url)
+        second, queries = self._get(self.client, url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(queries, 1)  # Only the change version behind the ETag
+
+        self.file.name = 'renamed.txt'
+        self.file.save()
+        third, queries = self._get(self.client, url)
+        self.assertGreater(queries, 0)
+        self.assertEqual(third.data['files'][0]['name'], 'renamed.txt')
+
+        # Query parameters and users are part of the key
+        self.assertEqual(len(self._get(self.client, '/api/files/?folder=')[0].data['files']), 1)
+        self.assertEqual(len(self._get(self.client, '/api/files/')[0].data['files']), 0)
+
+    def test_shared_with_me_follows_the_sharing_users_data(self):
+        friend_client = APIClient()
+        friend_client.force_authenticate(self.friend)
+        self.assertEqual(self._get(friend_client, '/api/shared-with-me/')[0].data['shared_files'], [])
+
+        Share.objects.create(file=self.file, actor=self.user, target_user=self.friend, share_type='user')
+        response, _ = self._get(friend_client, '/api/shared-with-me/')
+        self.assertEqual(response.data['shared_files'][0]['item']['name'], 'a.txt')
+
+        # A change to the owner's file is visible to the target right away
+        self.file.name = 'b.txt'
+        self.file.save()
+        response, _ = self._get(friend_client, '/api/shared-with-me/')
+        self.assertEqual(response.data['shared_files'][0]['item']['name'], 'b.txt')
+
+    def test_hit_ratio_metrics(self):
+        self._get(self.client, '/api/dashboard/')
+        self._get(self.client, '/api/dashboard/')
+        self._get(self.client, '/api/dashboard/')
+
+        admin = User.objects.create_superuser(email='admin@example.com', username='admin', password='testpass123')
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.data['response_cache']['dashboard_data'], {'hits': 2, 'misses': 1, 'hit_ratio': 0.6667})
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_is_not_used(self):
+        url = f'/api/folders/{self.folder.id}/contents/'
+        _, first = self._get(self.client, url)
+        _, second = self._get(self.client, url)
+        self.assertEqual(second, first)  # Every read runs the view
+
+class SparseFieldsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='sparse@example.com',
+            username='sparseuser',
+            password='testpass123'
+        )
+        self.folder = Folder.objects.create(name='Sparse', owner=self.user)
+        for i in range(3):
+            File.objects.create(
+                name=f'f{i}.png', owner=self.user, folder=self.folder, size_bytes=i, mime_type='image/png',
+                storage_key=f'uploads/sparse-{i}', thumbnail_keys={'small': f'thumb-{i}'}
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _listing_sql(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        listing = [q['sql'] for q in queries.captured_queries if 'FROM "files_file"' in q['sql'] and 'LIMIT' in q['sql']]
+        return response, listing[0]
+
+    def test_compact_view_prunes_output_and_columns(self):
+        response, sql = self._listing_sql(f'/api/files/?folder={self.folder.id}&view=compact')
+        self.assertEqual(len(response.data['files']), 3)
+        self.assertEqual(set(response.data['files'][0]), set(COMPACT_FILE_FIELDS))
+        self.assertEqual(response.data['files'][0]['thumbnail_urls'], {'small': '/media/thumbnails/thumb-2'})
+        self.assertNotIn('cloudinary_url', sql)
+        self.assertNotIn('files_fileversion', sql)
+        self.assertNotIn('authentication_user', sql)
+
+        _, full_sql = self._listing_sql(f'/api/files/?folder={self.folder.id}')
+        self.assertIn('files_fileversion', full_sql)
+
+    def test_fields_parameter(self):
+        response, sql = self._listing_sql(f'/api/files/?folder={self.folder.id}&fields=name,versions_count&sort_by=size_bytes')
+        self.assertEqual(response.data['files'][0], {'id': response.data['files'][0]['id'], 'name': 'f0.png', 'versions_count': 0})
+        self.assertNotIn('"mime_type"', sql)
+
+        # The cursor still works on a pruned page
+        response = self.client.get(f'/api/files/?folder={self.folder.id}&fields=name&sort_by=size_bytes&limit=2')
+        response = self.client.get(
+            f'/api/files/?folder={self.folder.id}&fields=name&sort_by=size_bytes&cursor={response.data["next_cursor"]}'
+        )
+        self.assertEqual([f['name'] for f in response.data['files']], ['f2.png'])
+
+        response = self.client.get(f'/api/files/?fields=name,secret')
+        self.assertEqual(response.status_code, 400)
+
+    def test_folder_contents_and_v1_api(self):
+        response = self.client.get(f'/api/folders/{self.folder.id}/contents/?fields=name,folder_name')
+        self.assertEqual(set(response.data['files'][0]), {'id', 'name', 'folder_name'})
+        self.assertEqual(response.data['files'][0]['folder_name'], 'Sparse')
+
+        response = self.client.get('/api/v1/files/?view=compact')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), set(COMPACT_FILE_FIELDS))
+        self.assertEqual(self.client.get('/api/v1/files/?fields=bogus').status_code, 400)
+
+class ListingETagTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='etag@example.com',
+            username='etaguser',
+            password='testpass123'
+        )
+        self.root = Folder.objects.create(name='Root', owner=self.user)
+        self.child = Folder.objects.create(name='Child', owner=self.user, parent=self.root)
+        self.sibling = Folder.objects.create(name='Sibling', owner=self.user)
+        self.file = File.objects.create(
+            name='a.txt', owner=self.user, folder=self.child, size_bytes=1, mime_type='text/plain',
+            storage_key='uploads/etag-a'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _revalidate(self, url, etag):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        return response, len(queries)
+
+    def test_unchanged_listing_returns_304_after_one_lookup(self):
+        url = f'/api/folders/{self.child.id}/contents/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        response, queries = self._revalidate(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(queries, 1)
+
+        # Unrelated changes elsewhere keep the tag
+        File.objects.create(
+            name='b.txt', owner=self.user, folder=self.sibling, size_bytes=1, mime_type='text/plain',
+            storage_key='uploads/etag-b'
+        )
+        self.assertEqual(self._revalidate(url, etag)[0].status_code, 304)
+
+        self.file.name = 'renamed.txt'
+        self.file.save()
+        response, _ = self._revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_child_changes_bump_ancestors_and_root(self):
+        tags = {
+            url: self.client.get(url)['ETag']
+            for url in (f'/api/folders/{self.root.id}/contents/', '/api/folders/', '/api/files/?folder=')
+        }
+        # A deep file changes the subtree counters every ancestor listing shows
+        self.file.delete()
+        for url, etag in tags.items():
+            self.assertEqual(self._revalidate(url, etag)[0].status_code, 200, url)
+
+        # Renaming a folder changes breadcrumbs below it
+        url = f'/api/folders/{self.child.id}/contents/'
+        etag = self.client.get(url)['ETag']
+        self.root.name = 'Renamed'
+        self.root.save()
+        response, _ = self._revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['breadcrumbs'][1]['name'], 'Renamed')
+
+    def test_query_parameters_and_missing_folders(self):
+        etag = self.client.get(f'/api/files/?folder={self.child.id}')['ETag']
+        response = self.client.get(f'/api/files/?folder={self.child.id}&view=compact', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/api/folders/{uuid.uuid4()}/contents/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+
+
+class ChangeJournalTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='journal@example.com',
+            username='journaluser',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            email='journal-other@example.com',
+            username='journalother',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cursor = self.client.get('/api/changes/').data['cursor']
+
+    def _file(self, name, folder=None):
+        return File.objects.create(
+            name=name, owner=self.user, folder=folder, size_bytes=1, mime_type='text/plain',
+            storage_key=f'uploads/journal-{name}'
+        )
+
+    def _changes(self, since, limit=500):
+        response = self.client.get(f'/api/changes/?since={since}&limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_missing_or_invalid_cursor(self):
+        response = self.client.get('/api/changes/')
+        self.assertTrue(response.data['resync_required'])
+        self.assertEqual(self.client.get('/api/changes/?since=abc').status_code, 400)
+
+    def test_changes_are_compacted_and_paginated(self):
+        kept = self._file('kept.txt')
+        kept.name = 'renamed.txt'
+        kept.save()
+        self._file('temp.txt').delete()
+        folder = Folder.objects.create(name='Docs', owner=self.user)
+        kept.increment_download_count()
+
+        data = self._changes(self.cursor)
+        self.assertFalse(data['has_more'])
+        changes = [(c['object_type'], c['object_id'], c['operation']) for c in data['changes']]
+        self.assertEqual(changes, [('file', str(kept.id), 'created'), ('folder', str(folder.id), 'created')])
+        self.assertEqual(data['changes'][0]['payload']['name'], 'renamed.txt')
+        self.assertEqual(self._changes(data['cursor'])['changes'], [])
+
+        # A page boundary splits temp.txt's create and delete, so both surface
+        first = self._changes(self.cursor, limit=3)
+        self.assertTrue(first['has_more'])
+        rest = self._changes(first['cursor'])
+        operations = [c['operation'] for c in first['changes'] + rest['changes']]
+        self.assertEqual(operations, ['created', 'created', 'deleted', 'created'])
+
+    def test_folder_delete_and_shares_reach_both_users(self):
+        folder = Folder.objects.create(name='Shared', owner=self.user)
+        shared = self._file('shared.txt', folder=folder)
+        share = Share.objects.create(file=shared, actor=self.user, target_user=self.other, share_type='user')
+        other_cursor = change_journal.latest_seq(self.other)
+
+        folder.delete()
+        data = self._changes(self.cursor)
+        self.assertEqual(data['changes'], [])  # Created and deleted within the page
+        operations = {(c['object_type'], c['operation']) for c in change_journal.changes_since(self.other, other_cursor)['changes']}
+        self.assertEqual(operations, {('share', 'deleted')})
+        self.assertFalse(Share.objects.filter(id=share.id).exists())
+
+    def test_sequences_are_per_user_and_gapless(self):
+        self._file('a.txt')
+        File.objects.create(name='b.txt', owner=self.other, size_bytes=1, mime_type='text/plain', storage_key='uploads/journal-b')
+        self._file('c.txt')
+        seqs = list(ChangeJournalEntry.objects.filter(user=self.user).order_by('id').values_list('seq', flat=True))
+        self.assertEqual(seqs, list(range(1, len(seqs) + 1)))
+        self.assertEqual(change_journal.latest_seq(self.user), seqs[-1])
+        self.assertEqual(change_journal.latest_seq(self.other), 1)
+
+    def test_truncated_cursor_requires_resync(self):
+        self._file('old.txt')
+        ChangeJournalEntry.objects.update(created_at=timezone.now() - timedelta(days=60))
+        self.assertGreater(change_journal.truncate(older_than_days=30), 0)
+
+        data = self._changes(self.cursor)
+        self.assertTrue(data['resync_required'])
+        self.assertFalse(self._changes(data['cursor'])['resync_required'])
+
+
+class BatchOperationsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='batch@example.com',
+            username='batchuser',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            email='batch-other@example.com',
+            username='batchother',
+            password='testpass123'
+        )
+        self.source = Folder.objects.create(name='Source', owner=self.user)
+        self.target = Folder.objects.create(name='Target', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _files(self, count, prefix='f'):
+        return [
+            File.objects.create(
+                name=f'{prefix}{i}.txt', owner=self.user, folder=self.source, size_bytes=10, mime_type='text/plain',
+                storage_key=f'uploads/batch-{prefix}{i}'
+            )
+            for i in range(count)
+        ]
+
+    def _batch(self, operations):
+        return self.client.post('/api/files/batch/', {'operations': operations}, format='json')
+
+    def test_mixed_batch_applies_valid_operations(self):
+        moved, renamed, deleted, shared = self._files(4)
+        foreign = File.objects.create(
+            name='foreign.txt', owner=self.other, size_bytes=1, mime_type='text/plain', storage_key='uploads/batch-foreign'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._batch([
+                {'op': 'move', 'file_id': str(moved.id), 'folder_id': str(self.target.id)},
+                {'op': 'rename', 'file_id': str(renamed.id), 'name': ' renamed.txt '},
+                {'op': 'delete', 'file_id': str(deleted.id)},
+                {'op': 'share', 'file_id': str(shared.id), 'type': 'user', 'target_email': self.other.email},
+                {'op': 'rename', 'file_id': str(deleted.id), 'name': 'late.txt'},
+                {'op': 'delete', 'file_id': str(foreign.id)},
+                {'op': 'explode', 'file_id': str(moved.id)},
+            ])
+        self.assertEqual(response.status_code, 200)
+        audit_sink.flush()
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (4, 3))
+        self.assertEqual([r['status'] for r in response.data['results']], ['ok'] * 4 + ['error'] * 3)
+
+        self.assertEqual(File.objects.get(id=moved.id).folder_id, self.target.id)
+        self.assertEqual(File.objects.get(id=renamed.id).name, 'renamed.txt')
+        self.assertFalse(File.objects.filter(id=deleted.id).exists())
+        self.assertTrue(File.objects.filter(id=foreign.id).exists())
+        self.assertTrue(Share.objects.filter(file=shared, target_user=self.other).exists())
+
+        # Counters and rollups match a recount; one activity per kind of operation and none per file
+        self.assertEqual(folder_counters.reconcile(dry_run=True), 0)
+        self.assertEqual(UserStats.objects.get(user=self.user).files_count, 3)
+        self.assertEqual(
+            sorted(Activity.objects.filter(user=self.user).values_list('object_type', 'object_id', 'action')),
+            [('batch', uuid.UUID(response.data['batch_id']), action) for action in ('deleted', 'moved', 'renamed', 'shared')]
+        )
+        other_changes = change_journal.changes_since(self.other, 0)['changes']
+        self.assertIn(('share', 'created'), [(c['object_type'], c['operation']) for c in other_changes])
+
+    def test_sharing_again_restores_a_revoked_share(self):
+        shared, = self._files(1)
+        revoked = Share.objects.create(
+            file=shared, actor=self.user, target_user=self.other, share_type='user', permission='viewer', is_active=False
+        )
+        response = self._batch([
+            {'op': 'share', 'file_id': str(shared.id), 'type': 'user', 'target_email': self.other.email, 'permission': 'editor'},
+        ])
+        self.assertEqual(response.data['results'][0]['share_id'], str(revoked.id))
+        revoked.refresh_from_db()
+        self.assertEqual((revoked.is_active, revoked.permission), (True, 'editor'))
+        self.assertEqual(access_resolver.file_permission(self.other, File.objects.get(id=shared.id)), 'editor')
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def run(files):
+            operations = [
+                {'op': 'move', 'file_id': str(f.id), 'folder_id': str(self.target.id)} for f in files
+            ] + [{'op': 'rename', 'file_id': str(f.id), 'name': f'{f.name}.bak'} for f in files]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self._batch(operations).data['failed'], 0)
+            return len(queries)
+
+        small, large = run(self._files(2, 's')), run(self._files(20, 'l'))
+        self.assertEqual(small, large)
+        self.assertEqual(File.objects.filter(folder=self.target).count(), 22)
+        self.assertEqual(Folder.objects.get(id=self.target.id).files_count, 22)
+
+    def test_rejects_malformed_batches(self):
+        self.assertEqual(self._batch([]).status_code, 400)
+        with override_settings(BATCH_OPERATIONS={'MAX_OPERATIONS': 1}):
+            self.assertEqual(self._batch([{'op': 'delete', 'file_id': str(uuid.uuid4())}] * 2).status_code, 400)
+
+
+class FastListingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='fast@example.com',
+            username='fastuser',
+            password='testpass123',
+            name='Fast User'
+        )
+        self.folder = Folder.objects.create(name='Media', owner=self.user)
+        specs = [
+            ('photo.PNG', 'image/png', {'storage_type': 'pack', 'thumbnail_keys': {'small': 's.jpg', 'large': 'l.jpg'}}),
+            ('clip.mp4', 'video/mp4', {'storage_type': 'chunked', 'duration': 12.5, 'folder': self.folder}),
+            ('doc.pdf', 'application/pdf', {'storage_type': 'local_file', 'file': 'files/1/doc.pdf', 'page_count': 3}),
+            ('song.mp3', 'audio/mpeg', {'cloudinary_secure_url': 'https://cdn.example.com/song.mp3'}),
+            ('notes', 'text/plain', {'storage_type': 'local_file', 'last_accessed': timezone.now(), 'folder': self.folder}),
+        ]
+        self.files = [
+            File.objects.create(
+                name=name, owner=self.user, size_bytes=100 + i, mime_type=mime_type,
+                storage_key=f'uploads/fast-{i}', **extra
+            )
+            for i, (name, mime_type, extra) in enumerate(specs)
+        ]
+        Share.objects.create(file=self.files[0], actor=self.user, share_type='public')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rows_match_the_serializer(self):
+        files = File.objects.filter(owner=self.user).order_by('name')
+        for fields in (None, COMPACT_FILE_FIELDS, ('id', 'folder_name', 'share_links_count')):
+            expected = FileSerializer(list(file_listing_queryset(files, fields)), many=True, fields=fields).data
+            rows = list(build_file_rows(file_rows_queryset(files, fields), fields))
+            self.assertEqual(dumps(rows), JSONRenderer().render(expected))
+
+    def test_streamed_pages_match_buffered_pages(self):
+        def pages(limit):
+            ids, url = [], f'/api/files/?folder=&sort_by=name&limit={limit}'
+            while url:
+                response = self.client.get(url)
+                if getattr(response, 'streaming', False):
+                    data = json.loads(b''.join(response.streaming_content))
+                else:
+                    data = response.json()
+                ids += [row['id'] for row in data['files']]
+                url = data['next_cursor'] and f"/api/files/?folder=&sort_by=name&limit={limit}&cursor={data['next_cursor']}"
+            return ids
+
+        buffered = pages(2)
+        with override_settings(FILE_LISTING={'STREAM_THRESHOLD': 2}):
+            self.assertTrue(self.client.get('/api/files/?folder=&limit=2').streaming)
+            self.assertEqual(pages(2), buffered)
+        self.assertEqual(buffered, [str(f.id) for f in sorted(self.files, key=lambda f: f.name)])
+
+    @skipUnless(orjson, 'orjson is not installed')
+    def test_renderer_output_matches_drf(self):
+        from decimal import Decimal
+        data = {
+            'when': timezone.now().replace(microsecond=123456),
+            'id': uuid.uuid4(),
+            'amount': Decimal('1.50'),
+            'text': 'line\u2028separator \u00e9',
+            1: [None, True, 1.5],
+        }
+        self.assertEqual(dumps(data), JSONRenderer().render(data))
+
+
+class AccessResolverTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='acl-owner@example.com', username='aclowner', password='testpass123')
+        self.collaborator = User.objects.create_user(email='acl-collab@example.com', username='aclcollab', password='testpass123')
+        self.stranger = User.objects.create_user(email='acl-stranger@example.com', username='aclstranger', password='testpass123')
+        self.shared = Folder.objects.create(name='Shared', owner=self.owner)
+        self.nested = Folder.objects.create(name='Nested', owner=self.owner, parent=self.shared)
+        self.private = Folder.objects.create(name='Private', owner=self.owner)
+        self.file = File.objects.create(
+            name='plan.pdf', owner=self.owner, folder=self.nested, size_bytes=10, mime_type='application/pdf',
+            storage_key='uploads/acl-plan', cloudinary_secure_url='https://cdn.example.com/plan.pdf'
+        )
+        self.share = Share.objects.create(folder=self.shared, actor=self.owner, target_user=self.collaborator, share_type='user')
+        self.client = APIClient()
+
+    def _get(self, user, url):
+        self.client.force_authenticate(user)
+        return self.client.get(url)
+
+    def test_inherited_folder_share_grants_viewer_access(self):
+        self.assertEqual(self._get(self.collaborator, f'/api/files/{self.file.id}/download/').status_code, 302)
+        self.assertEqual(self._get(self.collaborator, f'/api/files/{self.file.id}/versions/').status_code, 200)
+        self.assertEqual(self._get(self.stranger, f'/api/files/{self.file.id}/download/').status_code, 404)
+
+        self.client.force_authenticate(self.collaborator)
+        response = self.client.post(f'/api/files/{self.file.id}/rename/', {'new_name': 'x.pdf'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.share.permission = 'editor'
+        self.share.save()
+        response = self.client.post(f'/api/files/{self.file.id}/rename/', {'new_name': 'x.pdf'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.delete(f'/api/files/{self.file.id}/').status_code, 403)
+
+        # Editors change the name and description only
+        url = f'/api/files/{self.file.id}/'
+        self.assertEqual(self.client.put(url, {'description': 'Q3'}, format='json').status_code, 200)
+        for data in ({'is_public': True}, {'cloudinary_secure_url': 'https://evil.example.com/x'}, {'name': 'y.pdf', 'status': 'failed'}):
+            self.assertEqual(self.client.put(url, data, format='json').status_code, 403, data)
+        self.file.refresh_from_db()
+        self.assertEqual((self.file.is_public, self.file.name, self.file.description), (False, 'x.pdf', 'Q3'))
+
+    def test_cached_checks_follow_share_and_move_changes(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        shared_cache = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+        with override_settings(CACHES=shared_cache):
+            self._check_cached_permissions()
+
+    def _check_cached_permissions(self):
+        file_obj = File.objects.select_related('folder').get(id=self.file.id)
+        self.assertEqual(access_resolver.file_permission(self.collaborator, file_obj), 'viewer')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(access_resolver.file_permission(self.collaborator, file_obj), 'viewer')
+        self.assertEqual(len(queries), 0)
+
+        # Moving the file out of the shared tree revokes the inherited access
+        self.file.folder = self.private
+        self.file.save()
+        file_obj = File.objects.select_related('folder').get(id=self.file.id)
+        self.assertIsNone(access_resolver.file_permission(self.collaborator, file_obj))
+
+        # An invite follows the email
+        Invite.objects.create(file=self.file, actor=self.owner, target_email=self.stranger.email, permission='editor')
+        self.assertEqual(access_resolver.file_permission(self.stranger, file_obj), 'editor')
+
+    def test_public_links_grant_nothing_by_id(self):
+        Share.objects.create(file=self.file, actor=self.owner, share_type='public', password='secret')
+        Share.objects.create(folder=self.shared, actor=self.owner, share_type='public')
+        for url in (f'/api/files/{self.file.id}/download/', f'/api/files/{self.file.id}/', f'/api/files/{self.file.id}/versions/'):
+            self.assertEqual(self._get(self.stranger, url).status_code, 404, url)
+        self.assertEqual(self._get(self.stranger, f'/api/shared-with-me/folders/{self.shared.id}/').status_code, 404)
+
+    def test_process_local_cache_is_not_used_for_grants(self):
+        file_obj = File.objects.select_related('folder').get(id=self.file.id)
+        self.assertEqual(access_resolver.file_permission(self.collaborator, file_obj), 'viewer')
+        # Another worker revoking the share cannot reach this worker's locmem cache
+        Share.objects.filter(id=self.share.id).update(is_active=False)
+        self.assertIsNone(access_resolver.file_permission(self.collaborator, file_obj))
+
+    def test_expired_shares_grant_nothing(self):
+        self.share.delete()
+        expiring = Share.objects.create(
+            file=self.file, actor=self.owner, target_user=self.stranger, share_type='user',
+            expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        file_obj = File.objects.select_related('folder').get(id=self.file.id)
+        self.assertEqual(access_resolver.file_permission(self.stranger, file_obj), 'viewer')
+        with patch('files.permissions.timezone.now', return_value=expiring.expires_at + timedelta(seconds=1)):
+            self.assertIsNone(access_resolver.file_permission(self.stranger, file_obj))
+        self.assertIsNone(access_resolver.file_permission(self.collaborator, file_obj))
+
+
+class SharedWithMeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='sharer@example.com', username='sharer', password='testpass123')
+        self.user = User.objects.create_user(email='sharee@example.com', username='sharee', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _share_files(self, count, prefix='f'):
+        for i in range(count):
+            file_obj = File.objects.create(
+                name=f'{prefix}{i:03d}.txt', owner=self.owner, size_bytes=1, mime_type='text/plain',
+                storage_key=f'uploads/shared-{prefix}{i}'
+            )
+            Share.objects.create(file=file_obj, actor=self.owner, target_user=self.user, share_type='user', token=uuid.uuid4().hex)
+
+    def _pages(self, params):
+        names, url = [], f'/api/shared-with-me/?{params}'
+        while url:
+            cache.clear()
+            data = self.client.get(url).data
+            names += [item['item']['name'] for item in data['shared_files']]
+            url = data['next_cursor'] and f"/api/shared-with-me/?{params}&cursor={data['next_cursor']}"
+        return names
+
+    def test_pages_are_sorted_filtered_and_constant_cost(self):
+        self._share_files(3, 'a')
+        folder = Folder.objects.create(name='b-folder', owner=self.owner)
+        Share.objects.create(folder=folder, actor=self.owner, target_user=self.user, share_type='user', token=uuid.uuid4().hex)
+        expired = File.objects.create(name='z.txt', owner=self.owner, size_bytes=1, mime_type='text/plain', storage_key='uploads/shared-z')
+        Share.objects.create(
+            file=expired, actor=self.owner, target_user=self.user, share_type='user', token=uuid.uuid4().hex, expires_at=timezone.now() - timedelta(days=1)
+        )
+
+        self.assertEqual(self._pages('sort_by=name&limit=2'), ['a000.txt', 'a001.txt', 'a002.txt', 'b-folder'])
+        self.assertEqual(self._pages('sort_by=-shared_at&limit=3'), ['b-folder', 'a002.txt', 'a001.txt', 'a000.txt'])
+        self.assertEqual(self._pages('type=folder'), ['b-folder'])
+        self.assertEqual(self._pages('q=a001'), ['a001.txt'])
+        self.assertEqual(self.client.get('/api/shared-with-me/?cursor=bogus').status_code, 400)
+
+        def queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get('/api/shared-with-me/?limit=100')
+            return len(captured)
+        few = queries()
+        self._share_files(20, 'c')
+        self.assertEqual(queries(), few)
+
+    def test_browse_inside_shared_folder(self):
+        top = Folder.objects.create(name='Top', owner=self.owner)
+        shared = Folder.objects.create(name='Shared', owner=self.owner, parent=top)
+        inner = Folder.objects.create(name='Inner', owner=self.owner, parent=shared)
+        for folder, name in ((shared, 'one.txt'), (inner, 'two.txt'), (top, 'hidden.txt')):
+            File.objects.create(name=name, owner=self.owner, folder=folder, size_bytes=1, mime_type='text/plain',
+                                storage_key=f'uploads/browse-{name}')
+        Share.objects.create(folder=shared, actor=self.owner, target_user=self.user, share_type='user', token=uuid.uuid4().hex)
+
+        data = self.client.get(f'/api/shared-with-me/folders/{inner.id}/').data
+        self.assertEqual([f['name'] for f in data['files']], ['two.txt'])
+        self.assertEqual([b['name'] for b in data['breadcrumbs']], ['Shared', 'Inner'])
+        self.assertEqual(data['folder']['permission'], 'viewer')
+
+        data = self.client.get(f'/api/shared-with-me/folders/{shared.id}/?recursive=1&sort_by=name&limit=1').data
+        self.assertEqual([f['name'] for f in data['files']], ['one.txt'])
+        data = self.client.get(f"/api/shared-with-me/folders/{shared.id}/?recursive=1&sort_by=name&limit=1&cursor={data['next_cursor']}").data
+        self.assertEqual([f['name'] for f in data['files']], ['two.txt'])
+        self.assertFalse(data['has_more'])
+
+        self.assertEqual(self.client.get(f'/api/shared-with-me/folders/{top.id}/').status_code, 404)
+
+
+class AuditSinkTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        audit_sink.flush()
+        self.user = User.objects.create_user(email='audit@example.com', username='audit', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.file = File.objects.create(
+            name='audited.txt', owner=self.user, size_bytes=5, mime_type='text/plain', storage_key='uploads/audited.txt'
+        )
+        self.spool = os.path.join(tempfile.mkdtemp(), 'spool.jsonl')
+
+    def _audit_inserts(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith('INSERT') and 'activity' in q['sql']]
+
+    def test_requests_write_no_audit_rows_and_one_entry_per_event(self):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            self.client.post(f'/api/files/{self.file.id}/rename/', {'new_name': 'renamed.txt'})
+            self.client.get(f'/api/files/{self.file.id}/')
+        self.assertEqual(self._audit_inserts(queries), [])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(audit_sink.flush(), 1)
+        self.assertEqual(len(self._audit_inserts(queries)), 1)
+        activity = Activity.objects.get(object_id=self.file.id)
+        self.assertEqual((activity.action, activity.metadata['old_name']), ('renamed', 'audited.txt'))
+        self.assertEqual(activity.ip_address, '127.0.0.1')
+
+        recent = self.client.get(f'/api/files/{self.file.id}/').data['recent_activity']
+        self.assertEqual([(a['action'], a['details']['new_name']) for a in recent], [('renamed', 'renamed.txt')])
+
+    def test_rolled_back_work_is_not_logged(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            audit_sink.log(self.user.id, 'file', self.file.id, 'updated')
+        self.assertEqual(audit_sink.pending(), 0)
+
+    def test_failed_flush_is_spooled_and_replayed(self):
+        with override_settings(AUDIT_LOG={'SPOOL_PATH': self.spool, 'FLUSH_INTERVAL': 60}):
+            with self.captureOnCommitCallbacks(execute=True):
+                for action in ('updated', 'downloaded'):
+                    audit_sink.log(self.user.id, 'file', self.file.id, action)
+            with patch.object(Activity.objects, 'bulk_create', side_effect=DatabaseError('down')):
+                self.assertEqual(audit_sink.flush(), 0)
+                self.assertTrue(os.path.exists(self.spool))
+                # A replay that fails again keeps the claimed spool instead of losing it
+                self.assertEqual(audit_sink.flush(), 0)
+            self.assertFalse(Activity.objects.exists())
+
+            call_command('flush_audit_log', stdout=StringIO())
+        self.assertEqual(os.listdir(os.path.dirname(self.spool)), [])
+        self.assertEqual(sorted(Activity.objects.values_list('action', flat=True)), ['downloaded', 'updated'])
+
+    def test_recent_activity_includes_legacy_history(self):
+        legacy = FileActivity.objects.create(file=self.file, user=self.user, action='downloaded', details={'legacy': True})
+        FileActivity.objects.filter(id=legacy.id).update(created_at=timezone.now() - timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/files/{self.file.id}/rename/', {'new_name': 'renamed.txt'})
+        audit_sink.flush()
+        recent = self.client.get(f'/api/files/{self.file.id}/').data['recent_activity']
+        self.assertEqual([a['action'] for a in recent], ['renamed', 'downloaded'])
+        self.assertEqual(recent[1]['details'], {'legacy': True})
+
+
+class ActivityLogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='log@example.com', username='log', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.now = timezone.now()
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+
+    def _log(self, days_ago, action='updated', object_type='file'):
+        return Activity.objects.create(
+            user=self.user, object_type=object_type, object_id=uuid.uuid4(), action=action,
+            timestamp=self.now - timedelta(days=days_ago)
+        )
+
+    def test_activity_is_cursor_paginated_and_range_filtered(self):
+        entries = [self._log(days) for days in (0, 1, 40, 80, 400)]
+        self.assertEqual(entries[-1].month, Activity.month_of(entries[-1].timestamp))
+
+        ids, url = [], '/api/activity/?limit=2'
+        while url:
+            data = self.client.get(url).data
+            ids += [a['id'] for a in data['activities']]
+            url = data['next_cursor'] and f"/api/activity/?limit=2&cursor={data['next_cursor']}"
+        self.assertEqual(ids, [str(e.id) for e in entries])
+
+        since = (self.now - timedelta(days=60)).isoformat().replace('+00:00', 'Z')
+        until = (self.now - timedelta(hours=12)).isoformat().replace('+00:00', 'Z')
+        data = self.client.get(f'/api/activity/?since={since}&until={until}').data
+        self.assertEqual([a['id'] for a in data['activities']], [str(entries[1].id), str(entries[2].id)])
+        self.assertFalse(data['has_more'])
+        for params in ('cursor=bogus', 'since=yesterday', 'limit=x'):
+            self.assertEqual(self.client.get(f'/api/activity/?{params}').status_code, 400, params)
+
+    def test_expired_months_are_archived_and_deleted(self):
+        old = [self._log(days) for days in (500, 501, 502, 700)]
+        recent = self._log(10)
+        file_obj = File.objects.create(
+            name='legacy.txt', owner=self.user, size_bytes=1, mime_type='text/plain', storage_key='uploads/legacy'
+        )
+        legacy = FileActivity.objects.create(file=file_obj, user=self.user, action='downloaded')
+        FileActivity.objects.filter(id=legacy.id).update(created_at=self.now - timedelta(days=600))
+
+        config = {'RETENTION_DAYS': 365, 'ARCHIVE_DIR': self.archive_dir, 'BATCH_SIZE': 2}
+        with override_settings(ACTIVITY_RETENTION=config):
+            expired = activity_archiver.expired(now=self.now)
+            self.assertEqual(sum(rows for table, month, rows in expired if table == 'activity'), 4)
+            results = activity_archiver.run(now=self.now)
+            self.assertEqual(sum(moved for _, _, moved in results), 5)
+            self.assertEqual(activity_archiver.run(now=self.now), [])
+
+            archived = []
+            for table, month, _ in results:
+                with gzip.open(activity_archiver.archive_path(table, month)) as f:
+                    archived += [json.loads(line)['id'] for line in f]
+        self.assertEqual(sorted(archived), sorted([str(e.id) for e in old] + [str(legacy.id)]))
+        self.assertEqual(list(Activity.objects.values_list('id', flat=True)), [recent.id])
+        self.assertFalse(FileActivity.objects.exists())
+
+    def test_archiving_requires_an_archive_dir(self):
+        self._log(500)
+        with override_settings(ACTIVITY_RETENTION={'RETENTION_DAYS': 365, 'ARCHIVE_DIR': ''}):
+            with self.assertRaises(CommandError):
+                call_command('archive_activity', stdout=StringIO())
+        self.assertEqual(Activity.objects.count(), 1)
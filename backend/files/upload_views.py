@@ -14,6 +14,9 @@ import cloudinary.uploader
 from .models import File, Folder, UploadSession
 from .serializers import FileSerializer
 from .lob_utils import lob_manager
+from .s3_utils import s3_manager, MIN_PART_SIZE, MAX_PARTS
+from .pack_utils import pack_manager
+from .chunk_store import chunk_store
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,6 +29,7 @@ def init_upload(request):
     size = request.data.get('size')
     mime_type = request.data.get('mime_type')
     folder_id = request.data.get('folder_id')
+    file_id = request.data.get('file_id')  # Upload as a new version of an existing file
     
     if not filename or not size:
         return Response({'error': 'filename and size are required'}, status=status.HTTP_400_BAD_REQUEST)
@@ -42,9 +46,23 @@ def init_upload(request):
         except Folder.DoesNotExist:
             return Response({'error': 'Folder not found'}, status=status.HTTP_404_NOT_FOUND)
     
+    # Get target file if uploading a new version
+    target_file = None
+    if file_id:
+        try:
+            target_file = File.objects.get(id=file_id, owner=request.user)
+        except File.DoesNotExist:
+            return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    # S3-compatible object storage takes priority when configured
+    use_s3 = s3_manager.is_s3_available()
+    
     # Determine if we should use PostgreSQL LOB for this file
+    # Small files go to the pack tier instead of paying for a whole Large Object;
+    # when opted into (USE_CHUNK_STORE) the chunk store supersedes LOBs so versions share unchanged chunks
     use_postgres_lob = False
-    if lob_manager.is_postgresql_available():
+    if (not use_s3 and not pack_manager.should_pack(size) and not chunk_store.is_chunk_store_available()
+            and lob_manager.is_postgresql_available()):
         # Use LOB for large video/audio files or when Cloudinary is not configured
         is_media_file = mime_type and (mime_type.startswith('video/') or mime_type.startswith('audio/'))
         is_large_file = int(size) > 10 * 1024 * 1024  # Files larger than 10MB
@@ -62,17 +80,54 @@ def init_upload(request):
     elif int(size) > 50 * 1024 * 1024:  # Files larger than 50MB
         chunk_size = 2 * 1024 * 1024  # 2MB chunks for large files
     
+    # Each chunk becomes one S3 multipart part, which must be at least 5MB
+    if use_s3:
+        chunk_size = max(chunk_size, MIN_PART_SIZE)
+    
     # Create upload session
     upload_session = UploadSession.objects.create(
         user=request.user,
         filename=filename,
         expected_size=size,
         mime_type=mime_type or 'application/octet-stream',
-        folder=folder,
+        folder=target_file.folder if target_file else folder,
+        file=target_file,
         status='initialized',
-        use_postgres_lob=use_postgres_lob
+        use_postgres_lob=use_postgres_lob,
+        use_s3=use_s3
     )
     
+    response_data = {
+        'upload_id': upload_session.id,
+        'chunk_size': chunk_size,
+        'max_file_size': 100 * 1024 * 1024,  # Updated to 100MB
+        'use_postgres_lob': use_postgres_lob,
+        'use_s3': use_s3
+    }
+    
+    # If using S3, start the multipart upload immediately
+    if use_s3:
+        try:
+            s3_key = s3_manager.build_object_key(request.user.id, upload_session.id, filename)
+            s3_upload_id = s3_manager.create_multipart_upload(s3_key, upload_session.mime_type)
+            upload_session.s3_key = s3_key
+            upload_session.s3_upload_id = s3_upload_id
+            upload_session.save()
+        except Exception as e:
+            upload_session.status = 'failed'
+            upload_session.save()
+            return Response({'error': f'Failed to start S3 multipart upload: {str(e)}'},
+                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        # Presigned part URLs let clients bypass the app server entirely;
+        # posting chunks to upload_chunk keeps working as well
+        total_parts = max(1, -(-int(size) // chunk_size))
+        if total_parts <= MAX_PARTS:
+            response_data['part_upload_urls'] = [
+                s3_manager.generate_part_upload_url(s3_key, s3_upload_id, part_number)
+                for part_number in range(1, total_parts + 1)
+            ]
+    
     # If using PostgreSQL LOB, create the LOB immediately
     if use_postgres_lob:
         try:
@@ -86,18 +141,13 @@ def init_upload(request):
             return Response({'error': f'Failed to create PostgreSQL LOB: {str(e)}'}, 
                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    return Response({
-        'upload_id': upload_session.id,
-        'chunk_size': chunk_size,
-        'max_file_size': 100 * 1024 * 1024,  # Updated to 100MB
-        'use_postgres_lob': use_postgres_lob
-    }, status=status.HTTP_201_CREATED)
+    return Response(response_data, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser])
 def upload_chunk(request, upload_id):
-    """Upload file chunk - supports both traditional file chunks and PostgreSQL LOB"""
+    """Upload file chunk - supports S3 multipart parts, PostgreSQL LOB and traditional file chunks"""
     try:
         upload_session = UploadSession.objects.get(id=upload_id, user=request.user)
     except UploadSession.DoesNotExist:
@@ -113,7 +163,40 @@ def upload_chunk(request, upload_id):
     # Read chunk data
     chunk_data = chunk.read()
     
-    if upload_session.use_postgres_lob and upload_session.postgres_lob_oid:
+    if upload_session.use_s3 and upload_session.s3_upload_id:
+        # Each chunk maps 1:1 onto an S3 multipart part (part numbers start at 1)
+        try:
+            s3_manager.upload_part(
+                upload_session.s3_key,
+                upload_session.s3_upload_id,
+                chunk_number + 1,
+                chunk_data
+            )
+            
+            # Parts may arrive in parallel; the authoritative part list is
+            # fetched from S3 on completion, this is only progress reporting
+            upload_session.uploaded_chunks = upload_session.uploaded_chunks or []
+            if chunk_number not in upload_session.uploaded_chunks:
+                upload_session.uploaded_chunks.append(chunk_number)
+            upload_session.status = 'uploading'
+            upload_session.save(update_fields=['uploaded_chunks', 'status', 'updated_at'])
+            
+            progress = (len(upload_session.uploaded_chunks) / total_chunks) * 100
+            
+            return Response({
+                'chunk_number': chunk_number,
+                'progress': progress,
+                'uploaded_chunks': len(upload_session.uploaded_chunks),
+                'total_chunks': total_chunks
+            })
+            
+        except Exception as e:
+            upload_session.status = 'failed'
+            upload_session.save()
+            logger.error(f"S3 part upload failed: {e}")
+            return Response({'error': f'S3 part upload failed: {str(e)}'},
+                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    elif upload_session.use_postgres_lob and upload_session.postgres_lob_oid:
         # Use PostgreSQL LOB for efficient chunked upload
         try:
             bytes_written = lob_manager.append_chunk_to_lob(
@@ -177,7 +260,7 @@ def upload_chunk(request, upload_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def complete_upload(request, upload_id):
-    """Complete upload and create file record with storage priority: Cloudinary > PostgreSQL LOB > Local"""
+    """Complete upload and create file record with storage priority: S3 > Cloudinary > PostgreSQL LOB > Local"""
     try:
         upload_session = UploadSession.objects.get(id=upload_id, user=request.user)
     except UploadSession.DoesNotExist:
@@ -187,7 +270,10 @@ def complete_upload(request, upload_id):
         return Response({'error': 'Upload already completed'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        if upload_session.use_postgres_lob and upload_session.postgres_lob_oid:
+        if upload_session.use_s3 and upload_session.s3_upload_id:
+            # Handle S3 multipart completion
+            return _complete_s3_upload(upload_session, request.user)
+        elif upload_session.use_postgres_lob and upload_session.postgres_lob_oid:
             # Handle PostgreSQL LOB completion
             return _complete_lob_upload(upload_session, request.user)
         else:
@@ -205,12 +291,81 @@ def complete_upload(request, upload_id):
                 lob_manager.delete_lob(upload_session.postgres_lob_oid)
             except:
                 pass  # Don't fail if LOB cleanup fails
+        
+        # Abort S3 multipart upload if it exists
+        if upload_session.s3_upload_id:
+            try:
+                s3_manager.abort_multipart_upload(upload_session.s3_key, upload_session.s3_upload_id)
+            except:
+                pass  # Don't fail if S3 cleanup fails
                 
         logger.error(f"Upload completion failed: {e}")
         return Response({'error': f'Upload completion failed: {str(e)}'}, 
                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+CONTENT_FIELDS = (
+    'storage_key', 'storage_type', 'postgres_lob_oid', 'cloudinary_public_id', 'cloudinary_url',
+    'cloudinary_secure_url', 'file', 'size_bytes', 'mime_type', 'checksum',
+)
+
+def _save_uploaded_file(upload_session, user, file_obj):
+    """Save uploaded content as a new file, or as a new version of the session's target file"""
+    target = upload_session.file
+    if target is None:
+        file_obj.save()
+        return file_obj
+    
+    content = {field: getattr(file_obj, field) for field in CONTENT_FIELDS}
+    content['file'] = file_obj.file.name or None
+    target.replace_content(user, **content)
+    return target
+
+
+def _complete_s3_upload(upload_session, user):
+    """Complete an S3 multipart upload with CompleteMultipartUpload"""
+    try:
+        # List parts from S3 rather than trusting the session, so chunks
+        # uploaded in parallel (or straight to presigned URLs) are all included
+        parts = s3_manager.list_parts(upload_session.s3_key, upload_session.s3_upload_id)
+        total_size = sum(part['Size'] for part in parts)
+        expected_size = int(upload_session.expected_size)
+        
+        if not parts or total_size != expected_size:
+            # Leave the multipart upload open so missing parts can be retried
+            return Response({'error': f'File size mismatch: expected {expected_size}, got {total_size}'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        s3_manager.complete_multipart_upload(upload_session.s3_key, upload_session.s3_upload_id, parts)
+        
+        # Bytes never pass through the app server as a whole, so no checksum is computed here
+        file_obj = File(
+            name=upload_session.filename,
+            storage_key=f's3/{upload_session.s3_key}',
+            storage_type='s3',
+            owner=user,
+            folder=upload_session.folder,
+            size_bytes=total_size,
+            mime_type=upload_session.mime_type,
+            status='ready'
+        )
+        file_obj = _save_uploaded_file(upload_session, user, file_obj)
+        
+        # Update upload session
+        upload_session.status = 'completed'
+        upload_session.file = file_obj
+        upload_session.save()
+        
+        logger.info(f"Completed S3 upload: {file_obj.name} ({upload_session.s3_key}, {len(parts)} parts)")
+        
+        return Response(FileSerializer(file_obj, context={'request': None}).data,
+                       status=status.HTTP_201_CREATED)
+        
+    except Exception as e:
+        logger.error(f"S3 upload completion failed: {e}")
+        raise
+
+
 def _complete_lob_upload(upload_session, user):
     """Complete a PostgreSQL LOB upload"""
     try:
@@ -248,7 +403,7 @@ def _complete_lob_upload(upload_session, user):
             checksum=checksum,
             status='ready'
         )
-        file_obj.save()
+        file_obj = _save_uploaded_file(upload_session, user, file_obj)
         
         # Update upload session
         upload_session.status = 'completed'
@@ -352,14 +507,37 @@ def _complete_traditional_upload(upload_session, user):
                 print(f"Cloudinary upload failed, falling back to PostgreSQL: {str(e)}")
                 use_cloudinary = False
 
+        # Small files are appended to a pack segment instead of getting their own object
+        pack_entry = None
+        if not cloudinary_public_id and pack_manager.should_pack(total_size):
+            try:
+                pack_entry = pack_manager.append(file_data)
+            except Exception as e:
+                logger.warning(f"Pack storage failed, falling back to local storage: {e}")
+
+        # Larger files are split into deduplicated chunks shared across versions and files
+        manifest = None
+        if not cloudinary_public_id and not pack_entry and chunk_store.is_chunk_store_available():
+            manifest = chunk_store.store(file_data)
+
         # Create File record
+        if pack_entry:
+            storage_key = f'pack/{pack_entry.id}'
+            storage_type = 'pack'
+        elif manifest:
+            storage_key = f'cas/{manifest.id}'
+            storage_type = 'chunked'
+        else:
+            storage_key = cloudinary_public_id or f'files/{user.id}/{uuid.uuid4()}/{upload_session.filename}'
+            storage_type = 'cloudinary' if cloudinary_public_id else 'local_file'
+        
         file_obj = File(
             name=upload_session.filename,
-            storage_key=cloudinary_public_id or f'files/{user.id}/{uuid.uuid4()}/{upload_session.filename}',
+            storage_key=storage_key,
             cloudinary_public_id=cloudinary_public_id,
             cloudinary_url=cloudinary_url,
             cloudinary_secure_url=cloudinary_secure_url,
-            storage_type='cloudinary' if cloudinary_public_id else 'local_file',
+            storage_type=storage_type,
             owner=user,
             folder=upload_session.folder,
             size_bytes=total_size,
@@ -369,11 +547,12 @@ def _complete_traditional_upload(upload_session, user):
         )
 
         # If not using Cloudinary or Cloudinary failed, save file to PostgreSQL/local storage
-        if not use_cloudinary or not cloudinary_public_id:
+        if not pack_entry and not manifest and (not use_cloudinary or not cloudinary_public_id):
             # Store file data directly in PostgreSQL as binary data or save to local storage
             try:
                 django_file = ContentFile(file_data, name=upload_session.filename)
                 file_obj.file.save(upload_session.filename, django_file, save=False)
+                file_obj.storage_key = file_obj.file.name  # Where the bytes are, so they can be released by key
                 # For PostgreSQL, we can also store large objects or use bytea fields
                 # The file field will handle the storage automatically
             except Exception as e:
@@ -382,7 +561,7 @@ def _complete_traditional_upload(upload_session, user):
                 return Response({'error': f'Local storage failed: {str(e)}'}, 
                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        file_obj.save()
+        file_obj = _save_uploaded_file(upload_session, user, file_obj)
 
         # Update upload session
         upload_session.status = 'completed'
@@ -415,6 +594,13 @@ def cancel_upload(request, upload_id):
         except Exception as e:
             logger.warning(f"Failed to cleanup LOB {upload_session.postgres_lob_oid}: {e}")
     
+    # Abort S3 multipart upload if it exists
+    if upload_session.s3_upload_id:
+        try:
+            s3_manager.abort_multipart_upload(upload_session.s3_key, upload_session.s3_upload_id)
+        except Exception as e:
+            logger.warning(f"Failed to abort S3 multipart upload {upload_session.s3_upload_id}: {e}")
+    
     # Clean up traditional chunks
     if upload_session.uploaded_chunks:
         for chunk_number in upload_session.uploaded_chunks:
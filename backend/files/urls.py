@@ -6,7 +6,9 @@ urlpatterns = [
     path('folders/<uuid:folder_id>/', views.folder_detail, name='folder_detail'),
     path('folders/<uuid:folder_id>/contents/', views.folder_contents, name='folder_contents'),
     path('folders/<uuid:folder_id>/delete-force/', views.delete_folder_force, name='delete_folder_force'),
+    path('folder-deletions/<uuid:job_id>/', views.folder_deletion_job, name='folder_deletion_job'),
     path('files/', views.files, name='files'),
+    path('files/batch/', views.batch_file_operations, name='batch_file_operations'),
     path('files/<uuid:file_id>/', views.file_detail, name='file_detail'),
     path('files/<uuid:file_id>/rename/', views.rename_file, name='rename_file'),
     path('files/<uuid:file_id>/download/', download_views.download_file, name='file_download'),
@@ -27,6 +29,10 @@ urlpatterns = [
     path('dashboard/', views.dashboard_data, name='dashboard_data'),
     path('share/<str:token>/', views.public_file_access, name='public_file_access'),
     path('shared-with-me/', views.shared_with_me, name='shared_with_me'),
+    path('shared-with-me/folders/<uuid:folder_id>/', views.shared_folder_contents, name='shared_folder_contents'),
+    path('search/', views.search, name='search'),
+    path('changes/', views.changes, name='changes'),
+    path('metrics/', views.metrics_view, name='metrics'),
     
     # Upload endpoints
     path('uploads/init/', upload_views.init_upload, name='init_upload'),
@@ -0,0 +1,202 @@
+"""
+Incremental per-user statistics for the dashboard.
+A UserStats row holds the user's totals (ready files, folders, bytes by type
+category) and UserDailyStats rows hold ready files by creation day plus
+downloads by day. Both are maintained from the file and folder lifecycle hooks,
+the scrubber and the bulk delete engine; reconcile() repairs any drift.
+"""
+
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .search import DOCUMENT_MIME_TYPES
+import logging
+
+logger = logging.getLogger(__name__)
+
+TYPE_CATEGORIES = ('documents', 'images', 'videos', 'audio', 'other')
+STAT_FIELDS = ('files_count', 'folders_count', 'total_size_bytes') + tuple(f'{c}_bytes' for c in TYPE_CATEGORIES)
+BUCKET_FIELDS = ('uploads', 'uploaded_bytes')  # Downloads are events with no other record, so never recomputed
+
+def type_category(mime_type):
+    """Dashboard category of a MIME type"""
+    mime_type = mime_type or ''
+    if mime_type in DOCUMENT_MIME_TYPES:
+        return 'documents'
+    for prefix, category in (('image/', 'images'), ('video/', 'videos'), ('audio/', 'audio')):
+        if mime_type.startswith(prefix):
+            return category
+    return 'other'
+
+def file_state(status, size_bytes, mime_type, created_at):
+    """(is_ready, size_bytes, category, creation day) as seen by the rollups"""
+    day = timezone.localdate(created_at) if created_at else None
+    return (status == 'ready', size_bytes or 0, type_category(mime_type), day)
+
+class UserStatsManager:
+    """Manager class for maintaining and repairing per-user statistics"""
+
+    def _apply(self, user_id, deltas):
+        """Add deltas to the user's rollup row, creating the row on first use"""
+        from .models import UserStats
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        expressions = {field: F(field) + delta for field, delta in deltas.items()}
+        if not UserStats.objects.filter(user_id=user_id).update(**expressions):
+            UserStats.objects.get_or_create(user_id=user_id)
+            UserStats.objects.filter(user_id=user_id).update(**expressions)
+
+    def _apply_day(self, user_id, day, deltas):
+        from .models import UserDailyStats
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if day is None or not deltas:
+            return
+        expressions = {field: F(field) + delta for field, delta in deltas.items()}
+        if not UserDailyStats.objects.filter(user_id=user_id, day=day).update(**expressions):
+            UserDailyStats.objects.get_or_create(user_id=user_id, day=day)
+            UserDailyStats.objects.filter(user_id=user_id, day=day).update(**expressions)
+
+    def _apply_states(self, user_id, signed_states):
+        """Apply [(sign, state, count), ...] as one rollup update plus one per day"""
+        totals = defaultdict(int)
+        days = defaultdict(lambda: defaultdict(int))
+        for sign, (is_ready, size_bytes, category, day), count in signed_states:
+            if not is_ready:
+                continue
+            totals['files_count'] += sign * count
+            totals['total_size_bytes'] += sign * size_bytes
+            totals[f'{category}_bytes'] += sign * size_bytes
+            days[day]['uploads'] += sign * count
+            days[day]['uploaded_bytes'] += sign * size_bytes
+
+        with transaction.atomic():
+            self._apply(user_id, totals)
+            for day, deltas in days.items():
+                self._apply_day(user_id, day, deltas)
+
+    def file_transition(self, user_id, before, after):
+        """Apply a file state change; `before`/`after` are file_state() tuples or None"""
+        if before == after:
+            return
+        states = []
+        if before:
+            states.append((-1, before, 1))
+        if after:
+            states.append((1, after, 1))
+        self._apply_states(user_id, states)
+
+    def files_removed(self, user_id, states):
+        """Remove files that were deleted or failed with a queryset-level write"""
+        self._apply_states(user_id, [(-1, state, 1) for state in states])
+
+    def files_restored(self, user_id, states):
+        """Count files again that a queryset-level write made ready"""
+        self._apply_states(user_id, [(1, state, 1) for state in states])
+
+    def bump_change_version(self, user_id):
+        """Move the version behind the root and all-files listing ETags"""
+        self._apply(user_id, {'change_version': 1})
+
+    def download(self, user_id):
+        self._apply_day(user_id, timezone.localdate(), {'downloads': 1})
+
+    def folder_created(self, user_id):
+        self._apply(user_id, {'folders_count': 1})
+
+    def folder_tree_deleted(self, folder):
+        """Remove a folder, its subfolders and the ready files they still hold"""
+        from .models import File, Folder
+        subtree = Folder.objects.filter(Folder.subtree_q(folder.path)) if folder.path else Folder.objects.filter(id=folder.id)
+        groups = (
+            File.objects.filter(folder__in=subtree, status='ready').order_by()
+            .values('mime_type', day=TruncDate('created_at'))
+            .annotate(count=Count('id'), size=Sum('size_bytes'))
+        )
+        states = [
+            (-1, (True, group['size'] or 0, type_category(group['mime_type']), group['day']), group['count'])
+            for group in groups
+        ]
+        with transaction.atomic():
+            self._apply(folder.owner_id, {'folders_count': -subtree.count()})
+            self._apply_states(folder.owner_id, states)
+
+    def compute(self, user=None):
+        """Recompute everything from scratch; returns (rollups, buckets)"""
+        from .models import File, Folder
+        files = File.objects.all()
+        folders = Folder.objects.all()
+        if user is not None:
+            files = files.filter(owner=user)
+            folders = folders.filter(owner=user)
+        return self.compute_from(files, folders)
+
+    def compute_from(self, files, folders):
+        """
+        Rollups for the given querysets (also used by migrations):
+        {user_id: {field: value}} and {(user_id, day): {field: value}}
+        """
+        rollups = defaultdict(lambda: dict.fromkeys(STAT_FIELDS, 0))
+        ready = files.filter(status='ready').order_by()
+
+        for owner_id, mime_type, count, size in ready.values('owner_id', 'mime_type').annotate(
+            count=Count('id'), size=Sum('size_bytes')
+        ).values_list('owner_id', 'mime_type', 'count', 'size'):
+            row = rollups[owner_id]
+            row['files_count'] += count
+            row['total_size_bytes'] += size or 0
+            row[f'{type_category(mime_type)}_bytes'] += size or 0
+
+        for owner_id, count in folders.order_by().values('owner_id').annotate(
+            count=Count('id')
+        ).values_list('owner_id', 'count'):
+            rollups[owner_id]['folders_count'] = count
+
+        buckets = {}
+        for owner_id, day, count, size in ready.values('owner_id', day=TruncDate('created_at')).annotate(
+            count=Count('id'), size=Sum('size_bytes')
+        ).values_list('owner_id', 'day', 'count', 'size'):
+            buckets[(owner_id, day)] = {'uploads': count, 'uploaded_bytes': size or 0}
+        return dict(rollups), buckets
+
+    def reconcile(self, user=None, dry_run=False):
+        """Repair rollup rows and buckets that drifted; returns the number repaired"""
+        from .models import UserStats, UserDailyStats
+        rollups, buckets = self.compute(user)
+        stored_rollups = UserStats.objects.all() if user is None else UserStats.objects.filter(user=user)
+        stored_buckets = UserDailyStats.objects.all() if user is None else UserDailyStats.objects.filter(user=user)
+
+        stale, missing = [], []
+        current = {user_id: dict(zip(STAT_FIELDS, values))
+                   for user_id, *values in stored_rollups.values_list('user_id', *STAT_FIELDS).iterator()}
+        for user_id in set(current) | set(rollups):
+            expected = rollups.get(user_id, dict.fromkeys(STAT_FIELDS, 0))
+            if user_id not in current:
+                missing.append(UserStats(user_id=user_id, **expected))
+            elif current[user_id] != expected:
+                stale.append(UserStats(user_id=user_id, **expected))
+
+        stale_days, missing_days = [], []
+        current = {(user_id, day): (pk, dict(zip(BUCKET_FIELDS, values)))
+                   for pk, user_id, day, *values in stored_buckets.values_list('id', 'user_id', 'day', *BUCKET_FIELDS).iterator()}
+        for key in set(current) | set(buckets):
+            expected = buckets.get(key, dict.fromkeys(BUCKET_FIELDS, 0))
+            if key not in current:
+                missing_days.append(UserDailyStats(user_id=key[0], day=key[1], **expected))
+            elif current[key][1] != expected:
+                stale_days.append(UserDailyStats(id=current[key][0], **expected))
+
+        if not dry_run:
+            with transaction.atomic():
+                UserStats.objects.bulk_create(missing, batch_size=500)
+                UserStats.objects.bulk_update(stale, STAT_FIELDS, batch_size=500)
+                UserDailyStats.objects.bulk_create(missing_days, batch_size=500)
+                UserDailyStats.objects.bulk_update(stale_days, BUCKET_FIELDS, batch_size=500)
+        repaired = len(stale) + len(missing) + len(stale_days) + len(missing_days)
+        logger.info(f"User stats reconciliation found {repaired} stale rows")
+        return repaired
+
+# Global instance
+user_stats = UserStatsManager()
@@ -1,23 +1,50 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, parser_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth.hashers import make_password, check_password
 from django.db import models
 from django.contrib.auth import get_user_model
-from .models import File, Folder, Share, Invite, FileActivity, FileVersion, Activity
+from .models import File, Folder, Share, Invite, FileVersion, Activity, FolderDeletionJob, UserStats, UserDailyStats
 from .serializers import (
     FileSerializer, FolderSerializer, FileUploadSerializer,
     FileDetailSerializer, FileRenameSerializer, FileVersionSerializer, ActivitySerializer
 )
+from .listing import file_listing_queryset, parse_file_fields
+from .file_rows import build_file_rows, cursor_row, fast_path_enabled, file_rows_queryset, page_limit, should_stream
+from .renderers import streaming_json_response
+from .counting import count_files
+from .pagination import FILE_SORT_FIELDS, InvalidCursor, apply_keyset, encode_cursor
+from .search import search_index
+from .bulk_delete import folder_delete_engine
+from .batch_operations import batch_operations
+from .audit import audit_sink
+from .activity_log import activity_page
+from .permissions import access_resolver, get_file_or_404
+from .shared_listing import shared_folder_files, shared_item_row, shared_items_queryset, shared_sort
+from .user_stats import TYPE_CATEGORIES
+from .change_versions import change_versions, etag_response
+from .change_journal import change_journal
+from .response_cache import cache_response, get_stats as response_cache_stats
+from . import metrics
 
 User = get_user_model()
 
+def _listing_version(request, param):
+    """Change version behind a listing of the folder named by a query parameter, or of the user root"""
+    folder_id = request.query_params.get(param)
+    if folder_id:
+        return change_versions.folder_version(request.user, folder_id)
+    return change_versions.user_version(request.user)
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@etag_response('folders', lambda request: _listing_version(request, 'parent'))
+@cache_response('folders')
 def folders(request):
     if request.method == 'GET':
         parent_id = request.query_params.get('parent')
@@ -39,18 +66,15 @@ def folders(request):
                     parent = Folder.objects.get(id=parent_id, owner=request.user)
                 except Folder.DoesNotExist:
                     return Response({'error': 'Parent folder not found'}, status=status.HTTP_400_BAD_REQUEST)
+                if _exceeds_max_depth(parent):
+                    return Response({'error': 'Folder nesting is too deep'}, status=status.HTTP_400_BAD_REQUEST)
             
             folder = serializer.save(owner=request.user)
             
             # Log activity
-            Activity.objects.create(
-                user=request.user,
-                object_type='folder',
-                object_id=folder.id,
-                action='created',
-                metadata={'folder_name': folder.name, 'folder_id': str(folder.id)},
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            audit_sink.log(
+                request.user.id, 'folder', folder.id, 'created',
+                {'folder_name': folder.name, 'folder_id': str(folder.id)}, meta=request.META
             )
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -69,25 +93,25 @@ def folder_detail(request, folder_id):
         serializer = FolderSerializer(folder, data=request.data, partial=True)
         if serializer.is_valid():
             # Check for cycle prevention if parent is being changed
-            new_parent_id = serializer.validated_data.get('parent')
-            if new_parent_id and new_parent_id != folder.parent_id:
+            new_parent = serializer.validated_data.get('parent')
+            if new_parent and new_parent.id != folder.parent_id:
+                if new_parent.owner_id != request.user.id:
+                    return Response({'error': 'Parent folder not found'}, status=status.HTTP_400_BAD_REQUEST)
                 # Prevent moving folder into its own subtree
-                if _would_create_cycle(folder, new_parent_id):
+                if _would_create_cycle(folder, new_parent.id):
                     return Response({'error': 'Cannot move folder into its own subtree'}, status=status.HTTP_400_BAD_REQUEST)
+                if _exceeds_max_depth(new_parent, folder):
+                    return Response({'error': 'Folder nesting is too deep'}, status=status.HTTP_400_BAD_REQUEST)
             
             old_name = folder.name
             updated_folder = serializer.save(updated_at=timezone.now())
             
             # Log rename activity if name changed
             if 'name' in request.data and old_name != updated_folder.name:
-                Activity.objects.create(
-                    user=request.user,
-                    object_type='folder',
-                    object_id=updated_folder.id,
-                    action='renamed',
-                    metadata={'old_name': old_name, 'new_name': updated_folder.name, 'folder_id': str(updated_folder.id)},
-                    ip_address=request.META.get('REMOTE_ADDR'),
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')
+                audit_sink.log(
+                    request.user.id, 'folder', updated_folder.id, 'renamed',
+                    {'old_name': old_name, 'new_name': updated_folder.name, 'folder_id': str(updated_folder.id)},
+                    meta=request.META
                 )
             
             return Response(serializer.data)
@@ -105,14 +129,9 @@ def folder_detail(request, folder_id):
                 'subfolders_count': subfolders_count
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        Activity.objects.create(
-            user=request.user,
-            object_type='folder',
-            object_id=folder.id,
-            action='deleted',
-            metadata={'folder_name': folder.name, 'folder_id': str(folder.id)},
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
+        audit_sink.log(
+            request.user.id, 'folder', folder.id, 'deleted',
+            {'folder_name': folder.name, 'folder_id': str(folder.id)}, meta=request.META
         )
         
         folder.delete()
@@ -120,16 +139,22 @@ def folder_detail(request, folder_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@etag_response('folder_contents', lambda request, folder_id: change_versions.folder_version(request.user, folder_id))
+@cache_response('folder_contents')
 def folder_contents(request, folder_id):
     folder = get_object_or_404(Folder, id=folder_id, owner=request.user)
+    try:
+        fields = parse_file_fields(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
     # Get subfolders
     subfolders = folder.subfolders.all()
     folders_data = FolderSerializer(subfolders, many=True).data
     
-    # Get files
-    files = folder.files.filter(status='ready')
-    files_data = FileSerializer(files, many=True, context={'request': request}).data
+    # Get files (the model's default ordering reads modified_at)
+    files = file_listing_queryset(folder.files.filter(status='ready'), fields, columns=('modified_at',))
+    files_data = FileSerializer(files, many=True, context={'request': request}, fields=fields).data
     
     # Get breadcrumb path
     breadcrumbs = _get_breadcrumbs(folder)
@@ -144,7 +169,7 @@ def folder_contents(request, folder_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def move_file(request, file_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'owner')
     folder_id = request.data.get('folder_id')
     
     old_folder = file_obj.folder
@@ -156,93 +181,105 @@ def move_file(request, file_id):
         file_obj.folder = None
     
     file_obj.modified_at = timezone.now()
-    file_obj.save()
-    
-    # Log move activity
-    FileActivity.objects.create(
-        file=file_obj,
-        user=request.user,
-        action='moved',
-        details={
+    file_obj._updated_by = request.user
+    file_obj._activity = {
+        'action': 'moved',
+        'metadata': {
             'old_folder': old_folder.name if old_folder else 'Root',
             'new_folder': new_folder.name if folder_id else 'Root'
         },
-        ip_address=request.META.get('REMOTE_ADDR'),
-        user_agent=request.META.get('HTTP_USER_AGENT', '')
-    )
+        'meta': request.META
+    }
+    file_obj.save()
     
     return Response(FileSerializer(file_obj, context={'request': request}).data)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_file_operations(request):
+    """Apply a list of move, rename, delete and share operations in one transaction"""
+    operations = request.data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return Response({'error': 'operations must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(operations) > batch_operations.max_operations:
+        return Response(
+            {'error': f'At most {batch_operations.max_operations} operations per batch'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    return Response(batch_operations.run(request.user, operations, meta=request.META))
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_folder_force(request, folder_id):
     folder = get_object_or_404(Folder, id=folder_id, owner=request.user)
     
-    # Recursively delete all contents
-    _delete_folder_recursive(folder, request.user, request.META)
+    # Small subtrees are deleted inline; large ones become a background job.
+    # A folder already being deleted answers with its running job.
+    job, created = folder_delete_engine.create_job(folder, request.user)
+    if not created or folder_delete_engine.should_run_async(job):
+        if created:
+            folder_delete_engine.run_async(job)
+        return Response({
+            'job_id': str(job.id),
+            'status': job.status,
+            'files_total': job.files_total,
+            'folders_total': job.folders_total
+        }, status=status.HTTP_202_ACCEPTED)
     
+    folder_delete_engine.run(job, meta=request.META)
     return Response(status=status.HTTP_204_NO_CONTENT)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def folder_deletion_job(request, job_id):
+    job = get_object_or_404(FolderDeletionJob, id=job_id, owner=request.user)
+    return Response({
+        'job_id': str(job.id),
+        'folder_id': str(job.folder_id),
+        'folder_name': job.folder_name,
+        'status': job.status,
+        'folders_total': job.folders_total,
+        'files_total': job.files_total,
+        'files_deleted': job.files_deleted,
+        'bytes_deleted': job.bytes_deleted,
+        'error': job.error or None,
+        'created_at': job.created_at,
+        'completed_at': job.completed_at
+    })
+
 def _would_create_cycle(folder, new_parent_id):
     """Check if moving folder to new_parent_id would create a cycle"""
-    current = Folder.objects.filter(id=new_parent_id).first()
-    while current:
-        if current.id == folder.id:
-            return True
-        current = current.parent
-    return False
+    new_parent_path = Folder.objects.filter(id=new_parent_id).values_list('path', flat=True).first()
+    return bool(new_parent_path) and new_parent_path.startswith(folder.path)
+
+def _exceeds_max_depth(parent, folder=None):
+    """Whether placing folder (and its subtree) under parent goes past Folder.MAX_DEPTH"""
+    height = 0
+    if folder is not None:
+        deepest = folder.get_descendants(include_self=True).aggregate(deepest=models.Max('depth'))['deepest']
+        height = (deepest or folder.depth) - folder.depth
+    return parent.depth + 1 + height >= Folder.MAX_DEPTH
 
 def _get_breadcrumbs(folder):
-    """Get breadcrumb trail for a folder"""
-    breadcrumbs = []
-    current = folder
-    while current:
-        breadcrumbs.insert(0, {
-            'id': str(current.id),
-            'name': current.name
-        })
-        current = current.parent
-    
-    # Add root
-    breadcrumbs.insert(0, {
+    """Get breadcrumb trail for a folder (ancestor ids come from its path)"""
+    breadcrumbs = [{
         'id': None,
         'name': 'My Files'
-    })
+    }]
+    for folder_id, name in folder.get_ancestors(include_self=True).values_list('id', 'name'):
+        breadcrumbs.append({
+            'id': str(folder_id),
+            'name': name
+        })
     
     return breadcrumbs
 
-def _delete_folder_recursive(folder, user, meta):
-    """Recursively delete folder and all contents"""
-    # Delete all files in folder
-    for file_obj in folder.files.all():
-        FileActivity.objects.create(
-            file=file_obj,
-            user=user,
-            action='deleted',
-            ip_address=meta.get('REMOTE_ADDR'),
-            user_agent=meta.get('HTTP_USER_AGENT', '')
-        )
-        file_obj.delete()
-    
-    # Recursively delete subfolders
-    for subfolder in folder.subfolders.all():
-        _delete_folder_recursive(subfolder, user, meta)
-    
-    # Delete the folder itself
-    Activity.objects.create(
-        user=user,
-        object_type='folder',
-        object_id=folder.id,
-        action='deleted',
-        metadata={'folder_name': folder.name, 'folder_id': str(folder.id)},
-        ip_address=meta.get('REMOTE_ADDR'),
-        user_agent=meta.get('HTTP_USER_AGENT', '')
-    )
-    folder.delete()
-
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser])
+@etag_response('files', lambda request: _listing_version(request, 'folder'))
+@cache_response('files')
 def files(request):
     if request.method == 'GET':
         # Get query parameters
@@ -250,8 +287,15 @@ def files(request):
         file_type = request.query_params.get('type')  # image, video, document, other
         search_query = request.query_params.get('q', '')
         sort_by = request.query_params.get('sort_by', '-modified_at')  # name, -name, modified_at, -modified_at, size_bytes, -size_bytes
-        limit = int(request.query_params.get('limit', 50))
         cursor = request.query_params.get('cursor')
+        try:
+            limit = page_limit(int(request.query_params.get('limit', 50)))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fields = parse_file_fields(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Base queryset
         files = File.objects.filter(owner=request.user, status='ready')
@@ -289,45 +333,41 @@ def files(request):
             files = files.filter(name__icontains=search_query)
         
         # Apply sorting
-        valid_sorts = ['name', '-name', 'modified_at', '-modified_at', 'size_bytes', '-size_bytes', 'created_at', '-created_at']
-        if sort_by in valid_sorts:
-            files = files.order_by(sort_by)
-        else:
-            files = files.order_by('-modified_at')
+        if sort_by not in [f'{prefix}{field}' for field in FILE_SORT_FIELDS for prefix in ('', '-')]:
+            sort_by = '-modified_at'
         
-        # Apply cursor pagination
-        if cursor:
-            try:
-                cursor_file = File.objects.get(id=cursor, owner=request.user)
-                if sort_by.startswith('-'):
-                    field = sort_by[1:]
-                    cursor_value = getattr(cursor_file, field)
-                    files = files.filter(**{f'{field}__lt': cursor_value})
-                else:
-                    cursor_value = getattr(cursor_file, sort_by)
-                    files = files.filter(**{f'{sort_by}__gt': cursor_value})
-            except File.DoesNotExist:
-                pass
-        
-        # Limit results
-        files_page = files[:limit + 1]  # Get one extra to check if there are more
-        has_more = len(files_page) > limit
-        if has_more:
-            files_page = files_page[:limit]
+        # Apply keyset (cursor) pagination
+        try:
+            page_query = apply_keyset(files, sort_by, cursor)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get next cursor
-        next_cursor = None
-        if has_more and files_page:
-            next_cursor = str(files_page[-1].id)
+        # Only count on first page
+        total = None
+        if not cursor:
+            total = count_files(
+                files, request.user,
+                folder_id=folder_id or None,
+                filtered=bool(file_type or search_query),
+                cache_parts=('files', folder_id, file_type, search_query)
+            )
         
-        serializer = FileSerializer(files_page, many=True, context={'request': request})
+        if fast_path_enabled():
+            # Rows straight from .values(), one extra to check if there are more
+            values = file_rows_queryset(page_query, fields, columns=(sort_by.lstrip('-'),))[:limit + 1]
+            if should_stream(limit):
+                return _stream_file_page(values, fields, sort_by, limit, total)
+            values = list(values)
+            last = cursor_row(values[limit - 1]) if len(values) > limit else None
+            return Response({'files': list(build_file_rows(values[:limit], fields)), **_file_page_tail(last, sort_by, total)})
         
-        return Response({
-            'files': serializer.data,
-            'has_more': has_more,
-            'next_cursor': next_cursor,
-            'total_count': files.count() if not cursor else None  # Only count on first page
-        })
+        # Limit results
+        files_page = list(  # Get one extra to check if there are more
+            file_listing_queryset(page_query, fields, columns=(sort_by.lstrip('-'),))[:limit + 1]
+        )
+        last = files_page[limit - 1] if len(files_page) > limit else None
+        serializer = FileSerializer(files_page[:limit], many=True, context={'request': request}, fields=fields)
+        return Response({'files': serializer.data, **_file_page_tail(last, sort_by, total)})
     
     elif request.method == 'POST':
         serializer = FileUploadSerializer(data=request.data, context={'request': request})
@@ -336,59 +376,76 @@ def files(request):
             return Response(FileSerializer(file_obj, context={'request': request}).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def _file_page_tail(last, sort_by, total):
+    """Pagination keys of a files page; `last` is the final row when more follow"""
+    return {
+        'has_more': last is not None,
+        'next_cursor': encode_cursor(last, sort_by) if last is not None else None,
+        'total_count': total.value if total else None,
+        'total_count_approximate': total.approximate if total else False
+    }
+
+def _stream_file_page(values, fields, sort_by, limit, total):
+    """Stream a large files page, reading rows from the database as they are sent"""
+    state = {'last': None, 'has_more': False}
+    
+    def page():
+        for index, row in enumerate(values.iterator(chunk_size=500)):
+            if index == limit:
+                state['has_more'] = True
+                break
+            state['last'] = row
+            yield row
+    
+    def tail():
+        last = cursor_row(state['last']) if state['has_more'] else None
+        return _file_page_tail(last, sort_by, total)
+    
+    return streaming_json_response('files', build_file_rows(page(), fields), tail)
+
+EDITOR_WRITABLE_FILE_FIELDS = ('name', 'description')
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def file_detail(request, file_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    required = {'GET': 'viewer', 'PUT': 'editor'}.get(request.method, 'owner')
+    file_obj = get_file_or_404(request.user, file_id, required)
     
     if request.method == 'GET':
-        # Log file access
-        FileActivity.objects.create(
-            file=file_obj,
-            user=request.user,
-            action='downloaded',
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
-        
         serializer = FileDetailSerializer(file_obj, context={'request': request})
         return Response(serializer.data)
     
     elif request.method == 'PUT':
+        # Collaborators may edit what the file is called and says, not where it lives, who sees it or what it serves
+        restricted = sorted(set(request.data) - set(EDITOR_WRITABLE_FILE_FIELDS))
+        if restricted and file_obj.effective_permission != 'owner':
+            return Response(
+                {'error': f"Only the owner can change {', '.join(restricted)}"}, status=status.HTTP_403_FORBIDDEN
+            )
         serializer = FileSerializer(file_obj, data=request.data, partial=True)
         if serializer.is_valid():
-            old_name = file_obj.name
-            updated_file = serializer.save(modified_at=timezone.now())
-            
-            # Log activity if name changed
-            if 'name' in request.data and old_name != updated_file.name:
-                FileActivity.objects.create(
-                    file=updated_file,
-                    user=request.user,
-                    action='renamed',
-                    details={'old_name': old_name, 'new_name': updated_file.name},
-                    ip_address=request.META.get('REMOTE_ADDR'),
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')
-                )
-            
+            # Log a rename as such rather than as a generic update
+            new_name = serializer.validated_data.get('name', file_obj.name)
+            file_obj._updated_by = request.user
+            file_obj._activity = {
+                'action': 'renamed' if new_name != file_obj.name else None,
+                'metadata': {'old_name': file_obj.name, 'new_name': new_name},
+                'meta': request.META
+            }
+            serializer.save(modified_at=timezone.now())
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     elif request.method == 'DELETE':
-        FileActivity.objects.create(
-            file=file_obj,
-            user=request.user,
-            action='deleted',
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
+        file_obj._deleted_by = request.user
+        file_obj._activity = {'meta': request.META}
         file_obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def rename_file(request, file_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'editor')
     serializer = FileRenameSerializer(data=request.data)
     
     if serializer.is_valid():
@@ -397,18 +454,12 @@ def rename_file(request, file_id):
         
         file_obj.name = new_name
         file_obj.modified_at = timezone.now()
+        file_obj._updated_by = request.user
+        file_obj._activity = {
+            'action': 'renamed', 'metadata': {'old_name': old_name, 'new_name': new_name}, 'meta': request.META
+        }
         file_obj.save()
         
-        # Log rename activity
-        FileActivity.objects.create(
-            file=file_obj,
-            user=request.user,
-            action='renamed',
-            details={'old_name': old_name, 'new_name': new_name},
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
-        
         return Response(FileSerializer(file_obj, context={'request': request}).data)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -416,7 +467,7 @@ def rename_file(request, file_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def file_download(request, file_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'viewer')
     
     if file_obj.status != 'ready':
         return Response(
@@ -425,14 +476,9 @@ def file_download(request, file_id):
         )
     
     # Increment download count and log activity
+    file_obj._updated_by = request.user
+    file_obj._activity = {'action': 'downloaded', 'meta': request.META}
     file_obj.increment_download_count()
-    FileActivity.objects.create(
-        file=file_obj,
-        user=request.user,
-        action='downloaded',
-        ip_address=request.META.get('REMOTE_ADDR'),
-        user_agent=request.META.get('HTTP_USER_AGENT', '')
-    )
     
     return Response({
         'download_url': file_obj.get_signed_url(),
@@ -444,7 +490,7 @@ def file_download(request, file_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_share(request, file_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'owner')
     
     share_type = request.data.get('type', 'public')
     permission = request.data.get('permission', 'viewer')
@@ -522,7 +568,7 @@ def create_share(request, file_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_shares(request, file_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'owner')
     
     shares = Share.objects.filter(file=file_obj, is_active=True)
     invites = Invite.objects.filter(file=file_obj, is_accepted=False)
@@ -539,7 +585,7 @@ def list_shares(request, file_id):
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def revoke_share(request, file_id, share_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'owner')
     share = get_object_or_404(Share, id=share_id, file=file_obj, actor=request.user)
     
     share.is_active = False
@@ -550,7 +596,7 @@ def revoke_share(request, file_id, share_id):
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def cancel_invite(request, file_id, invite_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'owner')
     invite = get_object_or_404(Invite, id=invite_id, file=file_obj, actor=request.user)
     
     invite.delete()
@@ -599,42 +645,98 @@ def public_file_access(request, token):
         }
     })
 
+def _share_actor_ids(request):
+    """Users whose items appear in the shared-with-me listing"""
+    return set(Share.objects.filter(target_user=request.user, is_active=True).values_list('actor_id', flat=True))
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response('shared_with_me', related_users=_share_actor_ids)
 def shared_with_me(request):
-    """List files shared with the current user"""
-    shares = Share.objects.filter(
-        target_user=request.user,
-        is_active=True
-    ).select_related('file', 'folder', 'actor')
-    
-    shared_files = []
-    for share in shares:
-        item = share.get_item()
-        if item:
-            shared_files.append({
-                'share_id': str(share.id),
-                'item_type': 'file' if share.file else 'folder',
-                'item': {
-                    'id': str(item.id),
-                    'name': item.name,
-                    'size_bytes': getattr(item, 'size_bytes', None),
-                    'mime_type': getattr(item, 'mime_type', None),
-                    'created_at': item.created_at,
-                    'modified_at': getattr(item, 'modified_at', item.updated_at)
-                },
-                'permission': share.permission,
-                'shared_by': share.actor.email,
-                'shared_at': share.created_at
-            })
-    
-    return Response({'shared_files': shared_files})
+    """List files and folders shared with the current user, one cursor page at a time"""
+    item_type = request.query_params.get('type')  # file, folder
+    permission = request.query_params.get('permission')  # viewer, editor, owner
+    search_query = request.query_params.get('q', '').strip()
+    sort_by = shared_sort(request.query_params.get('sort_by', '-shared_at'))  # shared_at, -shared_at, name, -name
+    cursor = request.query_params.get('cursor')
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 100)), 500))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    shares = shared_items_queryset(request.user, item_type=item_type, permission=permission, query=search_query)
+    try:
+        page_query = apply_keyset(shares, sort_by, cursor)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    rows = list(page_query[:limit + 1])  # One extra to check if there are more
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    return Response({
+        'shared_files': [shared_item_row(row) for row in rows],
+        'has_more': has_more,
+        'next_cursor': encode_cursor(cursor_row(rows[-1]), sort_by) if has_more else None
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def shared_folder_contents(request, folder_id):
+    """Browse a folder shared with the current user, directly or through an ancestor"""
+    folder = get_object_or_404(Folder, id=folder_id)
+    permission = access_resolver.folder_permission(request.user, folder)
+    if permission is None:
+        return Response({'error': 'Folder not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    recursive = request.query_params.get('recursive') in ('1', 'true')
+    sort_by = request.query_params.get('sort_by', '-modified_at')
+    if sort_by not in [f'{prefix}{field}' for field in FILE_SORT_FIELDS for prefix in ('', '-')]:
+        sort_by = '-modified_at'
+    cursor = request.query_params.get('cursor')
+    try:
+        limit = page_limit(int(request.query_params.get('limit', 100)))
+        fields = parse_file_fields(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        page_query = apply_keyset(shared_folder_files(folder, recursive=recursive), sort_by, cursor)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    values = list(file_rows_queryset(page_query, fields, columns=(sort_by.lstrip('-'),))[:limit + 1])
+    last = cursor_row(values[limit - 1]) if len(values) > limit else None
+    
+    # Subfolders and breadcrumbs come with the first page
+    folders_data = breadcrumbs = None
+    if not cursor:
+        folders_data = [] if recursive else FolderSerializer(folder.subfolders.all(), many=True).data
+        breadcrumbs = _shared_breadcrumbs(request.user, folder)
+    
+    return Response({
+        'folder': {'id': str(folder.id), 'name': folder.name, 'permission': permission},
+        'breadcrumbs': breadcrumbs,
+        'folders': folders_data,
+        'files': list(build_file_rows(values[:limit], fields)),
+        'has_more': last is not None,
+        'next_cursor': encode_cursor(last, sort_by) if last is not None else None
+    })
+
+def _shared_breadcrumbs(user, folder):
+    """Trail from the topmost folder shared with the user down to `folder`"""
+    ancestor_ids = folder.ancestor_ids(include_self=True)
+    shared_ids = set(Share.objects.filter(
+        target_user=user, is_active=True, folder_id__in=ancestor_ids
+    ).values_list('folder_id', flat=True))
+    top = next((index for index, ancestor_id in enumerate(ancestor_ids) if ancestor_id in shared_ids), len(ancestor_ids) - 1)
+    names = dict(Folder.objects.filter(id__in=ancestor_ids[top:]).values_list('id', 'name'))
+    return [{'id': str(ancestor_id), 'name': names.get(ancestor_id)} for ancestor_id in ancestor_ids[top:]]
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def embed_code(request, file_id):
     """Generate embed code for a file"""
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'owner')
     
     # Get or create public share
     share = Share.objects.filter(
@@ -673,7 +775,7 @@ def embed_code(request, file_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def file_thumbnail(request, file_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'viewer')
     size = request.query_params.get('size', 'medium')
     
     if size not in ['small', 'medium', 'large']:
@@ -691,7 +793,7 @@ def file_thumbnail(request, file_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def file_preview(request, file_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'viewer')
     
     if not file_obj.can_preview:
         return Response({'error': 'Preview not available for this file type'}, status=status.HTTP_400_BAD_REQUEST)
@@ -713,7 +815,7 @@ def file_preview(request, file_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def regenerate_thumbnail(request, file_id):
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'editor')
     
     if not (file_obj.is_image or file_obj.is_video or file_obj.mime_type == 'application/pdf'):
         return Response({'error': 'Thumbnails not supported for this file type'}, status=status.HTTP_400_BAD_REQUEST)
@@ -739,51 +841,43 @@ def regenerate_thumbnail(request, file_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response('dashboard_data', per_day=True)
 def dashboard_data(request):
     """Get comprehensive dashboard data"""
     user = request.user
     
-    # Storage summary
-    files = File.objects.filter(owner=user, status='ready')
-    total_size = files.aggregate(total=models.Sum('size_bytes'))['total'] or 0
+    # Storage summary, read from the incrementally maintained rollup
+    stats = UserStats.objects.filter(user=user).first() or UserStats(user=user)
     quota = 10 * 1024 * 1024 * 1024  # 10GB
-    
-    # File type breakdown
-    file_types = {
-        'documents': files.filter(mime_type__in=['application/pdf', 'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']).aggregate(total=models.Sum('size_bytes'))['total'] or 0,
-        'images': files.filter(mime_type__startswith='image/').aggregate(total=models.Sum('size_bytes'))['total'] or 0,
-        'videos': files.filter(mime_type__startswith='video/').aggregate(total=models.Sum('size_bytes'))['total'] or 0,
-        'audio': files.filter(mime_type__startswith='audio/').aggregate(total=models.Sum('size_bytes'))['total'] or 0,
-        'other': 0
-    }
-    file_types['other'] = total_size - sum(file_types.values())
+    file_types = {category: getattr(stats, f'{category}_bytes') for category in TYPE_CATEGORIES}
     
     # Recent files (last 7 days)
     from datetime import timedelta
     week_ago = timezone.now() - timedelta(days=7)
-    recent_files = files.filter(created_at__gte=week_ago).order_by('-created_at')[:10]
+    files = File.objects.filter(owner=user, status='ready')
+    recent_files = file_listing_queryset(files.filter(created_at__gte=week_ago)).order_by('-created_at')[:10]
     
     # Recent activity
-    recent_activity = Activity.objects.filter(user=user).order_by('-timestamp')[:10]
-    
-    # Upload trends (last 30 days)
-    month_ago = timezone.now() - timedelta(days=30)
-    upload_trends = []
-    for i in range(30):
-        day = month_ago + timedelta(days=i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        count = files.filter(created_at__gte=day_start, created_at__lt=day_end).count()
-        upload_trends.append({
-            'date': day_start.strftime('%Y-%m-%d'),
-            'uploads': count
-        })
-    
-    # Folder stats
-    folders = Folder.objects.filter(owner=user)
+    recent_activity = Activity.objects.filter(user=user).select_related('user').order_by('-timestamp')[:10]
+    
+    # Upload trends (last 30 days, today included) from the daily buckets
+    today = timezone.localdate()
+    days = [today - timedelta(days=offset) for offset in range(29, -1, -1)]
+    buckets = {
+        row['day']: row for row in UserDailyStats.objects.filter(user=user, day__gte=days[0])
+        .values('day').annotate(uploads=models.Sum('uploads'), downloads=models.Sum('downloads'))
+    }
+    upload_trends = [
+        {'date': day.strftime('%Y-%m-%d'), 'uploads': buckets.get(day, {}).get('uploads', 0)}
+        for day in days
+    ]
+    last_week = [buckets.get(day, {}) for day in days[-7:]]
     
     # Share stats
-    shares = Share.objects.filter(actor=user, is_active=True)
+    shares = Share.objects.filter(actor=user, is_active=True).aggregate(
+        total=models.Count('id'),
+        this_week=models.Count('id', filter=models.Q(created_at__gte=week_ago))
+    )
     pending_shares = Invite.objects.filter(actor=user, is_accepted=False).count()
     
     # Integration stats
@@ -797,15 +891,15 @@ def dashboard_data(request):
     
     return Response({
         'storage': {
-            'used': total_size,
+            'used': stats.total_size_bytes,
             'quota': quota,
-            'percentage': (total_size / quota * 100) if quota > 0 else 0,
+            'percentage': (stats.total_size_bytes / quota * 100) if quota > 0 else 0,
             'file_types': file_types
         },
         'stats': {
-            'total_files': files.count(),
-            'total_folders': folders.count(),
-            'total_shares': shares.count(),
+            'total_files': stats.files_count,
+            'total_folders': stats.folders_count,
+            'total_shares': shares['total'],
             'pending_shares': pending_shares,
             'active_tokens': active_tokens,
             'active_webhooks': active_webhooks
@@ -814,9 +908,9 @@ def dashboard_data(request):
         'recent_activity': ActivitySerializer(recent_activity, many=True).data,
         'upload_trends': upload_trends,
         'quick_stats': {
-            'files_this_week': files.filter(created_at__gte=week_ago).count(),
-            'downloads_this_week': files.filter(last_accessed__gte=week_ago).aggregate(total=models.Sum('download_count'))['total'] or 0,
-            'shares_this_week': shares.filter(created_at__gte=week_ago).count()
+            'files_this_week': sum(bucket.get('uploads', 0) for bucket in last_week),
+            'downloads_this_week': sum(bucket.get('downloads', 0) for bucket in last_week),
+            'shares_this_week': shares['this_week']
         }
     })
 
@@ -824,7 +918,7 @@ def dashboard_data(request):
 @permission_classes([IsAuthenticated])
 def file_versions(request, file_id):
     """Get all versions of a file"""
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'viewer')
     versions = file_obj.versions.all()
     serializer = FileVersionSerializer(versions, many=True)
     return Response(serializer.data)
@@ -833,7 +927,7 @@ def file_versions(request, file_id):
 @permission_classes([IsAuthenticated])
 def restore_file_version(request, file_id, version_id):
     """Restore file to a specific version"""
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
+    file_obj = get_file_or_404(request.user, file_id, 'editor')
     
     success = file_obj.restore_version(version_id, request.user)
     if success:
@@ -847,38 +941,95 @@ def restore_file_version(request, file_id, version_id):
             status=status.HTTP_404_NOT_FOUND
         )
 
+def _activity_response(request, activities):
+    """Newest-first keyset page of activity, limited to ?since= and ?until= when given"""
+    params = request.query_params
+    try:
+        limit = max(1, min(int(params.get('limit', 50)), 200))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    bounds = {}
+    for name in ('since', 'until'):
+        if params.get(name):
+            bounds[name] = parse_datetime(params[name])
+            if bounds[name] is None:
+                return Response({'error': f'{name} must be an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(bounds[name]):
+                bounds[name] = timezone.make_aware(bounds[name])
+    try:
+        entries, next_cursor = activity_page(activities, params.get('cursor'), limit=limit, **bounds)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'activities': ActivitySerializer(entries, many=True).data,
+        'has_more': next_cursor is not None,
+        'next_cursor': next_cursor
+    })
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def file_activity(request, file_id):
     """Get activity log for a specific file"""
-    file_obj = get_object_or_404(File, id=file_id, owner=request.user)
-    
-    # Get activities for this specific file
-    activities = Activity.objects.filter(
-        object_type='file',
-        object_id=file_obj.id
-    ).order_by('-timestamp')[:50]
-    
-    serializer = ActivitySerializer(activities, many=True)
-    return Response(serializer.data)
+    file_obj = get_file_or_404(request.user, file_id, 'viewer')
+    return _activity_response(request, Activity.objects.filter(object_type='file', object_id=file_obj.id))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_activity(request):
     """Get activity log for the current user"""
-    # Get query parameters
-    object_type = request.query_params.get('type')  # file, folder, share, token, webhook
-    limit = int(request.query_params.get('limit', 50))
-    
-    # Base queryset
+    object_type = request.query_params.get('type')  # file, folder, share, token, webhook, batch
     activities = Activity.objects.filter(user=request.user)
-    
-    # Apply type filter
     if object_type:
         activities = activities.filter(object_type=object_type)
+    return _activity_response(request, activities)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search(request):
+    """Ranked prefix search over the current user's files and folders"""
+    query = request.query_params.get('q', '').strip()
+    folder_id = request.query_params.get('folder') or None
+    file_type = request.query_params.get('type') or None  # image, video, document, other
+    
+    if not query:
+        return Response({'error': 'Query parameter q is required'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Limit and order
-    activities = activities.order_by('-timestamp')[:limit]
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 50)), 200))
+        files_found, folders_found = search_index.search(
+            request.user, query, folder_id=folder_id, file_type=file_type, limit=limit
+        )
+    except ValueError:
+        return Response({'error': 'Invalid folder id or limit'}, status=status.HTTP_400_BAD_REQUEST)
     
-    serializer = ActivitySerializer(activities, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    return Response({
+        'query': query,
+        'files': FileSerializer(files_found, many=True, context={'request': request}).data,
+        'folders': FolderSerializer(folders_found, many=True).data
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def changes(request):
+    """Delta sync: the current user's file, folder and share changes after a cursor"""
+    since = request.query_params.get('since')
+    try:
+        since = int(since) if since not in (None, '') else None
+        limit = min(int(request.query_params.get('limit', 500)), 1000)
+    except ValueError:
+        return Response({'error': 'since and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1 or (since is not None and since < 0):
+        return Response({'error': 'since and limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(change_journal.changes_since(request.user, since, limit))
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """Operational counters: response cache hit ratios and scrubber progress"""
+    return Response({
+        'response_cache': response_cache_stats(),
+        'scrub': metrics.get_metrics([
+            'scrub.passes_completed', 'scrub.files_verified', 'scrub.files_failed', 'scrub.files_skipped', 'scrub.bytes_read'
+        ])
+    })
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='webhookdelivery',
+            index=models.Index(fields=['webhook', '-created_at'], name='delivery_webhook_created_idx'),
+        ),
+    ]
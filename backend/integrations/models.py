@@ -4,6 +4,7 @@ import secrets
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from files.cache_utils import bump_generation
 
 User = get_user_model()
 
@@ -53,6 +54,17 @@ class ApiToken(models.Model):
         self.usage_count += 1
         self.last_used_at = timezone.now()
         self.save(update_fields=['usage_count', 'last_used_at'])
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Active tokens are counted on the cached dashboard; usage bookkeeping is not shown there
+        if not set(kwargs.get('update_fields') or ['*']) <= {'usage_count', 'last_used_at'}:
+            bump_generation(self.user_id)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_generation(self.user_id)
+        return result
 
 class Webhook(models.Model):
     EVENT_CHOICES = [
@@ -61,6 +73,7 @@ class Webhook(models.Model):
         ('share.created', 'Share Created'),
         ('file.updated', 'File Updated'),
         ('folder.created', 'Folder Created'),
+        ('folder.deleted', 'Folder Deleted'),
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -82,6 +95,12 @@ class Webhook(models.Model):
         if not self.secret:
             self.secret = secrets.token_urlsafe(32)
         super().save(*args, **kwargs)
+        bump_generation(self.user_id)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_generation(self.user_id)
+        return result
 
 class WebhookDelivery(models.Model):
     STATUS_CHOICES = [
@@ -105,6 +124,9 @@ class WebhookDelivery(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['webhook', '-created_at'], name='delivery_webhook_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.webhook.url} - {self.event} - {self.status}"
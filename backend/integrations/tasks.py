@@ -67,11 +67,12 @@ def send_webhook(webhook_id, event, payload):
 
 def trigger_webhook_event(user, event, data):
     """Trigger webhook event for all user's webhooks subscribed to this event"""
-    webhooks = Webhook.objects.filter(
-        user=user,
-        is_active=True,
-        events__contains=[event]
-    )
+    # Match subscribed events in Python: JSONField `contains` lookups are not
+    # supported on SQLite, and a user only has a handful of webhooks
+    webhooks = [
+        webhook for webhook in Webhook.objects.filter(user=user, is_active=True)
+        if event in (webhook.events or [])
+    ]
     
     payload = {
         'event': event,
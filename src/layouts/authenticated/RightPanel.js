@@ -26,7 +26,7 @@ const RightPanel = ({ activeTab }) => {
     queryFn: async () => {
       try {
         const response = await api.get('/activity/?limit=5');
-        return response.data.map(activity => ({
+        return response.data.activities.map(activity => ({
           action: activity.action,
           file: activity.object_name,
           time: formatDate(activity.timestamp),
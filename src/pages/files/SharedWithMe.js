@@ -5,7 +5,7 @@ import {
   FileText, Image, Video, Music, Folder,
   Calendar, User
 } from 'lucide-react';
-import { useQuery } from '@tanstack/react-query';
+import { useInfiniteQuery } from '@tanstack/react-query';
 import Button from '../../components/ui/Button';
 import FileThumbnail from '../../components/file-manager/FileThumbnail';
 import FilePreviewOverlay from '../../components/file-manager/FilePreviewOverlay';
@@ -17,17 +17,19 @@ const SharedWithMe = () => {
   const [filterBy, setFilterBy] = useState('all');
   const [previewFile, setPreviewFile] = useState(null);
 
-  // Fetch shared files
-  const { data: sharedData, isLoading } = useQuery({
+  // Fetch shared files, one cursor page at a time
+  const { data: sharedData, isLoading, hasNextPage, fetchNextPage, isFetchingNextPage } = useInfiniteQuery({
     queryKey: ['shared-with-me'],
-    queryFn: async () => {
-      const response = await api.get('/shared-with-me/');
+    queryFn: async ({ pageParam }) => {
+      const response = await api.get('/shared-with-me/', { params: pageParam ? { cursor: pageParam } : {} });
       return response.data;
     },
+    initialPageParam: null,
+    getNextPageParam: (lastPage) => lastPage.next_cursor || undefined,
     refetchInterval: 30000 // Refresh every 30 seconds
   });
 
-  const sharedFiles = sharedData?.shared_files || [];
+  const sharedFiles = sharedData?.pages.flatMap(page => page.shared_files) || [];
 
   // Filter shared files
   const filteredFiles = sharedFiles.filter(item => {
@@ -238,6 +240,14 @@ const SharedWithMe = () => {
         </div>
       )}
 
+      {hasNextPage && (
+        <div className="flex justify-center">
+          <Button variant="ghost" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+            {isFetchingNextPage ? 'Loading...' : 'Load more'}
+          </Button>
+        </div>
+      )}
+
       {/* File Preview Overlay */}
       <FilePreviewOverlay
         fileId={previewFile}
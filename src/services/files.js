@@ -70,11 +70,11 @@ export const filesService = {
   // Activity
   async getFileActivity(fileId) {
     const response = await api.get(`/files/${fileId}/activity/`);
-    return response.data;
+    return response.data.activities;
   },
 
   async getUserActivity(params = {}) {
     const response = await api.get('/activity/', { params });
-    return response.data;
+    return response.data.activities;
   }
 };
\ No newline at end of file